@@ -9,6 +9,7 @@ import base64
 from besspin.base.utils.misc import *
 from importlib.machinery import SourceFileLoader
 import besspin.cwesEvaluation.scoreTests
+from besspin.cwesEvaluation.utils.testsIndex import compileTestsIndex
 SCORES = besspin.cwesEvaluation.scoreTests.SCORES
 
 COMMON_SECTIONS = ['functionality', 'common', 'build']
@@ -463,6 +464,7 @@ def loadSecurityEvaluationConfiguration (xConfig,configData):
         # Load custom dev options (setupEnv.json)
         setupEnvData = safeLoadJsonFile(os.path.join(getSetting('repoDir'),'besspin','cwesEvaluation',vulClass,'setupEnv.json'))
         loadConfigSection(None,None,setupEnvData,vulClass,setup=True,setSettingsToSectDict=vulClass)
+        compileTestsIndex(vulClass)
 
     # Load custom scoring options if enabled
     if (isEnabled('useCustomScoring')):
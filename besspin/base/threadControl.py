@@ -4,25 +4,38 @@ This has the functions needed for thread control
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # """
 
 from besspin.base.utils.misc import *
-import threading
+import threading, contextlib
+
+# How finely the JTAG operations are serialized (see <ResourceScheduler>)
+JTAG_SCHEDULING_SCOPES = ['global', 'hub', 'adapter']
 
 @decorate.debugWrap
 def createBesspinLocks():
     # Create a network lock to protect network operations while multithreading
     setSetting('networkLock',threading.Lock())
-    # Create the locks needed for vcu118 board(s)
+    # Create the scheduler of the JTAG operations of the fpga board(s)
     """
-    For VCU118, we're using a conservative approach for the sake of robustness;
-    The following operations are all protected by a single lock (openocdLock):
-    - clear flash
-    - program bitfile
-    - start an openocd process + gdb setup and connect
+    The following operations are scheduled by the jtagScheduler:
+    - clear flash + program bitfile: exclusive, since Vivado's hw_server enumerates all the cables.
+    - start an openocd process, then gdb setup and connect: serialized only per JTAG resource. The
+      resource is the USB adapter, its hub, or a single global one, according to <jtagSchedulingScope>.
+      It is not held in between, while the UART is set up, since an exclusive operation waiting on
+      it would hold all the other resources back. The UART search holds it for its smoke program.
     """
-    setSetting('openocdLock',threading.Lock())
+    if (getSetting('jtagSchedulingScope') not in JTAG_SCHEDULING_SCOPES):
+        logAndExit(f"createBesspinLocks: <jtagSchedulingScope> has to be one of {JTAG_SCHEDULING_SCOPES}.",
+            exitCode=EXIT.Configuration)
+    setSetting('jtagScheduler',ResourceScheduler('jtag'))
+    # The enumeration of the uart devices of the vcu118 boards is done once, by the first target
+    setSetting('vcu118UartLock',threading.Lock())
     # We also need a lock for TFTP
     setSetting('tftpLock',threading.Lock())
     # Create a lock for using the FreeRTOS submodule directory or FreeRTOS general settings
     setSetting('FreeRTOSLock',threading.Lock())
+    # The budget of the CPU-heavy stages of the targets' preparation (builds, images, transfers)
+    budgetInfo = getSetting('launchBudgetInfo')
+    capacity = budgetInfo['capacity'] if (budgetInfo['capacity'] > 0) else (os.cpu_count() or 1)
+    setSetting('launchBudget',StageBudget(capacity,budgetInfo['stageCosts']))
     # When programming flash, we need to wait for all targets before power cycling
     if (isEqSetting('mode','cyberPhys')):
         setSetting('vcu118FlashCounter',Counter(getSetting("nVcu118Targets")))
@@ -63,3 +76,126 @@ class Counter:
     def userIsReady(self):
         self._event.set()
 
+
+class ResourceScheduler:
+    """
+    Serializes the operations that use the same resource, and lets the operations on different
+    resources run concurrently. An exclusive operation (resource=None) waits for all the running
+    ones, and holds the others back while it runs (or waits to run).
+    Acquiring and releasing can happen in different functions (e.g. on retries), so the scheduler
+    is not owned by a thread, but an owner cannot request while it holds. The wait and hold times are
+    recorded per owner.
+    """
+    def __init__(self,name):
+        self.name = name
+        self._cond = threading.Condition()
+        self._held = dict() # resource -> (owner, operation, tRequest, tAcquired)
+        self._nExclusiveWaiting = 0
+        self._metrics = dict() # owner -> [(operation, resource, waitTime, holdTime)]
+
+    def acquire(self,resource=None,owner=None,operation='unspecified'):
+        tRequest = time.time()
+        with self._cond:
+            # With the exclusive operations preferred, an owner waiting while holding would wait forever
+            heldByOwner = [heldResource for heldResource, held in self._held.items() if (held[0] == owner)]
+            if (heldByOwner):
+                logAndExit(f"{self.name}Scheduler: <{owner}> requests <{resource}> while holding {heldByOwner}.",
+                    exitCode=EXIT.Dev_Bug)
+            if (resource is None):
+                self._nExclusiveWaiting += 1
+                self._cond.wait_for(lambda: (len(self._held) == 0))
+                self._nExclusiveWaiting -= 1
+            else:
+                self._cond.wait_for(lambda: ((None not in self._held) and (self._nExclusiveWaiting == 0)
+                                                and (resource not in self._held)))
+            self._held[resource] = (owner, operation, tRequest, time.time())
+        logging.debug(f"{self.name}Scheduler: <{owner}> acquired <{resource}> for <{operation}> "
+            f"after {self._held[resource][3]-tRequest:.2f}s.")
+
+    def release(self,resource=None):
+        with self._cond:
+            if (resource not in self._held):
+                logAndExit(f"{self.name}Scheduler: Releasing <{resource}> which is not held.",exitCode=EXIT.Dev_Bug)
+            owner, operation, tRequest, tAcquired = self._held.pop(resource)
+            self._metrics.setdefault(owner,[]).append((operation, resource, tAcquired-tRequest, time.time()-tAcquired))
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def hold(self,resource=None,owner=None,operation='unspecified'):
+        self.acquire(resource,owner=owner,operation=operation)
+        try:
+            yield
+        finally:
+            self.release(resource)
+
+    def isHeld(self,resource=None,owner=None):
+        """ whether <resource> is held (by <owner> if given) """
+        with self._cond:
+            return ((resource in self._held) and ((owner is None) or (self._held[resource][0] == owner)))
+
+    def getMetrics(self,owner=None):
+        """ returns {operation : {'count', 'waitTime', 'holdTime'}} of <owner> (the totals in seconds) """
+        summary = dict()
+        with self._cond:
+            for operation, resource, waitTime, holdTime in self._metrics.get(owner,[]):
+                opSummary = summary.setdefault(operation, {'count' : 0, 'waitTime' : 0, 'holdTime' : 0})
+                opSummary['count'] += 1
+                opSummary['waitTime'] += waitTime
+                opSummary['holdTime'] += holdTime
+        return summary
+
+    def logMetrics(self,owner=None,ownerInfo=''):
+        for operation, opSummary in self.getMetrics(owner).items():
+            printAndLog(f"{ownerInfo}{self.name}Scheduler: <{operation}> x{opSummary['count']}: "
+                f"waited {opSummary['waitTime']:.2f}s, held {opSummary['holdTime']:.2f}s.",doPrint=False)
+
+
+class StageBudget:
+    """
+    Gates the expensive stages of the targets' bring-up with a shared budget of units (CPU slots),
+    and records the timeline of all the stages per owner (target). A stage with a cost of 0 is only
+    recorded. A stage costing more than the capacity takes the whole budget.
+    """
+    def __init__(self,capacity,stageCosts):
+        self.capacity = capacity
+        self.stageCosts = stageCosts
+        self._cond = threading.Condition()
+        self._inUse = 0
+        self._tStart = time.time()
+        self._timeline = dict() # owner -> [{stage, cost, tRequest, tStart, tEnd}]
+
+    def getCost(self,stage):
+        return min(self.stageCosts.get(stage,0), self.capacity)
+
+    @contextlib.contextmanager
+    def stage(self,stage,owner=None):
+        cost = self.getCost(stage)
+        tRequest = time.time()
+        with self._cond:
+            self._cond.wait_for(lambda: ((self._inUse + cost) <= self.capacity))
+            self._inUse += cost
+        tStart = time.time()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._inUse -= cost
+                self._timeline.setdefault(owner,[]).append({'stage' : stage, 'cost' : cost,
+                    'tRequest' : tRequest - self._tStart, 'tStart' : tStart - self._tStart, 'tEnd' : time.time() - self._tStart})
+                self._cond.notify_all()
+        logging.debug(f"stageBudget: <{owner}> ran <{stage}> (cost {cost}) in {time.time()-tStart:.2f}s "
+            f"after waiting {tStart-tRequest:.2f}s.")
+
+    def getTimeline(self):
+        """ returns {owner : [stages]}, the times being in seconds since the budget's creation """
+        with self._cond:
+            return {str(owner) : list(stages) for owner, stages in self._timeline.items()}
+
+    def logTimeline(self):
+        with self._cond:
+            timeline = {owner : list(stages) for owner, stages in self._timeline.items()}
+        for owner, stages in timeline.items():
+            ownerInfo = f"<target{owner}>: " if (owner) else ''
+            for xStage in sorted(stages, key=lambda xStage: xStage['tStart']):
+                printAndLog(f"{ownerInfo}stageBudget: <{xStage['stage']}> [{xStage['tStart']:.2f}s -> "
+                    f"{xStage['tEnd']:.2f}s], waited {xStage['tStart']-xStage['tRequest']:.2f}s.",doPrint=False)
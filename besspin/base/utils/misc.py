@@ -411,6 +411,32 @@ def safeDumpJsonFile(jsonData, jsonFile, indent=None):
                    exc=exc,
                    exitCode=EXIT.Files_and_paths)
 
+def atomicDumpJsonFile(jsonData, jsonFile, indent=None):
+    """ dumps to a temporary sibling then renames, so concurrent readers never see a partial file """
+    tmpFile = f"{jsonFile}.{os.getpid()}.tmp"
+    try:
+        with open(tmpFile, 'w') as fJson:
+            json.dump(jsonData, fJson, indent=indent)
+        os.replace(tmpFile, jsonFile)
+    except Exception as exc:
+        logAndExit(f"Failed to atomically dump json to file <{jsonFile}>",
+                   exc=exc,
+                   exitCode=EXIT.Files_and_paths)
+
+@decorate.debugWrap
+def getCacheDir (subDir):
+    """ returns the persistent cache directory <besspinCacheDir>/<subDir>, which is shared across runs """
+    cacheDir = os.path.join(os.path.expanduser(getSetting('besspinCacheDir')), subDir)
+    try:
+        os.makedirs(cacheDir, exist_ok=True)
+    except Exception as exc:
+        logAndExit (f"Failed to create the cache directory <{cacheDir}>.",exc=exc,exitCode=EXIT.Files_and_paths)
+    return cacheDir
+
+def hashJsonData (jsonData):
+    """ a stable digest of json-serializable data (dict keys are sorted) """
+    return hashlib.sha256(json.dumps(jsonData, sort_keys=True).encode('utf-8')).hexdigest()
+
 def safeLoadIniFile (iniFile):
     fConfig = ftOpenFile(iniFile, 'r')
     xConfig = configparser.ConfigParser()
@@ -675,6 +701,11 @@ def zstdDecompress(inputFilePath, outputFilePath):
 def collectRemoteLogging (logAndExitFunc,getSettingFunc,sudoShellCommandFunc):
     printAndLog ("Fetching remote logs if there are any.")
     ipTarget = getSettingFunc(f"awsf1IpTarget")
+    # The built-in collector already writes to the artifacts -- <_settings> since getSettingFunc may exit
+    syslogCollector = _settings.get('syslogCollectorObj')
+    if ((syslogCollector is not None) and syslogCollector.hasSource(ipTarget)):
+        syslogCollector.stop()
+        return
     # cp the directory for non-fresh instances
     rsyslogsPath = os.path.join(getSettingFunc('extraArtifactsPath'),f"rsyslogs_{ipTarget}")
     sudoShellCommandFunc(['cp','-r',f'/var/log/{ipTarget}',rsyslogsPath],check=False)
@@ -5,6 +5,7 @@ scoring function for PPAC
 from besspin.base.utils.misc import *
 from besspin.cwesEvaluation.utils.scoringAux import defaultSelfAssessmentScoreAllTests, doKeywordsExistInText
 from besspin.cwesEvaluation.scoreTests import SCORES, adjustToCustomScore
+from besspin.cwesEvaluation.utils.testsIndex import getTestInfo
 
 VULCLASS = "PPAC"
 
@@ -53,6 +54,6 @@ def scoreAllTests(logs):
             f"{testName.replace('_','-').upper()}", 
             adjustedScore,
             adjustedScore.value,
-            getSettingDict(VULCLASS, ["testsInfo", testName, "cweText"])])
+            getTestInfo(VULCLASS, testName).cweText])
 
     return ret
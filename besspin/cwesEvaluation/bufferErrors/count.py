@@ -138,11 +138,14 @@ def tabulate(logs,lookfor):
         writeCSV(rows)
     return rows
 
+def getCsvPath():
+    """ <scoresCsvDir> if set (e.g. when re-scoring archived runs), else the bufferErrors logs directory """
+    if (doesSettingExist('scoresCsvDir')):
+        return os.path.join(getSetting('scoresCsvDir'), 'bufferErrors.csv')
+    return os.path.join(getSetting('cwesEvaluationLogs'), 'bufferErrors', 'bufferErrors.csv')
+
 def writeCSV(rows):
-    csvOut = ftOpenFile(os.path.join(getSetting('cwesEvaluationLogs'),
-                                     'bufferErrors',
-                                     'bufferErrors.csv'),
-                        'w')
+    csvOut = ftOpenFile(getCsvPath(), 'w')
     # this works since Py3 dicts preserve insertion order
     csvOut.write(','.join(rows[0].keys()) + '\n')
     for row in rows:
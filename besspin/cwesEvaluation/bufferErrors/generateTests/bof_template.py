@@ -1,3 +1,4 @@
+import collections
 import random
 import re
 import string
@@ -166,6 +167,55 @@ def pickDataRange(attr, bound):
         return Range(sz[0], bound)
     return Range(sz[0], sz[1])
 
+###############################################################################
+####  Template rendering
+###############################################################################
+
+_parsedTemplate = None
+
+def getParsedTemplate():
+    """
+    Returns bof_template.c parsed once into a list of
+    (literal text, field name, format spec, conversion) tuples.  The template
+    is shared by all the test generators.
+    """
+    global _parsedTemplate
+    if _parsedTemplate is None:
+        templateFile = ftOpenFile(os.path.join(getSetting("repoDir"),
+                                               "besspin",
+                                               "cwesEvaluation",
+                                               "bufferErrors",
+                                               "generateTests",
+                                               "bof_template.c"),
+                                  "r")
+        try:
+            _parsedTemplate = list(string.Formatter().parse(templateFile.read()))
+        except ValueError as exc:
+            logAndExit("<getParsedTemplate> Malformed <bof_template.c>",
+                       exitCode=EXIT.Dev_Bug,
+                       exc=exc)
+        templateFile.close()
+    return _parsedTemplate
+
+def renderTemplate(parsedTemplate, values):
+    """
+    Equivalent to `template.format(**values)` for a template that was parsed
+    with `getParsedTemplate`.
+    """
+    chunks = []
+    for literal, field, spec, conversion in parsedTemplate:
+        chunks.append(literal)
+        if field is not None:
+            val = values[field]
+            if conversion == 'r':
+                val = repr(val)
+            elif conversion == 's':
+                val = str(val)
+            elif conversion == 'a':
+                val = ascii(val)
+            chunks.append(format(val, spec))
+    return "".join(chunks)
+
 ###############################################################################
 ####  Test Generation
 ###############################################################################
@@ -195,15 +245,9 @@ class BofTestGen:
         self.bof_instance = bof_instance
         # The template file is essentially a long python f-string. This class
         # will fill in the values of this f-string using self.PARAMS
-        templateFile = ftOpenFile(os.path.join(getSetting("repoDir"),
-                                               "besspin",
-                                               "cwesEvaluation",
-                                               "bufferErrors",
-                                               "generateTests",
-                                               "bof_template.c"),
-                                  "r")
-        self.template = templateFile.read()
-        templateFile.close()
+        self.template = getParsedTemplate()
+        # The order in which self.PARAMS are resolved. See `compilePlan`.
+        self.plan = None
 
         # TODO: Configure these based on the input bof_instance
         # TODO: Add a 'machine' parameter to control size of memory
@@ -506,28 +550,56 @@ class BofTestGen:
                                  Choice('DYNAMIC_ALLOC'))
         }
 
-    def genInstance(self, rnd, drop=False):
-        ## This is a little complicated, but since the number of params is low
-        ## we can be less than smart about it.
-
-        ## What we need to do is iteratively pick values for each param. Some
-        ## params may have dependencies (i.e. idx0 depends on N), so we'll
-        ## un-cleverly try to do our best by looping through the params until
-        ## we're all done. That way I don't need to remember how to do a topological sort :)
+    def compilePlan(self, rnd):
+        """
+        Resolves every parameter once, and returns the values along with the
+        order in which they were resolved.
+
+        Some params have dependencies (i.e. idx0 depends on N), and a
+        dependency that is not bound yet makes `getRand` return None without
+        consuming any randomness.  The params are therefore tried in order,
+        and the ones that are not ready are retried after the others.  The
+        resolution order only depends on the structure of self.PARAMS, so
+        later instances follow the recorded order in a single pass, and draw
+        the same values as this loop would have.
+
+        A full round over the pending params without any progress means that
+        the dependencies are cyclic.
+        """
         i = {}
-        queue = list(self.PARAMS.keys())
-        lastlen = 0
-        while len(queue) > 0:
-            k     = queue[0]
-            queue = queue[1:]
-            v     = self.PARAMS[k].getRand(rnd, env=i)
+        plan = []
+        queue = collections.deque(self.PARAMS.keys())
+        nStuck = 0
+        while queue:
+            k = queue.popleft()
+            v = self.PARAMS[k].getRand(rnd, env=i)
             if v is not None:
                 i[k] = v
+                plan.append(k)
+                nStuck = 0
             else:
                 queue.append(k)
+                nStuck += 1
+                if nStuck >= len(queue):
+                    logAndExit("<BofTestGen> Cyclic or unbound parameter "
+                               f"dependencies among <{', '.join(queue)}>",
+                               exitCode=EXIT.Dev_Bug)
+        return plan, i
+
+    def genInstance(self, rnd, drop=False):
+        if self.plan is None:
+            self.plan, i = self.compilePlan(rnd)
+        else:
+            i = {}
+            for k in self.plan:
+                v = self.PARAMS[k].getRand(rnd, env=i)
+                if v is None:
+                    logAndExit(f"<BofTestGen> Parameter <{k}> is not ready "
+                               "in the compiled resolution plan",
+                               exitCode=EXIT.Dev_Bug)
+                i[k] = v
         i['tp']     = json.dumps(i)
         i['bf_bof'] = json.dumps(vars(self.bof_instance))
 
         if not drop:
-            return self.template.format(**i)
-
+            return renderTemplate(self.template, i)
@@ -7,6 +7,7 @@ import besspin.cwesEvaluation.utils.featureModelUtil as featureModelUtil
 from besspin.cwesEvaluation.bufferErrors.generateTests.bof_template import *
 from besspin.cwesEvaluation.bufferErrors.generateTests.bof_instance import *
 from besspin.cwesEvaluation.bufferErrors.generateTests.instanceSelector import *
+import besspin.cwesEvaluation.bufferErrors.generateTests.instanceCache as instanceCache
 
 def parseBytes(sz):
     try:
@@ -22,6 +23,21 @@ def parseBytes(sz):
                    exc=exc,
                    exitCode=EXIT.Configuration)
 
+class LazyBofTestGen:
+    """
+    Builds the BofTestGen of an instance when it is first used, since only a
+    fraction of the instances are selected.  Building a BofTestGen does not
+    draw any random values.
+    """
+    def __init__(self, instance, heapSize, stackSize):
+        self.args = (instance, heapSize, stackSize)
+        self.tg = None
+
+    def genInstance(self, rnd, drop=False):
+        if self.tg is None:
+            self.tg = BofTestGen(*self.args)
+        return self.tg.genInstance(rnd, drop=drop)
+
 def generateTests(outdir):
     # Check that nTests is large enough to avoid score instability
     minNTests = 60 if isEqSetting('osImage', 'FreeRTOS') else 150
@@ -47,35 +63,44 @@ def generateTests(outdir):
 
     # Prune out other vulnerability classes
     model = featureModelUtil.splitFM(model, ["BufferErrors_Test"])[0]
+    # Make sure that the buffer error test is actually enabled
+    model = featureModelUtil.addConstraints(model, ["BufferErrors_Test"])
     cachedInstanceFile = getSettingDict('bufferErrors','cachedInstancePath')
-    
-    # Whether to enumerate or not
-    if (getSettingDict('bufferErrors', 'useCustomErrorModel')): #custom model, has to compute
-        doEnumerateFM = True
+
+    # The host-wide cache is indexed by the sliced model itself (custom models included)
+    slicedModelHash = hashJsonData(model)
+    enumeratedFM = instanceCache.loadInstances(slicedModelHash)
+    if (enumeratedFM is not None):
+        printAndLog(f"<generateTests> Loaded {len(enumeratedFM)} cached instances "
+                    f"of <{slicedModelHash}>")
     else:
-        computedModelHash = computeMd5ForFile(modelPath)
-        if (computedModelHash != getSettingDict('bufferErrors',"modelHash")):
-            warnAndLog (f"BOF:generateTests: The saved hash in {os.path.join(bufferErrorsDir,'setupEnv.json')}"
-                f" does not match the computed value <{computedModelHash}>. Please consider committing any"
-                f" model changes accordingly.")
+        # Whether the instances committed to the repo can be used
+        if (getSettingDict('bufferErrors', 'useCustomErrorModel')): #custom model, has to compute
             doEnumerateFM = True
         else:
-            doEnumerateFM = False
+            computedModelHash = computeMd5ForFile(modelPath)
+            if (computedModelHash != getSettingDict('bufferErrors',"modelHash")):
+                warnAndLog (f"BOF:generateTests: The saved hash in {os.path.join(bufferErrorsDir,'setupEnv.json')}"
+                    f" does not match the computed value <{computedModelHash}>. Please consider committing any"
+                    f" model changes accordingly.")
+                doEnumerateFM = True
+            else:
+                doEnumerateFM = False
 
-    if (not doEnumerateFM):
-        printAndLog("<generateTests> Loading cached instances "
-                    f"<{cachedInstanceFile}>")
-        enumeratedFM = safeLoadJsonFile(cachedInstanceFile)
-    else:
-        printAndLog(f"<generateTests> Sliced model {modelPath} with BufferErrors_Test")
-        printAndLog("<generateTests> Enumerating instances...(this can take a while)")
-        # Make sure that the buffer error test is actually enabled
-        model = featureModelUtil.addConstraints(model, ["BufferErrors_Test"])
-        enumeratedFM = featureModelUtil.enumerateFM(model)
-        if not getSettingDict('bufferErrors', 'useCustomErrorModel'):
-            printAndLog(f"<generateTests> Caching instances to <{cachedInstanceFile}>")
-            safeDumpJsonFile(enumeratedFM, cachedInstanceFile, indent=4)
-        printAndLog("<generateTests> Done generating instances")
+        if (not doEnumerateFM):
+            printAndLog("<generateTests> Loading cached instances "
+                        f"<{cachedInstanceFile}>")
+            enumeratedFM = safeLoadJsonFile(cachedInstanceFile)
+        else:
+            printAndLog(f"<generateTests> Sliced model {modelPath} with BufferErrors_Test")
+            printAndLog("<generateTests> Enumerating instances...(this can take a while)")
+            enumeratedFM = featureModelUtil.enumerateFM(model)
+            if not getSettingDict('bufferErrors', 'useCustomErrorModel'):
+                printAndLog(f"<generateTests> Caching instances to <{cachedInstanceFile}>")
+                safeDumpJsonFile(enumeratedFM, cachedInstanceFile, indent=4)
+            printAndLog("<generateTests> Done generating instances")
+        if enumeratedFM:
+            instanceCache.storeInstances(slicedModelHash, enumeratedFM)
     if not enumeratedFM:
         logAndExit(f'<generateTests> Error model <{modelPath}> contains '
                    'unsatisfiable constraints.',
@@ -88,7 +113,7 @@ def generateTests(outdir):
             random.randrange(sys.maxsize))
     printAndLog(f"<generateTests> Using seed {seed}")
 
-    tgs = [ (i, BofTestGen(i, heapSize, stackSize)) for i in instances ]
+    tgs = [ (i, LazyBofTestGen(i, heapSize, stackSize)) for i in instances ]
     rnd = random.Random(seed)
 
     printAndLog("<generateTests> Generating "
@@ -110,5 +135,6 @@ def generateTests(outdir):
         sys.stdout.write("\033[K")
         outfd.write(selector.chooseInstance().genInstance(rnd, drop=False))
         outfd.close()
+    selector.reportStats()
     printAndLog("<generateTests> Done generating tests")
 
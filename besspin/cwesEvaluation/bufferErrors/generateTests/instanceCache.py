@@ -0,0 +1,87 @@
+import sqlite3
+import time
+
+from besspin.base.utils.misc import *
+
+"""
+Persistent store of the enumerated buffer errors model instances.
+
+The store is a single SQLite database under <besspinCacheDir>/bufferErrors, shared
+by every run on the host. Each model is indexed by the hash of its sliced fmjson, and
+its instances are rows of their own, so a run only reads the model it needs. Writers
+replace a model in one transaction, and the WAL journal lets concurrent generators
+read while another one writes. The least recently used models are evicted beyond
+<instanceCacheMaxModels>. Bump CACHE_VERSION when the stored format changes.
+"""
+CACHE_VERSION = 1
+
+def openInstanceCache():
+    dbPath = os.path.join(getCacheDir('bufferErrors'), 'instances.sqlite')
+    try:
+        conn = sqlite3.connect(dbPath, timeout=120, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS models ("
+                     "modelHash TEXT PRIMARY KEY, version INTEGER, "
+                     "nInstances INTEGER, lastUsed REAL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS instances ("
+                     "modelHash TEXT, idx INTEGER, config TEXT, "
+                     "PRIMARY KEY (modelHash, idx))")
+    except Exception as exc:
+        logAndExit(f"<instanceCache> Failed to open <{dbPath}>.",
+                   exc=exc, exitCode=EXIT.Files_and_paths)
+    return conn
+
+@decorate.debugWrap
+@decorate.timeWrap
+def loadInstances(modelHash):
+    """ Returns the list of instances cached for modelHash, or None """
+    conn = openInstanceCache()
+    try:
+        row = conn.execute("SELECT version, nInstances FROM models WHERE modelHash=?",
+                           (modelHash,)).fetchone()
+        if (row is None) or (row[0] != CACHE_VERSION):
+            return None
+        instances = [json.loads(config) for (config,) in conn.execute(
+                        "SELECT config FROM instances WHERE modelHash=? ORDER BY idx",
+                        (modelHash,))]
+        if (len(instances) != row[1]): # Should not happen with transactional writers
+            warnAndLog(f"<instanceCache> Incomplete entry for <{modelHash}>. Ignoring it.",
+                       doPrint=False)
+            return None
+        conn.execute("UPDATE models SET lastUsed=? WHERE modelHash=?",
+                     (time.time(), modelHash))
+    except Exception as exc:
+        logAndExit(f"<instanceCache> Failed to load the instances of <{modelHash}>.",
+                   exc=exc, exitCode=EXIT.Files_and_paths)
+    finally:
+        conn.close()
+    return instances
+
+@decorate.debugWrap
+@decorate.timeWrap
+def storeInstances(modelHash, instances):
+    conn = openInstanceCache()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM instances WHERE modelHash=?", (modelHash,))
+        conn.executemany("INSERT INTO instances VALUES (?,?,?)",
+                         [(modelHash, idx, json.dumps(instance))
+                            for idx, instance in enumerate(instances)])
+        conn.execute("INSERT OR REPLACE INTO models VALUES (?,?,?,?)",
+                     (modelHash, CACHE_VERSION, len(instances), time.time()))
+
+        maxModels = getSettingDict('bufferErrors', 'instanceCacheMaxModels')
+        evicted = [h for (h,) in conn.execute(
+                    "SELECT modelHash FROM models ORDER BY lastUsed DESC LIMIT -1 OFFSET ?",
+                    (maxModels,))]
+        for h in evicted:
+            conn.execute("DELETE FROM instances WHERE modelHash=?", (h,))
+            conn.execute("DELETE FROM models WHERE modelHash=?", (h,))
+        conn.execute("COMMIT")
+    except Exception as exc:
+        logAndExit(f"<instanceCache> Failed to store the instances of <{modelHash}>.",
+                   exc=exc, exitCode=EXIT.Files_and_paths)
+    finally:
+        conn.close()
+    if (evicted):
+        printAndLog(f"<instanceCache> Evicted {len(evicted)} cached model(s).", doPrint=False)
@@ -73,9 +73,23 @@ class InstanceSelector:
     """
     This class selects test instances from a list of instances to produce a
     set of generated tests with good coverage of the buffer errors concepts
+
+    An instance may be selected if its concept is under the instance's quota.
+    Instead of sampling all the instances until one is acceptable, the
+    instances are grouped up front into buckets of equal (concept, quota), and
+    a choice is made among the acceptable buckets weighted by their sizes.
+    This draws from the same distribution (uniform over the acceptable
+    instances) at a bounded cost, and reports an error instead of looping
+    forever if no instance is acceptable.  Buckets with a zero quota can never
+    be selected and are dropped.
     """
     def __init__(self, instancePairs, rnd):
-        nTests = getSettingDict('bufferErrors', 'nTests')
+        # The settings do not change during generation
+        self.nTests = getSettingDict('bufferErrors', 'nTests')
+        self.useCustomErrorModel = isEnabledDict("bufferErrors", "useCustomErrorModel")
+        self.forcePathManipulation = (not isEqSetting('osImage', 'FreeRTOS') and
+                                      not compilingBareMetal() and
+                                      not self.useCustomErrorModel)
         self.conceptCounts = collections.defaultdict(int)
         self.instancePairs = instancePairs
         self.pathManipulationPairs = [x for x in instancePairs if
@@ -83,34 +97,62 @@ class InstanceSelector:
                                       "BufferIndexScheme_PathManipulation"]
         self.rnd = rnd
 
+        buckets = collections.defaultdict(list)
+        if not self.useCustomErrorModel:
+            for (instance, tg) in instancePairs:
+                buckets[(instanceToConcept(instance), getQuota(instance))].append((instance, tg))
+        self.buckets = [(concept, quota, pairs) for ((concept, quota), pairs) in buckets.items()
+                        if quota > 0]
+
+        # Acceptance statistics: the fraction of the instances that were
+        # acceptable at each selection
+        self.nSelections = 0
+        self.sumAcceptance = 0.0
+        self.minAcceptance = 1.0
+
     def chooseInstance(self):
         numSelected = sum(self.conceptCounts.values())
-        if (not isEqSetting('osImage', 'FreeRTOS') and
-            not compilingBareMetal() and
-            not isEnabledDict("bufferErrors", "useCustomErrorModel") and
-            numSelected < 0.05 * getSettingDict('bufferErrors', 'nTests')):
+        if (self.forcePathManipulation and
+            numSelected < 0.05 * self.nTests):
             # Force selection of a small number of CWE_785 tests on Unix
             # platforms (except when building using bare metal as realpath is not available)
             (instance, tg) = self.rnd.choice(self.pathManipulationPairs)
             self.conceptCounts[instanceToConcept(instance)] += 1
             return tg
 
-        (instance, tg) = self.rnd.choice(self.instancePairs)
-        concept = instanceToConcept(instance)
-        underQuota = numSelected < (getSettingDict('bufferErrors', 'nTests') //
-                                    NUM_CONCEPTS *
-                                    NUM_CONCEPTS)
-        while ((not isEnabledDict("bufferErrors", "useCustomErrorModel")) and
-               ((underQuota and
-                self.conceptCounts[concept] >= getQuota(instance)) or
-                ((not underQuota) and
-                 self.conceptCounts[concept] >= (getQuota(instance) + 1)))):
-            # Sample until an instance is chosen that helps meet a quota.
-            # If all quotas have been reached and nTests is not a multiple of
-            # NUM_CONCEPTS, then select an instance that is at (but not
-            # greater than) its quota.
+        if self.useCustomErrorModel:
             (instance, tg) = self.rnd.choice(self.instancePairs)
-            concept = instanceToConcept(instance)
-        self.conceptCounts[concept] += 1
+            self.conceptCounts[instanceToConcept(instance)] += 1
+            return tg
+
+        # If all quotas have been reached and nTests is not a multiple of
+        # NUM_CONCEPTS, then select an instance that is at (but not greater
+        # than) its quota.
+        underQuota = numSelected < (self.nTests // NUM_CONCEPTS * NUM_CONCEPTS)
+        slack = 0 if underQuota else 1
+        eligible = [pairs for (concept, quota, pairs) in self.buckets
+                    if self.conceptCounts[concept] < quota + slack]
+        nEligible = sum(len(pairs) for pairs in eligible)
+        if nEligible == 0:
+            logAndExit("<InstanceSelector> No instance can be selected without "
+                       f"exceeding its quota after {numSelected} tests.",
+                       exitCode=EXIT.Dev_Bug)
+
+        acceptance = nEligible / len(self.instancePairs)
+        self.nSelections += 1
+        self.sumAcceptance += acceptance
+        self.minAcceptance = min(self.minAcceptance, acceptance)
+
+        pairs = self.rnd.choices(eligible, weights=[len(x) for x in eligible])[0]
+        (instance, tg) = self.rnd.choice(pairs)
+        self.conceptCounts[instanceToConcept(instance)] += 1
         return tg
 
+    def reportStats(self):
+        if self.nSelections == 0:
+            return
+        printAndLog("<InstanceSelector> Acceptable instances per selection: "
+                    f"mean={100*self.sumAcceptance/self.nSelections:.1f}%, "
+                    f"min={100*self.minAcceptance:.1f}% over "
+                    f"{self.nSelections} quota selections.",
+                    doPrint=False)
@@ -202,6 +202,9 @@ def buildCwesEvaluation():
             if vulClass == "injection":
                 # Copy unix injection helpers over
                 cp(sourcesDir, vulClassDir, "inj_unix_helpers.*")
+                if (isEnabledDict(vulClass, "useInj1SweepDriver")
+                        and isTestEnabled(vulClass, "test_INJ_1")):
+                    cp(sourcesDir, vulClassDir, "inj_sweep.c")
 
 
         #Set the list of enabled tests
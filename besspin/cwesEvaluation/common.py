@@ -1,7 +1,7 @@
 import pexpect
 
 from besspin.base.utils.misc import *
-from besspin.cwesEvaluation.scoreTests import scoreTests, prettyVulClass, tabulate
+from besspin.cwesEvaluation.scoreTests import scoreTests, scoreTestsBatch, prettyVulClass, tabulate
 
 import besspin.cwesEvaluation.bufferErrors.vulClassTester
 import besspin.cwesEvaluation.PPAC.vulClassTester
@@ -11,6 +11,7 @@ import besspin.cwesEvaluation.numericErrors.vulClassTester
 import besspin.cwesEvaluation.hardwareSoC.vulClassTester
 import besspin.cwesEvaluation.injection.vulClassTester
 from besspin.cwesEvaluation.multitasking.multitasking import hasMultitaskingException, multitaskingRunner, logMultitaskingTable
+from besspin.cwesEvaluation.utils.testsIndex import getTestInfo
 
 cweTests = {
     "bufferErrors" :
@@ -300,7 +301,7 @@ def runTests(target, sendFiles=False, timeout=30): #executes the app
             target.sendTar(timeout=timeout)
 
         # Batch tests by vulnerability class
-        sequentialTables = {}
+        scoringJobs = []
         multitaskingTests = []
         for vulClass, tests in getSetting("enabledCwesEvaluations").items():
             logsDir = os.path.join(baseLogDir, vulClass)
@@ -311,8 +312,12 @@ def runTests(target, sendFiles=False, timeout=30): #executes the app
                     multitaskingTest = cweTests[vulClass](target).testToMultitaskingObj(test)
                     if multitaskingTest:
                         multitaskingTests.append(multitaskingTest)
-            _, table = scoreTests(vulClass, logsDir, prettyVulClass(vulClass), doPrint=False)
-            sequentialTables[vulClass] = table
+            scoringJobs.append({"vulClass" : vulClass, "logsDir" : logsDir,
+                                "title" : prettyVulClass(vulClass), "doPrint" : False})
+        # Score all the classes at once
+        sequentialTables = {}
+        for job, (_, table) in zip(scoringJobs, scoreTestsBatch(scoringJobs)):
+            sequentialTables[job["vulClass"]] = table
 
         if multitaskingTests:
             setSetting("runningMultitaskingTests", True)
@@ -323,23 +328,28 @@ def runTests(target, sendFiles=False, timeout=30): #executes the app
             table = [("Vul. Class", "TEST", "Instance", "Seq. Score", "Multi. Score", "Result")]
             numMultitaskingScores = 0
             multitaskingPasses = {}
+            scoringJobs = []
+            scoringInstances = []
             for vulClass in getSetting("enabledCwesEvaluations").keys():
                 if supportsMultitasking(vulClass):
                     for instance in range(1, getSetting('instancesPerTestPart')+1):
-                        multitaskingScores, _ = scoreTests(
-                                vulClass,
-                                os.path.join(logsDir,
-                                             vulClass,
-                                             f"instance-{instance}"),
-                                f'{prettyVulClass(vulClass)} multitasking '
-                                f'instance {instance}',
-                                doPrint=False,
-                                reportFileName="multitaskingScoreReport.log")
-                        table += checkMultitaskingScores(vulClass,
-                                                         multitaskingScores,
-                                                         instance,
-                                                         multitaskingPasses)
-                        numMultitaskingScores += len(multitaskingScores)
+                        scoringInstances.append(instance)
+                        scoringJobs.append({
+                                "vulClass" : vulClass,
+                                "logsDir" : os.path.join(logsDir,
+                                                         vulClass,
+                                                         f"instance-{instance}"),
+                                "title" : f'{prettyVulClass(vulClass)} multitasking '
+                                          f'instance {instance}',
+                                "doPrint" : False,
+                                "reportFileName" : "multitaskingScoreReport.log"})
+            for job, instance, (multitaskingScores, _) in zip(scoringJobs, scoringInstances,
+                                                              scoreTestsBatch(scoringJobs)):
+                table += checkMultitaskingScores(job["vulClass"],
+                                                 multitaskingScores,
+                                                 instance,
+                                                 multitaskingPasses)
+                numMultitaskingScores += len(multitaskingScores)
             logMultitaskingTable(table)
 
             for vulClass, table in sequentialTables.items():
@@ -376,7 +386,8 @@ def isTestEnabled(vulClass, testName):
     --------
         A boolean representing whether <testName> from <vulClass> is enabled.
     """
-    if (isEnabledDict(vulClass,['testsInfo',testName,'documentationOnly'],default=False)):
+    testInfo = getTestInfo(vulClass, testName)
+    if ((testInfo is not None) and testInfo.documentationOnly):
         return False
     elif (isEnabledDict(vulClass,'runAllTests')):
         return True
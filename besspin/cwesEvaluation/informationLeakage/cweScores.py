@@ -15,6 +15,10 @@ scoring functions for each CWE test
 """
 VULCLASS = "informationLeakage"
 
+# The CWEs map of the tests, per (model hash, tests). This module is re-loaded on every scoreLogs,
+# so the memo lives in featureModelUtil to last for the whole process.
+_cweMaps = featureModelUtil.getProcessMemo('informationLeakageCweMaps')
+
 def parseTestName(testName):
     return testName.split("_")[1]
 
@@ -38,10 +42,15 @@ def generateCweMap():
     fmfile  = os.path.join(vulClassDir, 'InformationLeakage.cfr')
     src = os.path.join(vulClassDir, 'sources')
 
+    tests        = dirnames(f"{src}/tests/*.c") + [t.split("test_")[-1] for t in dirnames(f"{src}/nonstandard/*.c")]
+    computedModelHash = computeMd5ForFile(fmfile)
+    memoKey = (computedModelHash, tuple(sorted(tests)))
+    if (memoKey in _cweMaps): # Already checked (and computed if needed) by this process
+        return _cweMaps[memoKey]
+
     # Compare the mapping[tests] and .cfr hash versus the saved values
     savedMapFile = getSettingDict(VULCLASS,"cwesMapFile")
     mapping = safeLoadJsonFile (savedMapFile)
-    tests        = dirnames(f"{src}/tests/*.c") + [t.split("test_")[-1] for t in dirnames(f"{src}/nonstandard/*.c")]
     doComputeMap = False
 
     if (set(mapping.keys()) != set(tests)): #Re-generate the map
@@ -50,7 +59,6 @@ def generateCweMap():
             f" accordingly.")
         doComputeMap = True
 
-    computedModelHash = computeMd5ForFile(fmfile)
     if (computedModelHash != getSettingDict(VULCLASS,"modelHash")):
         warnAndLog (f"IEX:generateCweMap: The saved hash in {os.path.join(vulClassDir,'setupEnv.json')}"
             f" does not match the computed value <{computedModelHash}>. Please consider committing any"
@@ -59,13 +67,12 @@ def generateCweMap():
 
     if (doComputeMap):
         fm = featureModelUtil.loadFM(fmfile)
-        mapping = {}
-        for t in tests:
-            cfg    = [f"Test_{t}"]
-            fm2    = featureModelUtil.addConstraints(fm, cfg)
-            result = featureModelUtil.checkMust(fm2, CWES)
-            mapping[t] = [ cwe for (cwe, on) in zip(CWES, result) if on ]
+        # All the tests are answered by one batched query (the answers are cached per model hash)
+        queries = [(featureModelUtil.addConstraints(fm, [f"Test_{t}"]), CWES) for t in tests]
+        results = featureModelUtil.checkMustBatch(queries)
+        mapping = {t : [ cwe for (cwe, on) in zip(CWES, result) if on ] for t, result in zip(tests, results)}
         safeDumpJsonFile(mapping, savedMapFile, indent=4)
+    _cweMaps[memoKey] = mapping
     return mapping
 
 def scoreAllTests(logs):
@@ -81,6 +88,11 @@ def scoreAllTests(logs):
             testNum = testNum.split("_")[1]
             scoresDict[testNum].append(scoreTest(log))
 
+    # The implemented parts of all the CWEs are averaged at once
+    implementedColumns = {testNum : [ s for s in listScores if s != SCORES.NOT_IMPLEMENTED ]
+                            for testNum, listScores in scoresDict.items()}
+    averages = dict(zip([testNum for testNum, implemented in implementedColumns.items() if implemented],
+                        SCORES.avgScores([implemented for implemented in implementedColumns.values() if implemented])))
     ret = []
     for testNum, listScores in scoresDict.items():
         notesList = []
@@ -89,9 +101,8 @@ def scoreAllTests(logs):
                 notesList.append(f"{possibleScore}({listScores.count(possibleScore)})")
 
         notes = "Results: " + ', '.join(notesList)
-        implemented = [ s for s in listScores if s != SCORES.NOT_IMPLEMENTED ]
-        if len(implemented) > 0:
-            flooredScore, exactScore = SCORES.avgScore(implemented)
+        if testNum in averages:
+            flooredScore, exactScore = averages[testNum]
         else:
             flooredScore = SCORES.NOT_IMPLEMENTED
             exactScore = flooredScore.value
@@ -1,11 +1,73 @@
 #!/usr/bin/env python3
 import os
 import glob
+import hashlib
 
 from besspin.base.utils.misc import *
 from besspin.cwesEvaluation.common import isTestEnabled
 from besspin.cwesEvaluation.informationLeakage.iexutils import dirnames
 
+# The link table of the standard tests on unix, included by Makefile.xcompileDir
+VARIANTS_MAKEFILE = "variants.mk"
+
+def hashSource(filePath):
+    try:
+        with open(filePath, 'rb') as fSource:
+            return hashlib.sha256(fSource.read()).hexdigest()
+    except Exception as exc:
+        logAndExit(f"generateWrappers for IEX: Failed to read <{filePath}>.",exc=exc,exitCode=EXIT.Files_and_paths)
+
+def enumerateVariants(src):
+    """
+    Returns the enabled (test, store, interpreter) combinations. Only the combinations
+    that are implemented and that the feature model enables are listed.
+    """
+    tests        = sorted(dirnames(os.path.join(src, "tests", "*.c")))
+    stores       = sorted(dirnames(os.path.join(src, "stores", "*.c")))
+    interpreters = sorted(dirnames(os.path.join(src, "interpreters", "*.c")))
+
+    variants = []
+    for t in tests:
+        for s in stores:
+            for i in interpreters:
+                variant = f"test_{t}_{s}_{i}"
+                # Skip the not-implemented tests
+                if ((t == "cache") and (s != "cached")):
+                    printAndLog(f"generateWrappers: Skipping {variant}.c. It is not implemented.",doPrint=False)
+                    continue
+                if ((t == "setenv") and isEqSetting('osImage','FreeRTOS')):
+                    printAndLog(f"generateWrappers: Skipping {variant}.c. It is not implemented on FreeRTOS.",doPrint=False)
+                    continue
+                if isTestEnabled('informationLeakage', variant):
+                    variants.append((variant, t, s, i))
+    return variants
+
+def writeVariantsMakefile(src, variants):
+    """
+    Writes the unix link table: one rule per enabled variant, linking the shared objects.
+    Variants built from identical sources are equivalent, so they are linked once and
+    the other binaries are copies.
+    """
+    canonicalOf = dict()
+    lines = [f"VARIANTS = {' '.join(variant for variant, *_ in variants)}\n\n"]
+    for variant, t, s, i in variants:
+        parts = [f"stores/{s}", f"interpreters/{i}", f"tests/{t}"]
+        key = tuple(hashSource(os.path.join(src, f"{part}.c")) for part in parts)
+        if (key in canonicalOf):
+            printAndLog(f"generateWrappers: <{variant}> is equivalent to <{canonicalOf[key]}>. Sharing its binary.",
+                doPrint=False)
+            lines.append(f"{variant}.riscv: {canonicalOf[key]}.riscv\n\tcp $< $@\n\n")
+        else:
+            canonicalOf[key] = variant
+            objs = ' '.join(f"{part}.o" for part in parts)
+            lines.append(f"{variant}.riscv: {objs} $(FOBJS)\n\t$(LD) $(LDFLAGS) {objs} $(FOBJS) -o $@\n\n")
+    try:
+        fMake = ftOpenFile(os.path.join(src, VARIANTS_MAKEFILE), "w")
+        fMake.write(''.join(lines))
+        fMake.close()
+    except Exception as exc:
+        logAndExit(f"generateWrappers for IEX: Failed to write <{VARIANTS_MAKEFILE}>.",exc=exc,exitCode=EXIT.Files_and_paths)
+
 def generateWrappers():
     src = os.path.join(getSetting('buildDir'), 'informationLeakage')
     enabledDrivers = set()
@@ -19,7 +81,7 @@ def generateWrappers():
             enabledDrivers.add(t.split("test_")[-1])
             enabledBins.append(f"{t}.riscv")
             # In unix this file will avoid "crossCompileUnix" skipping, and will be used by FreeRTOS
-            cp (os.path.join(nonStdDir,f"{t}.c"),src) 
+            cp (os.path.join(nonStdDir,f"{t}.c"),src)
         else: #delete the file
             try:
                 os.remove(os.path.join(nonStdDir, f"{t}.c"))
@@ -28,35 +90,20 @@ def generateWrappers():
                     exc=exc,exitCode=EXIT.Files_and_paths)
 
     # Standard tests
-    tests        = dirnames(os.path.join(src, "tests", "*.c"))
-    stores       = dirnames(os.path.join(src, "stores", "*.c"))
-    interpreters = dirnames(os.path.join(src, "interpreters", "*.c"))
+    variants = enumerateVariants(src)
+    for variant, t, s, i in variants:
+        enabledDrivers.add(t)
+        enabledBins.append(f"{variant}.riscv")
 
-    for t in tests:
-        for s in stores:
-            for i in interpreters:
-                fileName = f"test_{t}_{s}_{i}.c"
-                # Skip the not-implemented tests
-                if ((t == "cache") and (s != "cached")):
-                    printAndLog(f"generateWrappers: Skipping {fileName}. It is not implemented.",doPrint=False)
-                    continue
-                if ((t == "setenv") and isEqSetting('osImage','FreeRTOS')):
-                    printAndLog(f"generateWrappers: Skipping {fileName}. It is not implemented on FreeRTOS.",doPrint=False)
-                    continue
-                if isTestEnabled('informationLeakage', fileName.split(".c")[0]):
-                    enabledDrivers.add(t)
-                    enabledBins.append(fileName.replace(".c",".riscv"))
-                    fd = ftOpenFile(os.path.join(src, fileName), "w")
-                    fd.write('#include <stdio.h>\n')
-                    if isEnabled('isUnix'):
-                        fd.write('#include "unbufferStdout.h"\n')
-                    fd.write('int main()\n')
-                    fd.write('{\n')
-                    if isEnabled('isUnix'):
-                        fd.write('\tunbufferStdout();\n')
-                    fd.write('\treturn test_main();\n')
-                    fd.write('}\n')
-                    fd.close()
+    if isEnabled('isUnix'):
+        # The binaries are linked from the shared objects; no source per variant is needed
+        writeVariantsMakefile(src, variants)
+    else:
+        # Each FreeRTOS test is its own image, built from a copy of the same wrapper
+        wrapper = '#include <stdio.h>\nint main()\n{\n\treturn test_main();\n}\n'
+        for variant, *_ in variants:
+            fd = ftOpenFile(os.path.join(src, f"{variant}.c"), "w")
+            fd.write(wrapper)
+            fd.close()
 
     return (enabledDrivers, enabledBins)
-
@@ -7,6 +7,7 @@ import re
 from besspin.base.utils.misc import *
 from besspin.cwesEvaluation.scoreTests import SCORES, adjustToCustomScore
 from besspin.cwesEvaluation.utils.scoringAux import defaultSelfAssessmentScoreAllTests, overallScore
+from besspin.cwesEvaluation.utils.testsIndex import getTestInfo
 
 VULCLASS = "injection"
 
@@ -29,7 +30,7 @@ def scoreAllTests(logs):
 
 def getTestNumAndInfo(testName):
     testNum = testName.split("test_")[1].replace("_", "-")
-    info = getSettingDict(VULCLASS, ["testsInfo", testName, "cweText"])
+    info = getTestInfo(VULCLASS, testName).cweText
     return (testNum, info)
 
 def scoreInj1TestPart(logLines, testNum, info):
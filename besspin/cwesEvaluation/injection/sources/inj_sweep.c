@@ -0,0 +1,192 @@
+// On-target driver for the INJ-1 return pointer offset sweep.
+//
+// Usage: inj_sweep.riscv <test binary> <opcode> <offset>...
+//
+// For each offset, the test binary runs in its own child process.  The driver
+// waits for the child to leak the buffer address over stderr, writes the
+// injection payload to its stdin, then collects its stdout and stderr until it
+// exits.  A crash of one part cannot affect the others.  The output is a table
+// of parts, each one starting with <OFFSET n>, followed by the test output, the
+// message a shell prints for a child killed by a signal (e.g. "Segmentation
+// fault"), and a status line, so it scores exactly like the console-driven
+// parts, custom scoring keywords included.
+
+#include <errno.h>
+#include <poll.h>
+#include <signal.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/types.h>
+#include <sys/wait.h>
+#include <time.h>
+#include <unistd.h>
+
+#include "unbufferStdout.h"
+
+// Per-part time budget in seconds
+#define PART_TIMEOUT_S 10
+
+// Size of the buffer holding the child's stderr
+#define LEAK_BUF_SIZE 256
+
+// Milliseconds left before `deadline`, or 0 if it has passed
+static int ms_left(time_t deadline) {
+    time_t now = time(NULL);
+    return (now >= deadline) ? 0 : (int) (deadline - now) * 1000;
+}
+
+// Read the child's stderr into `buf` until <LEAKED> is seen.  Returns 0 on
+// success, -1 if the child closed stderr, and -2 on timeout.
+static int read_leak(int fd, char buf[LEAK_BUF_SIZE], time_t deadline) {
+    size_t len = 0;
+    buf[0] = '\0';
+    while (strstr(buf, "<LEAKED>") == NULL) {
+        struct pollfd pfd = { .fd = fd, .events = POLLIN };
+        int ready = poll(&pfd, 1, ms_left(deadline));
+        if (ready == 0) {
+            return -2;
+        } else if (ready < 0) {
+            if (errno == EINTR) {
+                continue;
+            }
+            return -1;
+        }
+        if (len + 1 >= LEAK_BUF_SIZE) {
+            return -1;
+        }
+        ssize_t bytes = read(fd, buf + len, LEAK_BUF_SIZE - 1 - len);
+        if (bytes <= 0) {
+            return -1;
+        }
+        len += (size_t) bytes;
+        buf[len] = '\0';
+    }
+    return 0;
+}
+
+// Copy `out_fd` and `err_fd` to stdout until EOF on both, as a console shows
+// them.  Returns -2 on timeout, 0 otherwise.
+static int drain(int out_fd, int err_fd, time_t deadline) {
+    char buf[LEAK_BUF_SIZE];
+    // poll ignores the negative fds, so a closed one is set to -1
+    struct pollfd pfds[2] = { { .fd = out_fd, .events = POLLIN },
+                              { .fd = err_fd, .events = POLLIN } };
+    while ((pfds[0].fd >= 0) || (pfds[1].fd >= 0)) {
+        int ready = poll(pfds, 2, ms_left(deadline));
+        if (ready == 0) {
+            return -2;
+        } else if (ready < 0) {
+            if (errno == EINTR) {
+                continue;
+            }
+            return 0;
+        }
+        for (int i = 0; i < 2; ++i) {
+            if ((pfds[i].fd < 0) || (pfds[i].revents == 0)) {
+                continue;
+            }
+            ssize_t bytes = read(pfds[i].fd, buf, sizeof(buf));
+            if (bytes <= 0) {
+                pfds[i].fd = -1;
+            } else {
+                fwrite(buf, 1, (size_t) bytes, stdout);
+            }
+        }
+    }
+    return 0;
+}
+
+// Print what a shell prints for a child killed by `sig`
+static void print_signal_message(int sig, int core_dumped) {
+    const char* description = strsignal(sig);
+    if ((description == NULL) || (strncmp(description, "Unknown signal", 14) == 0) ||
+        (strncmp(description, "Real-time signal", 16) == 0)) {
+        printf("Signal %d", sig);
+    } else {
+        printf("%s", description);
+    }
+    printf("%s\n", core_dumped ? " (core dumped)" : "");
+}
+
+static void run_part(const char* test, const char* opcode, const char* offset) {
+    int in_pipe[2], out_pipe[2], err_pipe[2];
+    if (pipe(in_pipe) || pipe(out_pipe) || pipe(err_pipe)) {
+        printf("<SWEEP-ERROR>\nFailed to create pipes.\n");
+        return;
+    }
+
+    pid_t pid = fork();
+    if (pid < 0) {
+        printf("<SWEEP-ERROR>\nFailed to fork.\n");
+        return;
+    }
+    if (pid == 0) {
+        dup2(in_pipe[0], 0);
+        dup2(out_pipe[1], 1);
+        dup2(err_pipe[1], 2);
+        close(in_pipe[1]);
+        close(out_pipe[0]);
+        close(err_pipe[0]);
+        execl(test, test, (char*) NULL);
+        _exit(127);
+    }
+    close(in_pipe[0]);
+    close(out_pipe[1]);
+    close(err_pipe[1]);
+
+    time_t deadline = time(NULL) + PART_TIMEOUT_S;
+    char leak[LEAK_BUF_SIZE];
+    int status = read_leak(err_pipe[0], leak, deadline);
+    // The console shows the leak too
+    fputs(leak, stdout);
+    char* address = (status == 0) ? strstr(leak, "<buffer address ") : NULL;
+    if (address != NULL) {
+        address += strlen("<buffer address ");
+        address[strcspn(address, ">")] = '\0';
+        dprintf(in_pipe[1], "0\n%s\n%s\n%s\n", opcode, offset, address);
+    }
+    close(in_pipe[1]);
+
+    if (status != -2) {
+        status = drain(out_pipe[0], err_pipe[0], deadline);
+    }
+    if (status == -2) {
+        kill(pid, SIGKILL);
+    }
+
+    int wstatus = 0;
+    waitpid(pid, &wstatus, 0);
+    close(out_pipe[0]);
+    close(err_pipe[0]);
+
+    if (status == -2) {
+        printf("\n<TIMEOUT>\n");
+    } else if (address == NULL) {
+        printf("\n<FAIL>\nCouldn't find leaked address.\n");
+    }
+    if (WIFSIGNALED(wstatus)) {
+        if (status != -2) {
+            print_signal_message(WTERMSIG(wstatus), WCOREDUMP(wstatus));
+        }
+        printf("<SWEEP-STATUS signal=%d>\n", WTERMSIG(wstatus));
+    } else {
+        printf("<SWEEP-STATUS exit=%d>\n", WEXITSTATUS(wstatus));
+    }
+}
+
+int main(int argc, char** argv) {
+    unbufferStdout();
+    // A child that dies before reading its payload must not kill the driver
+    signal(SIGPIPE, SIG_IGN);
+    if (argc < 4) {
+        printf("<SWEEP-ERROR>\nUsage: %s <test> <opcode> <offset>...\n", argv[0]);
+        return 1;
+    }
+    for (int i = 3; i < argc; ++i) {
+        printf("\n<OFFSET %s>\n", argv[i]);
+        run_part(argv[1], argv[2], argv[i]);
+    }
+    printf("<SWEEP-DONE>\n");
+    return 0;
+}
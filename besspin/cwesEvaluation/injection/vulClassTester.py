@@ -11,6 +11,12 @@ from besspin.base.utils.misc import *
 
 INJ_OUTPUT_FILE = "inj-output.txt"
 
+# On-target driver that runs the whole INJ-1 offset sweep (see sources/inj_sweep.c)
+INJ_SWEEP_DRIVER = "inj_sweep.riscv"
+
+# The driver gives each part up to 10 seconds
+INJ_SWEEP_PART_TIMEOUT = 10
+
 ###############################################################################
 #### INJ-1 Constants
 ###############################################################################
@@ -95,7 +101,37 @@ class vulClassTester(cwesEvaluationCompatibilityLayer):
         testStdout = self.typCommand(f"cat {INJ_OUTPUT_FILE}")
         return (leakTextBack + testStdout + injectionTextBack), isTimeout
 
+    def isInj1SweepDriverAvailable(self):
+        """
+        The driver is not built with the bare metal toolchain nor with a custom
+        Makefile, so check the build directory before relying on it.
+        """
+        return (isEnabledDict(self.vulClass, "useInj1SweepDriver") and
+                os.path.isfile(os.path.join(getSetting('buildDir',targetId=self.targetId),
+                                            self.vulClass,
+                                            INJ_SWEEP_DRIVER)))
+
+    def executeInj1TestSweep(self, binTest):
+        """
+        Send the whole offset sweep to the on-target driver in one command.  It
+        runs each offset in its own process and prints the same <OFFSET n>
+        sections as the console-driven parts.
+        """
+        offsets = " ".join(str(returnPointerOffset) for returnPointerOffset in
+                           range(MIN_RETURN_POINTER_OFFSET,
+                                 MAX_RETURN_POINTER_OFFSET+1))
+        nParts = MAX_RETURN_POINTER_OFFSET - MIN_RETURN_POINTER_OFFSET + 1
+        _, textBack, isTimeout, _ = self.runCommand(
+                f"./{INJ_SWEEP_DRIVER} ./{binTest} {EBREAK_OPCODE} {offsets}",
+                endsWith="<SWEEP-DONE>",
+                exitOnError=False,
+                suppressErrors=True,
+                timeout=60 + nParts*INJ_SWEEP_PART_TIMEOUT)
+        return textBack, isTimeout
+
     def executeInj1Test(self, binTest):
+        if (self.isInj1SweepDriverAvailable()):
+            return self.executeInj1TestSweep(binTest)
         textBack = ""
         for returnPointerOffset in range(MIN_RETURN_POINTER_OFFSET,
                                          MAX_RETURN_POINTER_OFFSET+1):
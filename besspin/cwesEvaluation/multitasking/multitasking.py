@@ -3,15 +3,16 @@ import re
 from besspin.base.utils.misc import *
 from besspin.cwesEvaluation.compat import cwesEvaluationCompatibilityLayer
 from besspin.cwesEvaluation.scoreTests import tabulate_row
+from besspin.cwesEvaluation.utils.testsIndex import getTestInfo
 
 # Name of the file to synchronize the test processes on
 LOCK_FILE = "multitask.lock"
 SCRIPT_FILE = "multitask.sh"
 
 def hasMultitaskingException(vulClass, envSection):
-    exceptions = envSection + ["multitaskingExceptions"]
-    return (doesSettingExistDict(vulClass, exceptions) and
-            getSetting('osImage') in getSettingDict(vulClass, exceptions))
+    testInfo = getTestInfo(vulClass, envSection[-1])
+    return ((testInfo is not None) and (testInfo.section == envSection[0]) and
+            testInfo.hasMultitaskingException)
 
 def logMultitaskingTable(table):
     widths = [ (len(r[0]), len(r[1]), len(r[2]), len(r[3]), len(r[4]), len(r[5])) for r in table]
@@ -28,6 +28,7 @@ from besspin.base.utils.misc import *
 from besspin.cwesEvaluation.scoreTests import SCORES, adjustToCustomScore
 from besspin.cwesEvaluation.utils.scoringAux import defaultSelfAssessmentScoreAllTests, overallScore
 from besspin.cwesEvaluation.common import isTestEnabled
+from besspin.cwesEvaluation.utils.testsIndex import getTestInfo
 
 VULCLASS = "numericErrors"
 
@@ -62,7 +63,8 @@ def scoreAllTests(logs):
     for name, log in logs:
         testNum = name.split('_')[1]
         logLines = ftReadLines(log)
-        numParts = getSettingDict(VULCLASS,["testsInfo",name,getSetting("osDiv"),"nParts"])
+        testInfo = getTestInfo(VULCLASS, name)
+        numParts = testInfo.nParts
         partsScores = []
         for thisPart in range(1, numParts + 1):
             partLines = partitionLines (logLines,thisPart,testNum) #partitioning first make sure the scoring is done for this part only
@@ -70,7 +72,7 @@ def scoreAllTests(logs):
             partsScores.append(adjustToCustomScore(partLines,thisScore))
 
         ovrScore = overallScore(partsScores,f"TEST-{testNum}",
-                    partsWeights=getSettingDict(VULCLASS,["testsInfo",name,getSetting("osDiv"),"scoreWeights"]))
+                    partsWeights=testInfo.scoreWeights)
         scores[name] = ovrScore[1]
         ret.append(ovrScore)
 
@@ -6,6 +6,7 @@ import os
 
 from besspin.cwesEvaluation.compat import cwesEvaluationCompatibilityLayer
 from besspin.cwesEvaluation.multitasking.multitasking import multitaskingPart, multitaskingTest
+from besspin.cwesEvaluation.utils.testsIndex import getTestInfo
 from besspin.base.utils.misc import *
 
 NE_OUTPUT_FILE = "ne-output.txt"
@@ -23,7 +24,7 @@ class vulClassTester(cwesEvaluationCompatibilityLayer):
             testNum = testName.split('_')[1]
         except Exception as exc:
             self.terminateAndExit (f"executeTest: Failed to parse <{binTest}>.",exc=exc,exitCode=EXIT.Dev_Bug)
-        numParts = getSettingDict(VULCLASS,["testsInfo",testName,getSetting("osDiv"),"nParts"])
+        numParts = getTestInfo(VULCLASS, testName).nParts
 
         return (testName, testName, numParts)
 
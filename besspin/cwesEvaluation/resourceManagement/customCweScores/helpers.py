@@ -7,6 +7,7 @@ import re
 
 from besspin.base.utils.misc import *
 from besspin.cwesEvaluation.scoreTests import SCORES, adjustToCustomScore
+from besspin.cwesEvaluation.utils.testsIndex import getTestInfo
 
 def getOsImage (lines,testNum=None):
     warnText = "" if (testNum is None) else " in test_{0}.log".format(testNum)
@@ -75,7 +76,7 @@ def overallScore (listScores, testNum):
     if (len(listScores)==0): #not implemented
         return ["TEST-{0}".format(testNum), SCORES.NOT_IMPLEMENTED, SCORES.NOT_IMPLEMENTED.value, "Not Implemented"]
     ovrScore, exactScore = SCORES.weightedAvgScore(listScores,
-                getSettingDict("resourceManagement",["testsInfo",f"test_{testNum}",getSetting("osDiv"),"scoreWeights"]))
+                getTestInfo("resourceManagement",f"test_{testNum}").scoreWeights)
     scoreString = ', '.join([f"p{i+1:02d}:{partScore}" for i,partScore in enumerate(listScores)])
 
     return ["TEST-{0}".format(testNum), ovrScore, exactScore, scoreString]
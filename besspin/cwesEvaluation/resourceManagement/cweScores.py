@@ -11,6 +11,7 @@ from besspin.cwesEvaluation.common import isTestEnabled
 from collections import defaultdict
 from copy import deepcopy
 from besspin.cwesEvaluation.multitasking.multitasking import hasMultitaskingException
+from besspin.cwesEvaluation.utils.testsIndex import getTestInfo
 
 VULCLASS = "resourceManagement"
 
@@ -22,10 +23,10 @@ def scoreAllTests(logs):
     ret = []
     funcTestsScores = dict()
 
-    def storeTestScore(testsInfoSection, scoreInfo):
+    def storeTestScore(testInfo, scoreInfo):
         try:
             testName = scoreInfo[0]
-            if (testsInfoSection == "testsInfo"): #it's ready for display
+            if (not testInfo.isFuncTest): #it's ready for display
                 testName = testName.replace('-','_').lower()
             funcTestsScores[testName] = scoreInfo[1]
         except Exception as exc:
@@ -34,9 +35,12 @@ def scoreAllTests(logs):
     # Score the log files
     for name, log in logs:
         logLines = ftReadLines(log)
-        testsInfoSection = "testsInfo" if (name in getSettingDict(VULCLASS,"testsInfo")) else "funcTestsInfo"
-        if ((testsInfoSection=="testsInfo") 
-                and (not doesSettingExistDict(VULCLASS,[testsInfoSection,name,"useDefaultScorer"]))):
+        testInfo = getTestInfo(VULCLASS, name)
+        if (testInfo is None):
+            errorAndLog(f"scoreAllTests-{VULCLASS}: <{name}> has no metadata in the setupEnv.json.")
+            ret.append([f"{name.replace('_','-').upper()}", SCORES.FAIL, SCORES.FAIL.value, "Failed to Score!"])
+            continue
+        if ((not testInfo.isFuncTest) and (not testInfo.useDefaultScorer)):
             try:
                 testScorerFunc = getattr(globals()[name],name)
             except Exception as exc:
@@ -45,10 +49,10 @@ def scoreAllTests(logs):
                 continue
             scoreInfo = testScorerFunc(logLines)
         else: # Use the custom scorer
-            scoreInfo = defaultScoreTest(name, logLines, testsInfoSection)
+            scoreInfo = defaultScoreTest(name, logLines, testInfo)
 
-        storeTestScore(testsInfoSection, scoreInfo)
-        if (testsInfoSection=="testsInfo"): #regular CWE with its own test
+        storeTestScore(testInfo, scoreInfo)
+        if (not testInfo.isFuncTest): #regular CWE with its own test
             ret.append(scoreInfo)
         else: #only sub-class CWEs
             printAndLog(f"{VULCLASS}-Score-Details: {scoreInfo}",doPrint=False)
@@ -79,8 +83,8 @@ def scoreAllTests(logs):
     return ret
 
 @decorate.debugWrap
-def defaultScoreTest(testName, logLines, testsInfoSection):
-    nParts = getSettingDict(VULCLASS,[testsInfoSection,testName,getSetting("osDiv"),"nParts"])
+def defaultScoreTest(testName, logLines, testInfo):
+    nParts = testInfo.nParts
 
     scoreOptions = [SCORES.CALL_ERR, SCORES.HIGH, SCORES.MED, SCORES.LOW, SCORES.NONE]
 
@@ -95,8 +99,8 @@ def defaultScoreTest(testName, logLines, testsInfoSection):
     for negate in [False, True]:
         for xScore in scoreOptions:
             key = scoreToKey(xScore,negate=negate)
-            if doesSettingExistDict(VULCLASS,[testsInfoSection,testName,key]):
-                curDict = deepcopy(getSettingDict(VULCLASS,[testsInfoSection,testName,key]))
+            if (key in testInfo.info):
+                curDict = deepcopy(testInfo.info[key])
                 for setting in ["osImage", "target"]:
                     if (getSetting(setting) in curDict):
                         curDict = curDict[getSetting(setting)]
@@ -133,9 +137,9 @@ def defaultScoreTest(testName, logLines, testsInfoSection):
             partsLines = regPartitionTest(logLines,nParts,testNum=testName)
     
     listScores = [adjustToCustomScore(partsLines[iPart],scorePart(partsLines[iPart])) for iPart in range(1,nParts+1)]
-    if (testsInfoSection=="funcTestsInfo"): #This is not ready to display yet
+    if (testInfo.isFuncTest): #This is not ready to display yet
         dispName = testName
     else: 
         dispName = f"{testName.replace('_','-').upper()}"
     return overallScore(listScores,dispName,
-            partsWeights=getSettingDict(VULCLASS,[testsInfoSection,testName,getSetting("osDiv"),"scoreWeights"]))
+            partsWeights=testInfo.scoreWeights)
@@ -4,11 +4,13 @@ This file has the custom resourceManagement methods to run tests on qemu|fpga.
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # """
 from besspin.cwesEvaluation.resourceManagement import cweTests
 from besspin.cwesEvaluation.compat import cwesEvaluationCompatibilityLayer
-from besspin.cwesEvaluation.multitasking.multitasking import hasMultitaskingException, multitaskingPart, multitaskingTest
+from besspin.cwesEvaluation.multitasking.multitasking import multitaskingPart, multitaskingTest
+from besspin.cwesEvaluation.utils.testsIndex import getTestInfo
 
 from besspin.base.utils.misc import *
 
 RM_OUTPUT_FILE = "rm-output.txt"
+PARTS_HISTORY_FILE = "partsHistory.json"
 
 class vulClassTester(cwesEvaluationCompatibilityLayer):
     PART_FOOTER = "-"*60 + "\n\n\n"
@@ -16,16 +18,77 @@ class vulClassTester(cwesEvaluationCompatibilityLayer):
     def __init__(self, target):
         super().__init__(target)
         self.vulClass = "resourceManagement"
+        self.loadPartsHistory()
         return
 
-    def getTestNameAndInfoSection(self, binTest):
+    def readPartsHistoryFile(self):
+        if (not os.path.isfile(self.partsHistoryFile)):
+            return {}
+        return safeLoadJsonFile(self.partsHistoryFile)
+
+    def loadPartsHistory(self):
+        """
+        The durations of the past parts are persisted per <target>-<processor>-<osImage> in
+        the cache dir, and are used to bound the timeouts of the next runs.
+        """
+        self.partsHistoryFile = os.path.join(getCacheDir(self.vulClass), PARTS_HISTORY_FILE)
+        self.partsHistoryKey = f"{getSetting('target')}-{getSetting('processor')}-{getSetting('osImage')}"
+        allHistory = self.readPartsHistoryFile()
+        self.partsHistory = allHistory.get(self.partsHistoryKey, {})
+
+    def savePartsHistory(self):
+        # Re-load to keep what other runs have saved for other setups meanwhile
+        allHistory = self.readPartsHistoryFile()
+        allHistory[self.partsHistoryKey] = self.partsHistory
+        atomicDumpJsonFile(allHistory, self.partsHistoryFile)
+
+    def recordPart(self, testName, iPart, duration, isTimeout, isLearned=False):
+        """ A sample is [duration, isTimeout, isLearned]. Only the runs at the default timeout are evidence. """
+        samples = self.partsHistory.setdefault(testName, {}).setdefault(str(iPart), [])
+        samples.append([round(duration, 2), isTimeout, isLearned])
+        del samples[:-getSettingDict(self.vulClass, ["adaptiveTimeouts", "historySize"])]
+
+    def getPartTimeout(self, testName, iPart, defaultTimeout):
+        """
+        Returns (timeout, isLearned). Only the runs at the default timeout are evidence (the
+        samples of an older format are too). The learned timeout is the p99 of the completed
+        durations times a margin; a part hitting it is re-run at the default timeout.
+        A part that timed out at the default in all its past runs is a known hang, and gets the
+        minimum timeout. After <minSamples> such early kills in a row, it runs at the default
+        again, to verify that it still hangs. The learned value never exceeds the default timeout.
+        """
+        adaptiveTimeouts = getSettingDict(self.vulClass, "adaptiveTimeouts")
+        samples = self.partsHistory.get(testName, {}).get(str(iPart), [])
+        evidence = [sample[:2] for sample in samples if ((len(sample) < 3) or (not sample[2]))]
+        if ((not adaptiveTimeouts["enabled"]) or (len(evidence) < adaptiveTimeouts["minSamples"])):
+            return (defaultTimeout, False)
+        completed = sorted([duration for duration, isTimeout in evidence if (not isTimeout)])
+        if (completed):
+            p99 = completed[min(len(completed)-1, int(0.99*len(completed)))]
+            timeout = max(adaptiveTimeouts["minTimeout"], int(adaptiveTimeouts["margin"] * p99) + 1)
+        else:
+            recentSamples = samples[-adaptiveTimeouts["minSamples"]:]
+            if (all(((len(sample) > 2) and sample[2]) for sample in recentSamples)):
+                return (defaultTimeout, False) # Verify the known hang
+            timeout = adaptiveTimeouts["minTimeout"]
+        if (timeout >= defaultTimeout):
+            return (defaultTimeout, False)
+        return (timeout, True)
+
+    def isKnownHang(self, testName, iPart):
+        samples = self.partsHistory.get(testName, {}).get(str(iPart), [])
+        return all(sample[1] for sample in samples if ((len(sample) < 3) or (not sample[2])))
+
+    def getTestNameAndInfo(self, binTest):
         testName = binTest.split('.')[0]
-        testsInfoSection = "testsInfo" if (testName in getSettingDict(self.vulClass,"testsInfo")) else "funcTestsInfo"
-        return (testName, testsInfoSection)
+        testInfo = getTestInfo(self.vulClass, testName)
+        if (testInfo is None):
+            self.terminateAndExit (f"<{testName}> has no metadata in the setupEnv.json.",exitCode=EXIT.Dev_Bug)
+        return (testName, testInfo)
 
     def executeTest (self,binTest):
         outLog = ''
-        testName, testsInfoSection = self.getTestNameAndInfoSection(binTest)
+        testName, testInfo = self.getTestNameAndInfo(binTest)
 
         if (isEnabledDict(self.vulClass,'useSelfAssessment')):
             return "\n" + '*'*30 + f" {testName.upper().replace('_',' ')} " + '*'*30 + "\n\n"
@@ -33,13 +96,13 @@ class vulClassTester(cwesEvaluationCompatibilityLayer):
         if (not isEnabled('isUnix')):
             self.terminateAndExit (f"<executeTest> for FreeRTOS should never be called.",exitCode=EXIT.Dev_Bug)
         
-        if (isEqSettingDict(self.vulClass,[testsInfoSection,testName,"unix","nParts"],"method")):
+        if (testInfo.nParts == "method"):
             if (hasattr(cweTests,testName)):
                 outLog = getattr(getattr(cweTests,testName),testName)(self,binTest)
             else:
                 self.terminateAndExit (f"Calling unknown method <{testName}>.",exitCode=EXIT.Dev_Bug)
         else:
-            outLog = self.defaultUnixTest(testName, binTest, testsInfoSection)
+            outLog = self.defaultUnixTest(testName, binTest, testInfo)
 
         return outLog
 
@@ -51,20 +114,20 @@ class vulClassTester(cwesEvaluationCompatibilityLayer):
     def getPartHeader(self, iPart):
         return "-"*20 + "Part{:02d}: <TEST>".format(iPart+1) + "-"*20 + "\n"
 
-    def defaultUnixTest(self, testName, binTest, testsInfoSection):
+    def defaultUnixTest(self, testName, binTest, testInfo):
         outLog = self.getTestHeader(testName)
 
-        for iPart in range(getSettingDict(self.vulClass,[testsInfoSection,testName,"unix","nParts"])):
+        defaultTimeout = 120 if (testInfo.extraUnixTimeout) else 60
+        for iPart in range(testInfo.nParts):
             outLog += self.getPartHeader(iPart)
-            if ("extraUnixTimeout" in getSettingDict(self.vulClass,[testsInfoSection,testName])):
-                timeout = 120
-            else:
-                timeout = 60
-            # Redirect test output to a file to separate test output from kmesg
-            # and shell output
-            _,textBack,isTimeout,_ = self.runCommand(f"./{binTest} {iPart+1} "
-                                                     f"{self.redirectOp} {RM_OUTPUT_FILE}",
-                                        exitOnError=False,suppressErrors=True,timeout=timeout)
+            timeout, isLearned = self.getPartTimeout(testName, iPart, defaultTimeout)
+            textBack, isTimeout = self.runPart(testName, binTest, iPart, timeout, isLearned)
+            if (isTimeout and isLearned and (not self.isKnownHang(testName, iPart))):
+                # It used to complete: a kill at the learned bound would change its score
+                warnAndLog(f"{testName}: Part{iPart+1:02d} hit its learned timeout of {timeout} seconds. "
+                           f"Re-running it with the default timeout of {defaultTimeout} seconds.",doPrint=False)
+                self.runCommand("echo \"<PART-DONE>\"",exitOnError=False,suppressErrors=True,timeout=15)
+                textBack, isTimeout = self.runPart(testName, binTest, iPart, defaultTimeout, False)
             # Add test output to log before any kmesg or shell output
             outLog += self.typCommand(f"cat {RM_OUTPUT_FILE}")
             outLog += textBack
@@ -74,17 +137,29 @@ class vulClassTester(cwesEvaluationCompatibilityLayer):
                 outLog += self.getGdbOutput()
 
             outLog += self.PART_FOOTER
-            time.sleep (1)
+            # Instead of a blind sleep, wait until the shell prompts again after any kernel messages
+            self.runCommand("echo \"<PART-DONE>\"",exitOnError=False,suppressErrors=True,timeout=15)
+        self.savePartsHistory()
         return outLog
 
+    def runPart(self, testName, binTest, iPart, timeout, isLearned):
+        """ returns (textBack, isTimeout). A kill at a learned timeout is not recorded as a hang. """
+        # Redirect test output to a file to separate test output from kmesg
+        # and shell output
+        startTime = time.time()
+        _,textBack,isTimeout,_ = self.runCommand(f"./{binTest} {iPart+1} "
+                                                 f"{self.redirectOp} {RM_OUTPUT_FILE}",
+                                    exitOnError=False,suppressErrors=True,timeout=timeout)
+        self.recordPart(testName, iPart, time.time()-startTime, isTimeout, isLearned=(isTimeout and isLearned))
+        return (textBack, isTimeout)
+
     def testToMultitaskingObj(self, binTest):
-        testName, testsInfoSection = self.getTestNameAndInfoSection(binTest)
-        if (hasMultitaskingException(self.vulClass,
-                                     [testsInfoSection, testName])):
+        testName, testInfo = self.getTestNameAndInfo(binTest)
+        if (testInfo.hasMultitaskingException):
             # Test is disabled for multitasking on this OS
             return None
         parts = []
-        for iPart in range(getSettingDict(self.vulClass,[testsInfoSection,testName,"unix","nParts"])):
+        for iPart in range(testInfo.nParts):
             parts.append(multitaskingPart(self.getPartHeader(iPart),
                                           self.PART_FOOTER,
                                           f"./{binTest} {iPart+1}"))
@@ -4,12 +4,24 @@ scoring the CWEs
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # """
 import os, glob, sys
 from importlib.machinery import SourceFileLoader
-import enum, re
+import enum, re, array, operator
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from besspin.base.utils.misc import *
 import besspin.base.config
 
 VUL_CLASSES = ["bufferErrors", "PPAC", "resourceManagement", "informationLeakage", "numericErrors", "hardwareSoC", "injection"]
 
+# Bump when the format of the cached score rows changes
+SCORES_CACHE_VERSION = 2
+
+# The global settings read by the scorers, in addition to the class settings
+SCORING_CONTEXT_SETTINGS = ['osImage', 'target', 'isUnix', 'osDiv', 'runningMultitaskingTests',
+                            'useCustomScoring', 'cwesAssessments']
+
+_scorerVersions = dict()
+
 class SCORES (enum.Enum):
     """
     An enum representing the possible score values for a CWE test.
@@ -52,10 +64,7 @@ class SCORES (enum.Enum):
         operations. Average will thus never yield DETECTED, but rather NONE. So you can see individual test parts be
         scored DETECTED, but the overall CWE score will be NONE.
         """
-        if (self.name == "DETECTED"):
-            return self.__class__["NONE"]._value_
-        else:
-            return self._value_
+        return SCORE_CODES[self]
 
     def __lt__(self, other):
         """
@@ -71,7 +80,9 @@ class SCORES (enum.Enum):
             True iff the integer value of <self> is less than the integer value
             of <other>.
         """
-        if (str(self.__class__) == str(other.__class__)):
+        if (other.__class__ is self.__class__):
+            return SCORE_CODES[self] < SCORE_CODES[other]
+        if (str(self.__class__) == str(other.__class__)): #e.g. a SCORES from a re-loaded module
             return self.value < other.value
         logAndExit (f"SCORES: __lt__ not implemented for inputs of type {type(self)} and {type(other)}.",exitCode=EXIT.Dev_Bug)
 
@@ -89,7 +100,9 @@ class SCORES (enum.Enum):
             True iff the integer value of <self> is greater than the integer
             value of <other>.
         """
-        if (str(self.__class__) == str(other.__class__)):
+        if (other.__class__ is self.__class__):
+            return SCORE_CODES[self] > SCORE_CODES[other]
+        if (str(self.__class__) == str(other.__class__)): #e.g. a SCORES from a re-loaded module
             return self.value > other.value
         logAndExit (f"SCORES: __lt__ not implemented for inputs of type {type(self)} and {type(other)}.",exitCode=EXIT.Dev_Bug)
 
@@ -117,11 +130,7 @@ class SCORES (enum.Enum):
         --------
             The lowest SCORES object in <scoreList>.
         """
-        minScore = SCORES.INF
-        for xScore in scoreList:
-            if (xScore < minScore):
-                minScore = xScore
-        return minScore
+        return SCORES.minScores([scoreList])[0]
 
     @classmethod
     def avgScore (cls,scoreList):
@@ -137,20 +146,81 @@ class SCORES (enum.Enum):
         --------
             The average SCORES object in <scoreList>.
         """
-        sumScores = 0
-        for xScore in scoreList:
-            sumScores += xScore.value
-        return ( cls(sumScores//len(scoreList)), sumScores/len(scoreList) )
+        return cls.avgScores([scoreList])[0]
 
     @classmethod
     def weightedAvgScore (cls, scoreList, partsWeights):
-        minScore = cls.minScore(scoreList)
-        if (minScore < cls.HIGH): #One of the parts has an error --> error
-            return (minScore, minScore.value)
-        sumScores = 0
-        for xScore, xWeight in zip(scoreList, partsWeights):
-            sumScores += xWeight * xScore.value
-        return ( cls(sumScores//sum(partsWeights)), sumScores/sum(partsWeights) )
+        return cls.weightedAvgScores([scoreList], [partsWeights])[0]
+
+    @staticmethod
+    def toCodes (scoreList):
+        """
+        Convert a list of scores to their integer codes (the score values).
+
+        RETURNS:
+        --------
+            An array of signed bytes.
+        """
+        return array.array('b', map(SCORE_CODES.__getitem__, scoreList))
+
+    @staticmethod
+    def fromCode (code):
+        """
+        Convert an integer code back to its SCORES object. DETECTED shares the code
+        of NONE, so an average of valid parts is never DETECTED.
+        """
+        try:
+            return CODE_SCORES[code]
+        except KeyError:
+            raise ValueError(f"{code} is not a valid SCORES code")
+
+    @staticmethod
+    def minScores (columns):
+        """
+        The minScore of each column of parts scores, in one pass over the codes.
+        Like minScore, the first of the equal lowest scores is returned (so an all
+        DETECTED column stays DETECTED).
+        """
+        return [min(column, key=SCORE_CODES.__getitem__, default=SCORES.INF) for column in columns]
+
+    @classmethod
+    def avgScores (cls, columns):
+        """
+        The avgScore of each column of parts scores.
+
+        RETURNS:
+        --------
+            A list of (floored SCORES, exact average) tuples.
+        """
+        ret = []
+        for codes in map(cls.toCodes, columns):
+            sumCodes = sum(codes)
+            ret.append((cls.fromCode(sumCodes//len(codes)), sumCodes/len(codes)))
+        return ret
+
+    @classmethod
+    def weightedAvgScores (cls, columns, weightsColumns):
+        """
+        The weightedAvgScore of each column of parts scores, with the parts weights
+        of each column. A column with an error part (lower than HIGH) gets its
+        lowest score.
+
+        RETURNS:
+        --------
+            A list of (floored SCORES, exact weighted average) tuples.
+        """
+        ret = []
+        for column, weights in zip(columns, weightsColumns):
+            codes = cls.toCodes(column)
+            minCode = min(codes, default=SCORE_CODES[SCORES.INF])
+            if (minCode < SCORE_CODES[SCORES.HIGH]): #One of the parts has an error --> error
+                minScore = cls.minScores([column])[0]
+                ret.append((minScore, minCode))
+                continue
+            sumScores = sum(map(operator.mul, weights, codes))
+            sumWeights = sum(weights)
+            ret.append((cls.fromCode(sumScores//sumWeights), sumScores/sumWeights))
+        return ret
 
     @classmethod
     def toScore (cls, strScore):
@@ -173,10 +243,199 @@ class SCORES (enum.Enum):
         """
         Normalize the exact score (2nd score column)
         """
-        return scoreVal/cls.DETECTED.value
+        return scoreVal/SCORE_CODES[cls.DETECTED]
+
+    @classmethod
+    def normalizeAll (cls, scoreVals):
+        """
+        Normalize a column of exact scores
+        """
+        maxCode = SCORE_CODES[cls.DETECTED]
+        return [scoreVal/maxCode for scoreVal in scoreVals]
+
+# The integer codes of the scores, used for all the arithmetic. SCORES remains the presentation
+# layer: the aggregation only converts back to a SCORES object once per result.
+SCORE_CODES = {xScore : (xScore._value_ if (xScore is not SCORES.DETECTED) else SCORES.NONE._value_)
+                for xScore in SCORES}
+CODE_SCORES = {xScore._value_ : xScore for xScore in SCORES}
 
 @decorate.debugWrap
-def scoreTests(vulClass, logsDir, title, doPrint=True, reportFileName="scoreReport.log"):
+def getScorerVersion(vulClass):
+    """
+    A digest of the sources that can affect the scores of <vulClass>: the class
+    scorer package, the shared scoring utilities, and this module.
+    """
+    if (vulClass not in _scorerVersions):
+        cwesEvaluationDir = os.path.join(getSetting("repoDir"),"besspin","cwesEvaluation")
+        vulClassDir = os.path.join(cwesEvaluationDir,vulClass)
+        sources = sorted(glob.glob(os.path.join(vulClassDir,"*.py")) + glob.glob(os.path.join(vulClassDir,"*.json"))
+                    + glob.glob(os.path.join(vulClassDir,"customCweScores","*.py"))
+                    + glob.glob(os.path.join(cwesEvaluationDir,"utils","*.py"))
+                    + [os.path.join(cwesEvaluationDir,"scoreTests.py")])
+        xHash = hashlib.sha256()
+        for source in sources:
+            try:
+                with open(source, 'rb') as fSource:
+                    xHash.update(os.path.relpath(source,cwesEvaluationDir).encode('utf-8'))
+                    xHash.update(fSource.read())
+            except Exception as exc:
+                logAndExit(f"<getScorerVersion> Failed to read <{source}>.",exc=exc,exitCode=EXIT.Files_and_paths)
+        _scorerVersions[vulClass] = xHash.hexdigest()
+    return _scorerVersions[vulClass]
+
+def isScoredByCount(vulClass):
+    """ True if the scores of <vulClass> come from the bufferErrors tabulation (not the self-assessment) """
+    return ((vulClass == 'bufferErrors') and (not isEnabledDict(vulClass,'useSelfAssessment')))
+
+@decorate.debugWrap
+def getScorerInputs(vulClass, logs):
+    """ The files, other than the logs, that the scorer of <vulClass> reads """
+    if (isScoredByCount(vulClass)): # the parameters of the generated tests
+        return [os.path.join(getSetting('buildDir'),'bufferErrors',f"{name}.c") for name, _ in logs]
+    return []
+
+@decorate.debugWrap
+def getScorerOutputs(vulClass):
+    """ The files written by the scorer of <vulClass>. They are cached with the scores, and restored on a hit. """
+    if (isScoredByCount(vulClass) and isEnabledDict('bufferErrors','csvFile')):
+        from besspin.cwesEvaluation.bufferErrors.count import getCsvPath
+        return [getCsvPath()]
+    return []
+
+def hashFile(filePath, exitIfMissing=True):
+    """ The sha256 of the contents of <filePath>, or None if it is missing and <exitIfMissing> is disabled """
+    if ((not exitIfMissing) and (not os.path.isfile(filePath))):
+        return None
+    try:
+        with open(filePath, 'rb') as fIn:
+            return hashlib.sha256(fIn.read()).hexdigest()
+    except Exception as exc:
+        logAndExit(f"<scoreTests> Failed to read <{filePath}>.",exc=exc,exitCode=EXIT.Files_and_paths)
+
+@decorate.debugWrap
+def getScoresCachePath(vulClass, logs):
+    """
+    Returns the cache file of the scores of <logs>, or None if the scoring context
+    cannot be hashed. The key covers the logs contents, the other files the scorer
+    reads, the scorer version, and the settings the scorers read, so any change to
+    them is a cache miss. There is one entry per logs directory, not per log: the
+    scorers aggregate the logs into rows per CWE, so a changed log re-scores the class.
+    """
+    context = {setting : getSetting(setting) for setting in SCORING_CONTEXT_SETTINGS if doesSettingExist(setting)}
+    # The tests index is derived from the class settings, which are hashed anyway
+    context[vulClass] = {key : val for key, val in getSetting(vulClass).items() if (key != 'testsIndex')}
+    if (isEnabled('useCustomScoring')):
+        context['customizedScoring'] = getSetting('customizedScoring')
+        if (isEnabledDict('customizedScoring','useCustomFunction')):
+            context['customFunction'] = hashlib.sha256(
+                        ''.join(ftReadLines(getSettingDict('customizedScoring','pathToCustomFunction'),
+                        splitLines=False)).encode('utf-8')).hexdigest()
+    logsHashes = [[name, hashFile(log)] for name, log in logs]
+    # A missing input is hashed as None; the scorer reports it
+    inputsHashes = [[os.path.basename(xInput), hashFile(xInput, exitIfMissing=False)]
+                        for xInput in getScorerInputs(vulClass, logs)]
+    try:
+        key = hashJsonData([SCORES_CACHE_VERSION, vulClass, getScorerVersion(vulClass), context, logsHashes,
+                            inputsHashes])
+    except Exception as exc:
+        printAndLog(f"<scoreTests> The scoring context of <{vulClass}> cannot be hashed. Not caching. "
+                    f"[{formatExc(exc)}]",doPrint=False)
+        return None
+    return os.path.join(getCacheDir('scores'), f"{vulClass}-{key}.json")
+
+@decorate.debugWrap
+def scoreLogs(vulClass, logsDir):
+    """
+    Score all test logs in <logsDir> using the <vulClass> scorer, or the cached
+    result of a previous identical scoring.
+
+    RETURNS:
+    --------
+        The sorted rows returned by the scorer <scoreAllTests>.
+    """
+    logs = [(os.path.basename(f).split('.')[0], f) for f in sorted(glob.glob(os.path.join(logsDir, '*.log')))]
+    cachePath = getScoresCachePath(vulClass, logs) if isEnabled('useScoresCache') else None
+    outputs = getScorerOutputs(vulClass)
+    if ((cachePath is not None) and os.path.isfile(cachePath)):
+        try:
+            cached = safeLoadJsonFile(cachePath)
+            rows = [[row[0], SCORES[row[1]], row[2], row[3]] for row in cached['rows']]
+            # The scorer is skipped, so its outputs are rewritten from the cache
+            for output in outputs:
+                contents = cached['outputs'][os.path.basename(output)]
+                with open(output, 'w') as fOutput:
+                    fOutput.write(contents)
+            printAndLog(f"<scoreTests> Using the cached scores of <{logsDir}>.",doPrint=False)
+            return rows
+        except Exception as exc:
+            warnAndLog(f"<scoreTests> Failed to use the cached scores <{cachePath}>. Re-scoring.",
+                       exc=exc,doPrint=False)
+
+    for output in outputs: # Not to cache a stale output if the scorer does not write it
+        if (os.path.isfile(output)):
+            os.remove(output)
+    scorerModulePath = os.path.join(getSetting("repoDir"),"besspin","cwesEvaluation",vulClass,"cweScores.py")
+    try:
+        scorerModule = SourceFileLoader("cweScores",scorerModulePath).load_module()
+    except Exception as exc:
+        logAndExit(f"Failed to load the <cweScores> module for <{vulClass}>.",exc=exc,exitCode=EXIT.Dev_Bug)
+    rows = sorted([list(row) for row in scorerModule.scoreAllTests(logs)])
+
+    if (cachePath is not None):
+        cached = {'rows' : [[row[0], row[1].name, row[2], row[3]] for row in rows], 'outputs' : dict()}
+        for output in outputs:
+            if (not os.path.isfile(output)): # e.g. no logs to tabulate
+                cachePath = None
+                break
+            cached['outputs'][os.path.basename(output)] = ftReadLines(output,splitLines=False)
+    if (cachePath is not None):
+        atomicDumpJsonFile(cached, cachePath)
+    return rows
+
+def scoreLogsWorker(vulClass, logsDir):
+    """ Runs in a forked scoring process; the settings are inherited from the parent """
+    return scoreLogs(vulClass, logsDir)
+
+@decorate.debugWrap
+@decorate.timeWrap
+def scoreTestsBatch(jobs):
+    """
+    Score several logs directories in parallel, then write their outputs in order.
+    The jobs whose scorer writes files (see <getScorerOutputs>) share these files,
+    so they are scored one at a time, in order, with the outputs.
+
+    ARGUMENTS:
+    ----------
+        jobs : List of Dict
+            The keyword arguments of <scoreTests> for each directory to score.
+
+    RETURNS:
+    --------
+        The list of the <scoreTests> return values, in the order of <jobs>.
+    """
+    nWorkers = getSetting('scoringWorkers') or os.cpu_count() or 1
+    nWorkers = min(nWorkers, len(jobs))
+    jobsRows = [None] * len(jobs)
+    if (nWorkers > 1):
+        try:
+            with ProcessPoolExecutor(max_workers=nWorkers,
+                                     mp_context=multiprocessing.get_context('fork')) as pool:
+                futures = {iJob : pool.submit(scoreLogsWorker, job['vulClass'], job['logsDir'])
+                            for iJob, job in enumerate(jobs) if (not getScorerOutputs(job['vulClass']))}
+                for iJob, future in futures.items():
+                    jobsRows[iJob] = future.result()
+        except BrokenProcessPool as exc:
+            # A scorer exited; score the rest here so that the error is reported normally
+            warnAndLog("<scoreTestsBatch> A scoring process failed. Scoring the rest sequentially.",
+                       exc=exc,doPrint=False)
+
+    results = []
+    for job, rows in zip(jobs, jobsRows):
+        results.append(scoreTests(**job, rows=rows))
+    return results
+
+@decorate.debugWrap
+def scoreTests(vulClass, logsDir, title, doPrint=True, reportFileName="scoreReport.log", rows=None):
     """
     Score all test logs in a given directory.
 
@@ -197,6 +456,9 @@ def scoreTests(vulClass, logsDir, title, doPrint=True, reportFileName="scoreRepo
         reportFileName : String
             File to append score tables to.
 
+        rows : Optional List
+            Rows already computed by <scoreLogs>. If <None>, the logs are scored here.
+
     SIDE-EFFECTS:
     -------------
         - Appends score tables to ${workDir}/<reportFileName>.
@@ -226,14 +488,8 @@ def scoreTests(vulClass, logsDir, title, doPrint=True, reportFileName="scoreRepo
         scoresDict = getSettingDict("cweScores",vulClass)
     fScoresReport = ftOpenFile(reportFilePath, 'a')
 
-    # Get all the log files
-    logs = [(os.path.basename(f).split('.')[0], f) for f in sorted(glob.glob(os.path.join(logsDir, '*.log')))]
-    scorerModulePath = os.path.join(getSetting("repoDir"),"besspin","cwesEvaluation",vulClass,"cweScores.py")
-    try:
-        scorerModule = SourceFileLoader("cweScores",scorerModulePath).load_module()
-    except Exception as exc:
-        logAndExit(f"Failed to load the <cweScores> module for <{vulClass}>.",exc=exc,exitCode=EXIT.Dev_Bug)
-    rows = sorted(scorerModule.scoreAllTests(logs))
+    if (rows is None):
+        rows = scoreLogs(vulClass, logsDir)
     if (len(rows) < 1): #nothing to score
         warnAndLog("<scoreTests>: There are no logs to score.")
     else:
@@ -245,11 +501,12 @@ def scoreTests(vulClass, logsDir, title, doPrint=True, reportFileName="scoreRepo
         if (vulClass not in ["bufferErrors", "informationLeakage"]):
             xConfig.add_section(besspin.base.config.CWES_ENABLED_TESTS_SECTION)
         try:
+            percVals = SCORES.normalizeAll([row[2] for row in rows]) #Normalize to get percentages
             for iRow in range(len(rows)):
                 cweName = f"{'-'.join(rows[iRow][0].split('-')[1:])}"
                 cweNameD = cweName.replace('-','_')
                 rows[iRow][0] = rows[iRow][0].replace("TEST","CWE") #To ensure consistency
-                percVal = SCORES.normalize(rows[iRow][2]) #Normalize to get percentage
+                percVal = percVals[iRow]
                 scoresDict[cweNameD] = (rows[iRow][1],percVal) #Store both of them 
                 if (percVal < 0): # failure
                     rows[iRow][2] = '-'
@@ -39,8 +39,12 @@ def isVulClassException(vulClass):
     return True #passed all checks
 
 @decorate.debugWrap
-def computeBesspinScale():
-    """ Compute the BESSPIN scale following the document: $repo/docs/cwesEvaluation/BESSPIN-Scale.pdf """
+def computeBesspinScale(doReport=True):
+    """
+    Compute the BESSPIN scale following the document: $repo/docs/cwesEvaluation/BESSPIN-Scale.pdf
+    Returns (besspinCoeffs, vulClassesScores, B), or None if the scale cannot be computed.
+    If <doReport> is False, the table is neither displayed nor appended to the report.
+    """
     # Will do the following:
     # 1. Compute the BESSPIN coefficients values (from ./besspinCoeffs.json)
     # 2. Compute the categories scores
@@ -133,14 +137,16 @@ def computeBesspinScale():
             break
 
     # Display and Report
-    reportFileName = os.path.join(getSetting("workDir"), "scoreReport.log")
-    fScoresReport = ftOpenFile(reportFileName, 'a')
-    try:
-        for row in tabulate(besspinCoeffs, vulClassesScores, B):
-            printAndLog(row, tee=fScoresReport)
-    except Exception as exc:
-        errorAndLog(f"computeBesspinScale: Failed to tabulate the results.",exc=exc)   
-    fScoresReport.close()
+    if (doReport):
+        reportFileName = os.path.join(getSetting("workDir"), "scoreReport.log")
+        fScoresReport = ftOpenFile(reportFileName, 'a')
+        try:
+            for row in tabulate(besspinCoeffs, vulClassesScores, B):
+                printAndLog(row, tee=fScoresReport)
+        except Exception as exc:
+            errorAndLog(f"computeBesspinScale: Failed to tabulate the results.",exc=exc)   
+        fScoresReport.close()
+    return (besspinCoeffs, vulClassesScores, B)
 
 @decorate.debugWrap
 def tabulate(besspinCoeffs, vulClassesScores, B):
@@ -14,14 +14,18 @@ def normalizeToComputation (cls, score):
     """
 
 @decorate.debugWrap
-def computeNaiveCWEsTally():
+def computeNaiveCWEsTally(doReport=True):
     """
     Compute the Naive CWEs tally scores following the document: $repo/docs/cwesEvaluation/besspinPhilosophy.md
 
     SIDE-EFFECTS:
     -------------
-        - Displays the tally scores table
-        - Append <${workDir}/scoreReport.log> with the table
+        - If <doReport>: Displays the tally scores table
+        - If <doReport>: Append <${workDir}/scoreReport.log> with the table
+
+    RETURNS:
+    --------
+        (vulClassesScores, ovrDetails), or None if the tally cannot be computed.
     """
     scoresDict = getSetting("cweScores")
     vulClassesScores = {vulClass:{} for vulClass in VUL_CLASSES}
@@ -79,8 +83,8 @@ def computeNaiveCWEsTally():
         vulClassesScores[vulClass] = {"tally":vTally, "total":vCwesCount, "score":vScore}
 
     #The overall score
+    ovrScore = {}
     if (ovrCwesCount>0):
-        ovrScore = {}
         for tallyType in ["binary", "exact"]:
             ovrScore[tallyType] = ovrTally[tallyType] / ovrCwesCount
             if ((ovrScore[tallyType]<0) or (ovrScore[tallyType]>1)): # :mindblown:
@@ -99,14 +103,16 @@ def computeNaiveCWEsTally():
     ovrDetails = {"tally":ovrTally, "total":ovrCwesCount, "score":ovrScore}
 
     # Display and Report
-    reportFileName = os.path.join(getSetting("workDir"), "scoreReport.log")
-    fScoresReport = ftOpenFile(reportFileName, 'a')
-    try:
-        for row in tabulate(vulClassesScores, ovrDetails):
-            printAndLog(row, tee=fScoresReport) #printAndLog is ok in a try block because it doesn't exit in case of error
-    except Exception as exc:
-        errorAndLog(f"computeNaiveCWEsTally: Failed to tabulate the results.",exc=exc)   
-    fScoresReport.close()
+    if (doReport):
+        reportFileName = os.path.join(getSetting("workDir"), "scoreReport.log")
+        fScoresReport = ftOpenFile(reportFileName, 'a')
+        try:
+            for row in tabulate(vulClassesScores, ovrDetails):
+                printAndLog(row, tee=fScoresReport) #printAndLog is ok in a try block because it doesn't exit in case of error
+        except Exception as exc:
+            errorAndLog(f"computeNaiveCWEsTally: Failed to tabulate the results.",exc=exc)   
+        fScoresReport.close()
+    return (vulClassesScores, ovrDetails)
 
 @decorate.debugWrap
 def tabulate(vulClassesScores, ovrDetails):
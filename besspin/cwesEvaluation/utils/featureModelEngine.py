@@ -0,0 +1,249 @@
+#! /usr/bin/env python3
+"""  # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+In-process satisfiability engine for fmjson feature models.
+
+The model is compiled once into CNF clauses over integer literals (features are
+variables 1..nFeatures, auxiliary Tseitin variables follow). Queries are then
+answered by a small DPLL search under a list of assumed features, so there is no
+subprocess, serialization, or model copy per query.
+
+Only the constructs listed below are supported. Anything else raises
+UnsupportedFeatureModel, and featureModelUtil falls back to the external tool.
+    card  : on, off, opt
+    gcard : or, xor, mux, opt
+    expr  : feat, lit, op(and, or, not, imp, eqv, and binary xor/mux)
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # """
+
+class UnsupportedFeatureModel(Exception):
+    pass
+
+class FeatureModelEngine:
+    def __init__(self, fm):
+        self.features = list(fm['features'].keys())
+        self.varOf = {f : iFeat+1 for iFeat, f in enumerate(self.features)}
+        self.nFeatures = len(self.features)
+        self.nVars = self.nFeatures
+        self.clauses = []
+        self.trueVar = None
+        # Like all-configs, the mandatory features (equivalent to their parents) are not listed
+        self.configFeatures = [(f, self.varOf[f]) for f, feature in fm['features'].items()
+                                if (feature.get('card', 'opt') != 'on')]
+
+        self.compileHierarchy(fm)
+        for c in fm['constraints']:
+            self.clauses.append([self.compileExpr(c)])
+
+        # occurs[lit] lists the clauses that contain lit (negative lits at the end of the list)
+        self.occurs = [[] for _ in range(2*self.nVars+1)]
+        for iClause, clause in enumerate(self.clauses):
+            for lit in clause:
+                self.occurs[lit].append(iClause)
+
+        # The assignment implied by the model alone
+        self.baseAssign = [0] * (self.nVars+1)
+        self.isBaseSat = self.propagate(self.baseAssign, [], [lit for [lit] in self.unitClauses()])
+
+    # ---------------- compilation ----------------
+
+    def var(self, f):
+        try:
+            return self.varOf[f]
+        except KeyError:
+            raise UnsupportedFeatureModel(f"Unknown feature <{f}>")
+
+    def newVar(self):
+        self.nVars += 1
+        return self.nVars
+
+    def unitClauses(self):
+        return [clause for clause in self.clauses if len(clause) == 1]
+
+    def compileHierarchy(self, fm):
+        for f, feature in fm['features'].items():
+            x = self.var(f)
+            parent = feature.get('parent')
+            p = self.var(parent) if (parent is not None) else None
+            if (p is not None):
+                self.clauses.append([-x, p])
+            card = feature.get('card', 'opt')
+            if (card == 'on'):
+                self.clauses.append([x] if (p is None) else [-p, x])
+            elif (card == 'off'):
+                self.clauses.append([-x])
+            elif (card != 'opt'):
+                raise UnsupportedFeatureModel(f"Unsupported card <{card}> for <{f}>")
+
+            children = [self.var(c) for c in feature.get('children', [])]
+            gcard = feature.get('gcard', 'opt')
+            if (gcard in ['or', 'xor']) and children:
+                self.clauses.append([-x] + children)
+            elif (gcard in ['or', 'xor']): # A group that needs members but has none
+                self.clauses.append([-x])
+            if (gcard in ['xor', 'mux']):
+                for i in range(len(children)):
+                    for j in range(i+1, len(children)):
+                        self.clauses.append([-children[i], -children[j]])
+            elif (gcard not in ['or', 'opt']):
+                raise UnsupportedFeatureModel(f"Unsupported gcard <{gcard}> for <{f}>")
+
+    def compileExpr(self, c):
+        """ returns a literal equivalent to the expression c """
+        kind = c.get('kind')
+        if (kind == 'feat'):
+            return self.var(c['name'])
+        if (kind == 'lit'):
+            if (self.trueVar is None):
+                self.trueVar = self.newVar()
+                self.clauses.append([self.trueVar])
+            return self.trueVar if c['val'] else -self.trueVar
+        if (kind != 'op'):
+            raise UnsupportedFeatureModel(f"Unsupported constraint kind <{kind}>")
+
+        op = c.get('op')
+        args = [self.compileExpr(arg) for arg in c['args']]
+        if (op == 'not') and (len(args) == 1):
+            return -args[0]
+        if (op == 'and'):
+            return self.andGate(args)
+        if (op == 'or'):
+            return -self.andGate([-a for a in args])
+        if (op == 'imp') and (len(args) == 2):
+            return -self.andGate([args[0], -args[1]])
+        if (op == 'eqv') and (len(args) == 2):
+            return self.eqvGate(args[0], args[1])
+        if (op == 'xor') and (len(args) == 2):
+            return -self.eqvGate(args[0], args[1])
+        if (op == 'mux') and (len(args) == 2):
+            return -self.andGate(args)
+        raise UnsupportedFeatureModel(f"Unsupported operator <{op}> with {len(args)} arguments")
+
+    def andGate(self, args):
+        g = self.newVar()
+        for a in args:
+            self.clauses.append([-g, a])
+        self.clauses.append([g] + [-a for a in args])
+        return g
+
+    def eqvGate(self, a, b):
+        g = self.newVar()
+        self.clauses += [[-g, -a, b], [-g, a, -b], [g, a, b], [g, -a, -b]]
+        return g
+
+    # ---------------- search ----------------
+
+    def value(self, assign, lit):
+        return assign[lit] if (lit > 0) else -assign[-lit]
+
+    def propagate(self, assign, trail, lits):
+        """
+        Assigns lits then propagates the unit clauses. Every assigned variable is pushed
+        to trail. Returns False on conflict.
+        """
+        queue = list(lits)
+        while queue:
+            lit = queue.pop()
+            val = self.value(assign, lit)
+            if (val == 1):
+                continue
+            if (val == -1):
+                return False
+            assign[abs(lit)] = 1 if (lit > 0) else -1
+            trail.append(abs(lit))
+            for iClause in self.occurs[-lit]:
+                unassigned = None
+                nUnassigned = 0
+                for other in self.clauses[iClause]:
+                    otherVal = self.value(assign, other)
+                    if (otherVal == 1):
+                        break
+                    if (otherVal == 0):
+                        unassigned = other
+                        nUnassigned += 1
+                else:
+                    if (nUnassigned == 0):
+                        return False
+                    if (nUnassigned == 1):
+                        queue.append(unassigned)
+        return True
+
+    def undo(self, assign, trail, mark):
+        while (len(trail) > mark):
+            assign[trail.pop()] = 0
+
+    def search(self, assign, trail, onModel):
+        """
+        DFS over the feature variables. The auxiliary variables are fully determined by
+        propagation once all the features are assigned. onModel returns True to stop.
+        """
+        iVar = next((v for v in range(1, self.nFeatures+1) if (assign[v] == 0)), None)
+        if (iVar is None):
+            return onModel(assign)
+        for lit in [iVar, -iVar]:
+            mark = len(trail)
+            if (self.propagate(assign, trail, [lit]) and self.search(assign, trail, onModel)):
+                self.undo(assign, trail, mark)
+                return True
+            self.undo(assign, trail, mark)
+        return False
+
+    def assume(self, assumptions):
+        """ returns the (assign, trail) implied by the model plus the assumed features, or None """
+        if (not self.isBaseSat):
+            return None
+        assign = list(self.baseAssign)
+        trail = []
+        if (not self.propagate(assign, trail, [self.var(f) for f in assumptions])):
+            return None
+        return (assign, trail)
+
+    def findModel(self, assumptions=[]):
+        state = self.assume(assumptions)
+        if (state is None):
+            return None
+        found = []
+        def keep(assign):
+            found.append(list(assign))
+            return True
+        self.search(*state, keep)
+        return found[0] if found else None
+
+    # ---------------- queries ----------------
+
+    def checkSat(self, assumptions=[]):
+        return (self.findModel(assumptions) is not None)
+
+    def checkMust(self, features, assumptions=[]):
+        """ For each feature f: (model + assumptions) => f """
+        state = self.assume(assumptions)
+        if (state is None): # Vacuously true
+            return [True] * len(features)
+        assign, trail = state
+        witness = self.findModel(assumptions)
+        if (witness is None):
+            return [True] * len(features)
+
+        result = []
+        for f in features:
+            x = self.var(f)
+            if (assign[x] != 0):
+                result.append(assign[x] == 1)
+            elif (witness[x] == -1): # A model without f exists
+                result.append(False)
+            else:
+                mark = len(trail)
+                isSat = (self.propagate(assign, trail, [-x]) and self.search(assign, trail, lambda _: True))
+                self.undo(assign, trail, mark)
+                result.append(not isSat)
+        return result
+
+    def enumerate(self, assumptions=[]):
+        """ All the configurations as a list of {feature: bool} """
+        state = self.assume(assumptions)
+        if (state is None):
+            return []
+        configs = []
+        def collect(assign):
+            configs.append({f : (assign[x] == 1) for f, x in self.configFeatures})
+            return False
+        self.search(*state, collect)
+        return configs
@@ -6,11 +6,27 @@ import os
 import sys
 
 from besspin.base.utils.misc import *
+from besspin.cwesEvaluation.utils.featureModelEngine import FeatureModelEngine, UnsupportedFeatureModel
+
+"""
+The results derived from the models, memoized per process. The scorer modules are
+re-loaded by scoreTests on every scoreLogs, so they keep their memos here.
+"""
+_processMemos = dict()
+
+def getProcessMemo(namespace):
+    """ returns the dict memoizing <namespace> in this process """
+    return _processMemos.setdefault(namespace, dict())
 
 def makeFMJSONCstr(f):
     return { 'kind' : 'feat',
              'name' : f }
 
+def makeFMJSONNotCstr(f):
+    return { 'kind' : 'op',
+             'op'   : 'not',
+             'args' : [makeFMJSONCstr(f)] }
+
 def makeClaferCstr(f):
     return f"[ {f} ]"
 
@@ -35,6 +51,96 @@ def tryCheckJSON(cmd):
         logAndExit(f"<featureModelUtil> Unexpected or malformed JSON from <{cmd}>",
                    exc=exc)
 
+"""
+Query results are cached on disk (under <besspinCacheDir>/featureModel) and shared
+across runs. An entry is keyed by the hash of the model it was computed on, plus the
+hash of the query (kind + constraints). Bump FM_CACHE_VERSION to invalidate all entries.
+"""
+FM_CACHE_VERSION = 1
+
+def fmCachePath(fm, kind, query=None):
+    modelDir = os.path.join(getCacheDir('featureModel'), hashJsonData([FM_CACHE_VERSION, fm]))
+    try:
+        os.makedirs(modelDir, exist_ok=True)
+    except Exception as exc:
+        logAndExit(f"<featureModelUtil> Failed to create <{modelDir}>",
+                   exc=exc, exitCode=EXIT.Files_and_paths)
+    return os.path.join(modelDir, f"{kind}-{hashJsonData(query)}.json")
+
+def lookupFMCache(fm, kind, query=None):
+    """ returns (isHit, result) """
+    cacheFile = fmCachePath(fm, kind, query)
+    if (not os.path.isfile(cacheFile)):
+        return (False, None)
+    return (True, safeLoadJsonFile(cacheFile))
+
+def storeFMCache(fm, kind, query, result):
+    atomicDumpJsonFile(result, fmCachePath(fm, kind, query))
+
+"""
+When <useFeatureModelEngine> is enabled, queries are answered in-process by
+FeatureModelEngine. A model is compiled once; its top-level feature constraints (e.g.
+the ones appended by addConstraints) are treated as assumptions, so models that only
+differ by those share the same compiled engine. The engines are memoized on the model
+objects themselves (the models are never modified in place: addConstraints copies).
+A query the engine does not support is answered by the external tool. With
+<checkFeatureModelEngine>, the tool answers every query too, and its answer wins.
+"""
+_engines = dict() # (id of the features, ids of the other constraints) -> (model, engine)
+
+def getEngine(fm):
+    """ returns (engine, assumptions), or (None, None) to use the external tool """
+    if (not isEnabled('useFeatureModelEngine', default=False)):
+        return (None, None)
+    assumptions = [c['name'] for c in fm['constraints'] if (c['kind'] == 'feat')]
+    baseConstraints = [c for c in fm['constraints'] if (c['kind'] != 'feat')]
+    modelKey = (id(fm['features']), tuple(id(c) for c in baseConstraints))
+    if (modelKey not in _engines):
+        baseFm = dict(fm)
+        baseFm['constraints'] = baseConstraints
+        try:
+            engine = FeatureModelEngine(baseFm)
+        except UnsupportedFeatureModel as exc:
+            printAndLog(f"<featureModelUtil> Falling back to besspin-feature-model-tool: {exc}.",doPrint=False)
+            engine = None
+        _engines[modelKey] = (baseFm, engine) # The model is kept, so its ids are not reused
+    engine = _engines[modelKey][1]
+    if (engine is None):
+        return (None, None)
+    return (engine, assumptions)
+
+def engineAnswer(fm, engineQuery):
+    """ returns (isAnswered, engineQuery(engine, assumptions)) """
+    engine, assumptions = getEngine(fm)
+    if (engine is None):
+        return (False, None)
+    try:
+        return (True, engineQuery(engine, assumptions))
+    except UnsupportedFeatureModel as exc:
+        printAndLog(f"<featureModelUtil> Falling back to besspin-feature-model-tool for a query: {exc}.",doPrint=False)
+        return (False, None)
+
+def isToolNeeded(isAnswered):
+    return ((not isAnswered) or isEnabled('checkFeatureModelEngine', default=False))
+
+def checkedAnswer(kind, isAnswered, result, toolResult):
+    """ The engine's answer, unless the tool's answer was needed """
+    if (not isAnswered):
+        return toolResult
+    if (toolResult is None):
+        return result
+    normalize = lambda r: sorted(json.dumps(x, sort_keys=True) for x in r) if (kind == 'all-configs') else r
+    if (normalize(result) != normalize(toolResult)):
+        errorAndLog(f"<featureModelUtil> The engine and besspin-feature-model-tool disagree on a <{kind}> "
+                    f"query: <{result}> vs <{toolResult}>. Using the tool's answer.",doPrint=False)
+        return toolResult
+    return result
+
+def answerQuery(fm, kind, engineQuery, toolQuery):
+    isAnswered, result = engineAnswer(fm, engineQuery)
+    toolResult = toolQuery() if isToolNeeded(isAnswered) else None
+    return checkedAnswer(kind, isAnswered, result, toolResult)
+
 @decorate.debugWrap
 @decorate.timeWrap
 def claferOfFM(fm):
@@ -52,9 +158,8 @@ def claferOfFM(fm):
 @decorate.debugWrap
 @decorate.timeWrap
 def addConstraints(fm, cs):
-    fm = copy.deepcopy(fm)
-    for c in cs:
-        fm['constraints'].append(makeFMJSONCstr(c))
+    fm = dict(fm) # the features are shared, only the constraints list is new
+    fm['constraints'] = fm['constraints'] + [makeFMJSONCstr(c) for c in cs]
     return fm
 
 def dumpJSONToTemp(v,delete=True):
@@ -70,12 +175,67 @@ def dumpJSONToTemp(v,delete=True):
 @decorate.debugWrap
 @decorate.timeWrap
 def checkMust(fm, cs):
+    return answerQuery(fm, 'must', lambda engine, assumptions: engine.checkMust(cs, assumptions),
+                       lambda: toolCheckMust(fm, cs))
+
+def toolCheckMust(fm, cs):
+    isHit, r = lookupFMCache(fm, 'must', cs)
+    if (isHit):
+        return r
     temp = dumpJSONToTemp(fm)
     cmd = ["besspin-feature-model-tool", "check-req", temp.name] + cs
     r = tryCheckJSON(cmd)
     temp.close()
+    storeFMCache(fm, 'must', cs, r)
     return r
 
+@decorate.debugWrap
+@decorate.timeWrap
+def checkMustBatch(queries):
+    """
+    Given queries: list[(fmjson object, list[String])]
+    Return list[list[Bool]] R
+      such that R[i] == checkMust(*queries[i])
+    """
+    answers = [engineAnswer(fm, lambda engine, assumptions, cs=cs: engine.checkMust(cs, assumptions))
+                for fm, cs in queries]
+    toolIndices = [iQuery for iQuery, (isAnswered, _) in enumerate(answers) if isToolNeeded(isAnswered)]
+    toolResults = dict(zip(toolIndices, toolCheckMustBatch([queries[iQuery] for iQuery in toolIndices])))
+    return [checkedAnswer('must', isAnswered, result, toolResults.get(iQuery))
+            for iQuery, (isAnswered, result) in enumerate(answers)]
+
+def toolCheckMustBatch(queries):
+    """
+    All the uncached queries are answered by a single tool process:
+      f is required in FM <=> (FM `join` !f) is empty
+    """
+    results = [None] * len(queries)
+    fms = []
+    pending = []
+    for iQuery, (fm, cs) in enumerate(queries):
+        isHit, r = lookupFMCache(fm, 'must', cs)
+        if (isHit):
+            results[iQuery] = r
+            continue
+        pending.append(iQuery)
+        for c in cs:
+            fmNeg = dict(fm)
+            fmNeg['constraints'] = fm['constraints'] + [makeFMJSONNotCstr(c)]
+            fms.append(fmNeg)
+
+    if (pending):
+        temp = dumpJSONToTemp(fms)
+        cmd = ["besspin-feature-model-tool", "check-sat", temp.name]
+        sats = tryCheckJSON(cmd)
+        temp.close()
+        iSat = 0
+        for iQuery in pending:
+            fm, cs = queries[iQuery]
+            results[iQuery] = [ (not sat) for sat in sats[iSat:iSat+len(cs)] ]
+            iSat += len(cs)
+            storeFMCache(fm, 'must', cs, results[iQuery])
+    return results
+
 @decorate.debugWrap
 @decorate.timeWrap
 def checkSat(fm, css):
@@ -85,10 +245,29 @@ def checkSat(fm, css):
     Return list[Bool] R
       such that r[i] <=> (FM `join` CS[i] is non-empty)
     """
-    fms = [ addConstraints(fm, cs) for cs in css    ]
-    temp = dumpJSONToTemp(fms)
-    cmd = ["besspin-feature-model-tool", "check-sat", temp.name]
-    return tryCheckJSON(cmd)
+    return answerQuery(fm, 'sat', lambda engine, assumptions: [ engine.checkSat(assumptions + cs) for cs in css ],
+                       lambda: toolCheckSat(fm, css))
+
+def toolCheckSat(fm, css):
+    """ Only the uncached CS[i] are sent (in one batch) to the tool. """
+    results = [None] * len(css)
+    pending = []
+    for iCs, cs in enumerate(css):
+        isHit, r = lookupFMCache(fm, 'sat', cs)
+        if (isHit):
+            results[iCs] = r
+        else:
+            pending.append(iCs)
+
+    if (pending):
+        fms = [ addConstraints(fm, css[iCs]) for iCs in pending ]
+        temp = dumpJSONToTemp(fms)
+        cmd = ["besspin-feature-model-tool", "check-sat", temp.name]
+        sats = tryCheckJSON(cmd)
+        for iCs, sat in zip(pending, sats):
+            results[iCs] = sat
+            storeFMCache(fm, 'sat', css[iCs], sat)
+    return results
 
 def findParent(fm, f):
     p = fm['features'][f]['name']
@@ -114,10 +293,18 @@ def pruneFeatures(features, rootFeatures):
 @decorate.debugWrap
 @decorate.timeWrap
 def enumerateFM(fm):
+    return answerQuery(fm, 'all-configs', lambda engine, assumptions: engine.enumerate(assumptions),
+                       lambda: toolEnumerateFM(fm))
+
+def toolEnumerateFM(fm):
+    isHit, r = lookupFMCache(fm, 'all-configs')
+    if (isHit):
+        return r
     t = dumpJSONToTemp(fm, delete=False)
     cmd = ["besspin-feature-model-tool", "all-configs", t.name]
     r = tryCheckJSON(cmd)
     t.close()
+    storeFMCache(fm, 'all-configs', None, r)
     return r
 
 @decorate.debugWrap
@@ -136,7 +323,7 @@ def splitFM(fm, roots=None):
 
     models = []
     for root in roots:
-        fmForRoot = copy.deepcopy(fm)
+        fmForRoot = dict(fm) # all the pruned entries are replaced below
 
         prunedFs = pruneFeatures(fmForRoot['features'], features[root])
         prunedCs = pruneConstraints(fmForRoot['constraints'], features[root])
@@ -154,11 +341,16 @@ def loadFM(fn):
     f, ext = os.path.splitext(fn)
 
     if ext == ".cfr":
-        inFile = ftOpenFile(fn, "r")
-        text = inFile.read()
-        inFile.close()
+        # clafer's output only depends on the source, so it is cached by content
+        cachedFmJson = os.path.join(getCacheDir(os.path.join('featureModel','clafer')),
+                                    f"{computeMd5ForFile(fn)}.fm.json")
+        if os.path.isfile(cachedFmJson):
+            return safeLoadJsonFile(cachedFmJson)
         cmd  = ["clafer", "-s", "-o", "-m", "fmjson", fn ]
         text = tryCheckOutput(cmd)
+        fm = json.loads(text)
+        atomicDumpJsonFile(fm, cachedFmJson)
+        return fm
     elif ext == ".json" and os.path.splitext(f)[1] == ".fm":
         inFile = ftOpenFile(fn, "r")
         text = inFile.read()
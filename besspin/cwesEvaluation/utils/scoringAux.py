@@ -4,7 +4,8 @@ helpers functions for scoring the CWE tests
 
 from besspin.base.utils.misc import *
 from besspin.cwesEvaluation.scoreTests import SCORES, adjustToCustomScore
-import re
+from besspin.cwesEvaluation.utils.testsIndex import getTestInfo
+import re, functools
 
 def overallScore (listScores, dispName, msgIfNotImplemented="Not Implemented", 
         isSelfAssessment=False, msgIfSelfAssessment="Error - CWE text is not available", scoreString=None,
@@ -26,24 +27,82 @@ def overallScore (listScores, dispName, msgIfNotImplemented="Not Implemented",
 
     return [dispName, ovrScore, exactScore, scoreString]
 
+class KeywordsMatcher:
+    """
+    A set of keywords (regular expressions, as for re.search) compiled once into a single
+    alternation of lookaheads. One scan of the text yields every position where at least
+    one keyword matches; only the keywords that were not reported yet are then tried at
+    these few positions. This gives exactly the re.search answer of each keyword.
+    """
+    def __init__(self, keywords):
+        self.keywords = tuple(dict.fromkeys(keywords))
+        self.patterns = [re.compile(keyword) for keyword in self.keywords]
+        try:
+            self.scanner = re.compile('|'.join(f"(?=(?:{keyword}))" for keyword in self.keywords))
+        except re.error: # e.g. inline global flags in a keyword cannot be combined
+            self.scanner = None
+
+    def findAll(self, text):
+        """ returns {keyword: [start positions of its matches]} for the keywords found in text """
+        if (self.scanner is None):
+            return {keyword : [m.start() for m in pattern.finditer(text)]
+                        for keyword, pattern in zip(self.keywords, self.patterns) if pattern.search(text)}
+        hits = dict()
+        for m in self.scanner.finditer(text):
+            pos = m.start()
+            for keyword, pattern in zip(self.keywords, self.patterns):
+                if (pattern.match(text, pos) is not None):
+                    hits.setdefault(keyword, []).append(pos)
+        return hits
+
+    def findFirst(self, text):
+        """ returns {keyword: start position of its first match, or None} """
+        firstHits = dict.fromkeys(self.keywords)
+        if (self.scanner is None):
+            for keyword, pattern in zip(self.keywords, self.patterns):
+                m = pattern.search(text)
+                firstHits[keyword] = None if (m is None) else m.start()
+            return firstHits
+        pending = list(zip(self.keywords, self.patterns))
+        for m in self.scanner.finditer(text):
+            pos = m.start()
+            stillPending = []
+            for keyword, pattern in pending:
+                if (pattern.match(text, pos) is not None):
+                    firstHits[keyword] = pos
+                else:
+                    stillPending.append((keyword, pattern))
+            pending = stillPending
+            if (not pending):
+                break
+        return firstHits
+
+@functools.lru_cache(maxsize=256)
+def getKeywordsMatcher(keywords):
+    """ The matcher of a tuple of keywords is compiled once and shared by all the logs """
+    return KeywordsMatcher(keywords)
+
 def doesKeywordExistInLines (lines, keyword):
-    for line in lines:
-        if (keyword in line):
-            return True
-    return False
+    return doKeywordsExistInLines(lines, [keyword])[keyword]
+
+def doKeywordsExistInLines (lines, keywords):
+    """ Plain substring search (not regex) of each keyword in any of the lines """
+    if (len(lines) == 0):
+        return {keyword : False for keyword in keywords}
+    matcher = getKeywordsMatcher(tuple(re.escape(keyword) for keyword in keywords))
+    firstHits = matcher.findFirst('\n'.join(lines))
+    return {keyword : (firstHits[re.escape(keyword)] is not None) for keyword in keywords}
 
 def doKeywordsExistInText (logText, keywords):
-    keywordsDict = dict()
-    for keyword in keywords:
-        keywordsDict[keyword] = (re.search(keyword,logText) is not None)
-    return keywordsDict
+    firstHits = getKeywordsMatcher(tuple(keywords)).findFirst(logText)
+    return {keyword : (firstHits[keyword] is not None) for keyword in keywords}
 
 def defaultSelfAssessmentScoreAllTests (vulClass, logs):
     ret = []
     for testName, log in logs:
         dispName = testName.replace('_','-').upper()
         ret.append(overallScore([getSelfAssessmentScore(vulClass,testName)],dispName,isSelfAssessment=True,
-            msgIfSelfAssessment=getSettingDict(vulClass,["testsInfo",testName,"cweText"])))
+            msgIfSelfAssessment=getTestInfo(vulClass,testName).cweText))
     return ret
 
 def getSelfAssessmentScore (vulClass, testName):
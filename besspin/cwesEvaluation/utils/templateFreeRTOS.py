@@ -8,38 +8,60 @@ import copy
 
 from besspin.base.utils.misc import *
 
+# The declaration line of the test main (or of main_<testName> if it was already renamed)
+MAIN_DECLARATION_REGEX = re.compile(
+    r'^[^\S\n]*(?P<retType>void|int)[^\S\n]+main(?P<renamed>_\w+)?[^\S\n]*'
+    r'(?P<args>\([^)\n]*\))[^\S\n]*(?P<brace>\{?).*$', re.MULTILINE)
+
+# The placeholders of the wrapper template
+TEMPLATE_PLACEHOLDERS_REGEX = re.compile(r'MAIN_DECLARATION|TEST_NAME')
+
+def writeIfChanged (filePath, text):
+    """
+    Writes text to filePath unless it already has this content, so make does not rebuild it. This only
+    helps when the same directory is templated again (e.g. a manual rebuild of a work directory):
+    buildCwesEvaluation copies the sources into a fresh directory on each run, so all its files are new.
+    """
+    if (os.path.isfile(filePath) and (ftReadLines(filePath,splitLines=False) == text)):
+        return False
+    try:
+        fOut = ftOpenFile(filePath, "w")
+        fOut.write(text)
+        fOut.close()
+    except Exception as exc:
+        logAndExit(f"<templateFreeRTOS>: Failed to write <{filePath}>.",exc=exc,exitCode=EXIT.Files_and_paths)
+    return True
+
 def renameMain (testsDir,cTest):
-    lines = ftReadLines(f"{testsDir}/{cTest}")
-    (declMatch, declIndex) = matchExprInLines(r'^\s*(?P<retType>void|int)\s+main\s*(?P<args>\([^)]*\))\s*(?P<brace>\{?)\s*', lines, returnIndex=True)
-    if (not declIndex):
+    testName = cTest.split('.')[0]
+    text = ftReadLines(f"{testsDir}/{cTest}",splitLines=False)
+    declMatch = next((xMatch for xMatch in MAIN_DECLARATION_REGEX.finditer(text)
+                        if (xMatch.group('renamed') in [None, f"_{testName}"])), None)
+    if (declMatch is None):
         logAndExit("<templateFreeRTOS>: Failed to find the declaration in <{0}/{1}>.".format(testsDir,cTest))
     declParts = [declMatch.group('retType'),declMatch.group('args'),declMatch.group('brace')]
-    #1. change the file
-    testName = cTest.split('.')[0]
-    lines[declIndex] = "{0} main_{1} {2} {3}".format(declParts[0],testName,*declParts[1:])
-    try:
-        ftest = ftOpenFile("{0}/{1}".format(testsDir,cTest), "w")
-        ftest.write('\n'.join(lines))
-        ftest.close()
-    except Exception as exc:
-        logAndExit("<templateFreeRTOS>: Failed to open <{0}/{1}> for writing.".format(testsDir,cTest),exc=exc)
+    #1. change the file (a no-op if it was already renamed)
+    declLine = "{0} main_{1} {2} {3}".format(declParts[0],testName,*declParts[1:])
+    writeIfChanged(f"{testsDir}/{cTest}", text[:declMatch.start()] + declLine + text[declMatch.end():])
     #2. return the declaration
     return "{0} main_{1} {2}".format(declParts[0],testName,declParts[1])
 
 
 def templateFreeRTOS(testsDir):
-    #Load the template 
+    #Load the template
     testTemplate = ftReadLines(getSetting("cweTestTemplateFreeRTOS"),splitLines=False)
 
+    #The tests, without the wrappers generated by a previous call
+    cFiles = set(cFile for cFile in os.listdir(testsDir) if cFile.endswith(".c"))
+    srcTests = sorted(cFile for cFile in cFiles
+                        if not (cFile.startswith("main_") and (cFile[len("main_"):] in cFiles)))
+
     #For each file: rename main + Generating the main_besspin wrapper
-    for srcTest in sorted(os.listdir(testsDir)):
-        if (srcTest.endswith(".c")):
-            testName = srcTest.split('.')[0]
-            mainDeclaration = renameMain(testsDir,srcTest)
-            #Customize the template
-            testLines = testTemplate.replace("MAIN_DECLARATION",mainDeclaration)
-            testLines = testLines.replace("TEST_NAME",testName)
-            #Write the test
-            fmain = ftOpenFile("{0}/main_{1}.c".format(testsDir,testName), "w")
-            fmain.write(testLines)
-            fmain.close()
+    nWritten = 0
+    for srcTest in srcTests:
+        testName = srcTest.split('.')[0]
+        placeholders = {"MAIN_DECLARATION" : renameMain(testsDir,srcTest), "TEST_NAME" : testName}
+        #Customize the template in one pass, and write the test only if it changed
+        testLines = TEMPLATE_PLACEHOLDERS_REGEX.sub(lambda xMatch: placeholders[xMatch.group(0)], testTemplate)
+        nWritten += int(writeIfChanged("{0}/main_{1}.c".format(testsDir,testName), testLines))
+    printAndLog(f"<templateFreeRTOS>: {nWritten}/{len(srcTests)} wrapper(s) of <{testsDir}> were (re)written.",doPrint=False)
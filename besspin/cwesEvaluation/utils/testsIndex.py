@@ -0,0 +1,86 @@
+#! /usr/bin/env python3
+"""  # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+Pre-parsed index of the tests metadata of a vulnerability class.
+
+The <testsInfo> and <funcTestsInfo> sections of the class setupEnv.json are
+compiled once at configuration time into frozen TestInfo objects, resolved for
+the configured OS. The test runners and scorers read plain attributes instead of
+walking the settings dicts per test and per part.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # """
+
+from besspin.base.utils.misc import *
+
+TESTS_INFO_SECTIONS = ["testsInfo", "funcTestsInfo"]
+
+class TestInfo:
+    """ The metadata of one test. Read-only once built. """
+    __slots__ = ['name', 'vulClass', 'section', 'cweText', 'nParts', 'scoreWeights',
+                 'extraUnixTimeout', 'multitaskingExceptions', 'hasMultitaskingException',
+                 'useDefaultScorer', 'documentationOnly', 'gfeScoringExceptions', 'cwes', 'info']
+
+    def __init__(self, vulClass, section, name, info, osDiv, osImage, cwes):
+        osInfo = info.get(osDiv, dict())
+        for attr, val in [
+                ('name', name),
+                ('vulClass', vulClass),
+                ('section', section),
+                ('cweText', info.get('cweText')),
+                # An int, the string 'method' for custom unix tests, or None
+                ('nParts', osInfo.get('nParts')),
+                ('scoreWeights', tuple(osInfo['scoreWeights']) if ('scoreWeights' in osInfo) else None),
+                ('extraUnixTimeout', ('extraUnixTimeout' in info)),
+                ('multitaskingExceptions', frozenset(info.get('multitaskingExceptions', []))),
+                ('hasMultitaskingException', (osImage in info.get('multitaskingExceptions', []))),
+                ('useDefaultScorer', ('useDefaultScorer' in info)),
+                ('documentationOnly', bool(info.get('documentationOnly', False))),
+                ('gfeScoringExceptions', tuple(info.get('gfeScoringExceptions', []))),
+                # The CWEs whose score depends on this test
+                ('cwes', tuple(cwes)),
+                # The raw section, for the class specific keys (e.g. the scoring keywords)
+                ('info', info)
+            ]:
+            object.__setattr__(self, attr, val)
+
+    def __setattr__(self, attr, val):
+        raise AttributeError(f"TestInfo <{self.name}> is read-only.")
+
+    def __repr__(self):
+        return f"TestInfo({self.vulClass}:{self.section}:{self.name}, nParts={self.nParts})"
+
+    @property
+    def isFuncTest(self):
+        return (self.section == "funcTestsInfo")
+
+@decorate.debugWrap
+def compileTestsIndex(vulClass):
+    """
+    Builds the index of <vulClass> from its loaded setupEnv.json settings and stores it
+    in ${vulClass}[<testsIndex>]. Must be called after the class settings are loaded.
+    """
+    osImage = getSetting('osImage')
+    osDiv = "unix" if isEnabled("isUnix") else "FreeRTOS"
+
+    funcTestsCwes = dict()
+    for cweTest, testInfo in getSettingDict(vulClass, "mapTestsToCwes", default=dict()).items():
+        for funcTest in testInfo.get("tests", []):
+            funcTestsCwes.setdefault(funcTest, []).append(cweTest)
+
+    index = dict()
+    for section in TESTS_INFO_SECTIONS:
+        for name, info in getSettingDict(vulClass, section, default=dict()).items():
+            if (name in index):
+                logAndExit(f"compileTestsIndex: <{vulClass}:{name}> is listed in more than one of "
+                           f"{TESTS_INFO_SECTIONS}.", exitCode=EXIT.Dev_Bug)
+            try:
+                cwes = [name] if (section == "testsInfo") else funcTestsCwes.get(name, [])
+                index[name] = TestInfo(vulClass, section, name, info, osDiv, osImage, cwes)
+            except Exception as exc:
+                logAndExit(f"compileTestsIndex: Failed to parse the metadata of <{vulClass}:{name}>.",
+                           exc=exc, exitCode=EXIT.Dev_Bug)
+
+    setSettingDict(vulClass, 'testsIndex', index)
+    return index
+
+def getTestInfo(vulClass, testName):
+    """ returns the TestInfo of <testName>, or None if the test has no metadata """
+    return getSettingDict(vulClass, 'testsIndex').get(testName)
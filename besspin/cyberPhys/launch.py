@@ -11,6 +11,7 @@ import besspin.cyberPhys.relaymanager
 import besspin.cyberPhys.watchdog
 import besspin.cyberPhys.commander
 from besspin.base.threadControl import ftQueueUtils
+from besspin.target.uartMux import startUartMultiplexer
 import threading, queue, pexpect, time
 
 @decorate.debugWrap
@@ -60,6 +61,7 @@ def startCyberPhys():
 
     # start/prepareEnv/Launch
     runThreadPerTarget(besspin.target.launch.startBesspin)
+    besspin.target.launch.dumpLaunchTimeline()
     printAndLog (f"BESSPIN <cyberPhys mode> is launched!")
 
     components = []
@@ -176,7 +178,8 @@ def runThreadPerTarget(func, tArgs=(), tKwargs=None, addTargetIdToKwargs=True,
             tKwargs['targetId'] = iTarget
         for kwargName,xSetting in mapTargetSettingsToKwargs:
             tKwargs[kwargName] = getSetting(xSetting,targetId=iTarget)
-        xThread = threading.Thread(target=func, args=tArgs, kwargs=tKwargs)
+        # Each thread gets its own copy, since the kwargs are updated for the next target
+        xThread = threading.Thread(target=func, args=tArgs, kwargs=dict(tKwargs))
         xThread.daemon = True
         getSetting('trash').throwThread(xThread,f"<{func.__name__}> for target{iTarget}")
         xThread.start()
@@ -200,9 +203,7 @@ def startUartPiping(targetId):
     uartPipePort = xTarget.findPort(portUse='uartFwdPort')
     setSetting('uartPipePort',uartPipePort,targetId=targetId)
     try:
-        xTarget.uartSocatProc = subprocess.Popen(
-            ['socat', 'STDIO,ignoreeof', f"TCP-LISTEN:{uartPipePort},reuseaddr,fork,max-children=1"],
-            stdout=xTarget.process.child_fd,stdin=xTarget.process.child_fd,stderr=xTarget.process.child_fd)
+        xTarget.uartMux = startUartMultiplexer(xTarget, uartPipePort, nameInfo=xTarget.targetIdInfo)
     except Exception as exc:
         xTarget.terminateAndExit(f"{xTarget.targetIdInfo}startUartPiping: Failed to start the piping.",
             exc=exc,exitCode=EXIT.Run)
@@ -216,9 +217,9 @@ def endUartPiping(targetId, doPrintWarning=False):
         warnAndLog(f"{xTarget.targetIdInfo}endUartPiping: The UART is not piped!",doPrint=doPrintWarning)
         return #The function gets called in case the uart was piped in the interactive mode
     try:
-        xTarget.uartSocatProc.kill() # No need for fancier ways as we use Popen with shell=False
+        xTarget.uartMux.stop()
     except Exception as exc:
-        warnAndLog(f"{xTarget.targetIdInfo}endUartPiping: Failed to kill the process.",exc=exc)
+        warnAndLog(f"{xTarget.targetIdInfo}endUartPiping: Failed to stop the piping.",exc=exc)
     setSetting('isUartPiped',False,targetId=targetId)
 
 
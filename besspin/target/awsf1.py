@@ -1,6 +1,13 @@
-import psutil, getpass
+import psutil, getpass, select, contextlib
 from besspin.target.common import *
 from besspin.target.fpga import fpgaTarget
+from besspin.target.syslogCollector import syslogCollector
+from besspin.target.uartMux import startUartMultiplexer
+
+# The jtag_vpi port of the simulation with +debug_enable (see openocd_firesim.cfg)
+FIRESIM_JTAG_VPI_PORT = 5555
+# Michigan P1 needs some time before the network hook can detect the UP event (it shows no sign of it)
+MICHIGAN_TAP_UP_DELAY = 20
 
 class firesimTarget(fpgaTarget, commonTarget):
     def __init__(self, targetId=None):
@@ -23,19 +30,22 @@ class firesimTarget(fpgaTarget, commonTarget):
 
         awsFiresimSimPath = os.path.join(getSetting('firesimPath'), 'sim')
         timeout = self.parseBootTimeoutDict (timeoutDict)
+        bootPhasesTimes = dict()
 
         # 0. Ensure the env is clear
-        self.noNonsenseFiresim()
+        with _timedPhase(bootPhasesTimes,'cleanup'):
+            self.noNonsenseFiresim()
         
-        # 1. Switch0
+        # 1. Switch0 (ready once it attached to the tap)
         self.fswitchOut = ftOpenFile(os.path.join(getSetting('workDir'),'switch0.out'),'ab')
 
-        try:
-            self.switch0Proc = pexpect.spawn(f"sudo ./switch0 {' '.join(self.switch0timing)}",logfile=self.fswitchOut,timeout=10,
-                                        cwd=awsFiresimSimPath)
-            self.switch0Proc.expect("Assuming tap0",timeout=10)
-        except Exception as exc:
-            self.terminateAndExit(f"boot: Failed to spawn the switch0 process.",overrideShutdown=True,exc=exc,exitCode=EXIT.Run)
+        with _timedPhase(bootPhasesTimes,'switch0'):
+            try:
+                self.switch0Proc = pexpect.spawn(f"sudo ./switch0 {' '.join(self.switch0timing)}",logfile=self.fswitchOut,timeout=10,
+                                            cwd=awsFiresimSimPath)
+                self.switch0Proc.expect("Assuming tap0",timeout=10)
+            except Exception as exc:
+                self.terminateAndExit(f"boot: Failed to spawn the switch0 process.",overrideShutdown=True,exc=exc,exitCode=EXIT.Run)
 
         # 2. fsim
         firesimCommand = ' '.join([
@@ -104,20 +114,31 @@ class firesimTarget(fpgaTarget, commonTarget):
             self.ttyProcess = pexpect.spawn(firesimCommand,logfile=self.fTtyOut,timeout=30,
                                         cwd=awsFiresimSimPath)
             self.process = self.ttyProcess
-            time.sleep(1)
         except Exception as exc:
             self.terminateAndExit(f"boot: Failed to spawn the firesim process.",overrideShutdown=True,exc=exc,exitCode=EXIT.Run)
+        if (not self.ttyProcess.isalive()):
+            self.terminateAndExit(f"boot: The firesim process exited right away.",overrideShutdown=True,exitCode=EXIT.Run)
 
         if (isEqSetting('mode','evaluateSecurityTests') or isEnabled('gdbDebug')):
-            self.expectFromTarget("Waiting for connection from gdb","Starting Firesim with GDB",timeout=30,overrideShutdown=True)
-            self.fpgaStart(getSetting('osImageElf'))
+            # The simulation is ready for openocd once it says so and its jtag_vpi socket is listening
+            with _timedPhase(bootPhasesTimes,'firesimDebug'):
+                self.expectFromTarget("Waiting for connection from gdb","Starting Firesim with GDB",timeout=30,overrideShutdown=True)
+                if (not _pollWithBackoff(lambda: not checkPort(FIRESIM_JTAG_VPI_PORT), maxTimeout=10)):
+                    self.terminateAndExit(f"boot: The firesim jtag_vpi port <{FIRESIM_JTAG_VPI_PORT}> is not listening.",
+                        overrideShutdown=True,exitCode=EXIT.Run)
+            with _timedPhase(bootPhasesTimes,'gdb'):
+                self.fpgaStart(getSetting('osImageElf'))
         
-        self.expectFromTarget(endsWith,"Booting",timeout=timeout,overrideShutdown=True)
+        with _timedPhase(bootPhasesTimes,'boot'):
+            self.expectFromTarget(endsWith,"Booting",timeout=timeout,overrideShutdown=True)
 
         # The tap needs to be turned up AFTER booting
-        if (isEqSetting('binarySource','Michigan')): #Michigan P1 needs some time before the network hook can detect the UP event
-            time.sleep(20)
-        setAdaptorUpDown(getSetting('awsf1TapAdaptorName'), 'up')
+        with _timedPhase(bootPhasesTimes,'tapUp'):
+            if (isEqSetting('binarySource','Michigan')):
+                time.sleep(MICHIGAN_TAP_UP_DELAY)
+            setAdaptorUpDown(getSetting('awsf1TapAdaptorName'), 'up')
+        printAndLog(f"boot: Phases times: {', '.join([f'{phase}={phaseTime:.2f}s' for phase, phaseTime in bootPhasesTimes.items()])}.",
+            doPrint=False)
 
     @decorate.debugWrap
     def interact(self):
@@ -192,18 +213,16 @@ class firesimTarget(fpgaTarget, commonTarget):
         def getAliveProcesses():
             return [proc for proc,wasKilled in wereProcessesKilled.items() if (not wasKilled)]
 
-        # kill processes
+        # kill processes (the ones found before, so that their exit can be waited for)
+        procsPids = {proc : _pgrep(proc) for proc in wereProcessesKilled}
         for proc in wereProcessesKilled:
             sudoShellCommand(['pkill', '-9', proc],check=False)
 
         # wait till the processes die
-        nWaits = 5
-        iWait = 0
-        while ((iWait < nWaits) and (not all(wereProcessesKilled.values()))):
-            time.sleep(1)
-            iWait += 1
-            for proc in getAliveProcesses():
-                wereProcessesKilled[proc] = (sudoShellCommand(['pgrep', proc],check=False).returncode != 0)
+        alivePids = _waitForPidsExit([pid for pids in procsPids.values() for pid in pids], timeout=5)
+        for proc in wereProcessesKilled:
+            wereProcessesKilled[proc] = ((not any(pid in alivePids for pid in procsPids[proc]))
+                                            and (len(_pgrep(proc)) == 0))
 
         if (not all(wereProcessesKilled.values())):    
             warnAndLog (f"Failed to kill <{','.join(getAliveProcesses())}>.",doPrint=False)
@@ -404,10 +423,10 @@ def configTapAdaptor():
     }
 
     def execSudoCommands (commandNames):
+        # The commands are synchronous; the resulting configuration is polled for below
         for xName in commandNames:
             for command in commands[xName]:
                 sudoShellCommand(command)
-                time.sleep(1)
 
     # Check if the adaptor exists
     if (getAddrOfAdaptor(tapAdaptor,'MAC',exitIfNoAddr=False) == 'NotAnAddress'):
@@ -421,9 +440,11 @@ def configTapAdaptor():
         execSudoCommands(['refresh','config'])
 
     # Check configuration
-    if (getAddrOfAdaptor(tapAdaptor,'IP') != getSetting('awsf1IpHost')):
+    if (not _pollWithBackoff(lambda: getAddrOfAdaptor(tapAdaptor,'IP',exitIfNoAddr=False) == getSetting('awsf1IpHost'),
+                maxTimeout=5)):
         logAndExit(f"configTapAdaptor: The <{tapAdaptor}> IP does not match <{getSetting('awsf1IpHost')}>",exitCode=EXIT.Network)
-    if (getAddrOfAdaptor(tapAdaptor,'MAC') != getSetting('awsf1TapAdaptorMacAddress')):
+    if (not _pollWithBackoff(lambda: getAddrOfAdaptor(tapAdaptor,'MAC',exitIfNoAddr=False) == getSetting('awsf1TapAdaptorMacAddress'),
+                maxTimeout=5)):
         logAndExit(f"configTapAdaptor: The <{tapAdaptor}> MAC address does not match <{getSetting('awsf1TapAdaptorMacAddress')}>",exitCode=EXIT.Network)
 
     if (isEqSetting('pvAWS','firesim')):
@@ -433,11 +454,24 @@ def configTapAdaptor():
     printAndLog (f"awsf1.configTapAdaptor: <{tapAdaptor}> is properly configured.",doPrint=False)
 
 @decorate.debugWrap
-def programAFI(doPrint=True):
+def programAFI(doPrint=True,forceProgramming=False):
     """ perform AFI Management Commands for f1.2xlarge """
     agfiId = getSetting("agfiId")
+    # The same AGFI loaded with other clock recipes (from agfi_id.json) is another image
+    image = {'agfiId' : agfiId, 'fpgaLoadExtraSettings' : getSetting('fpgaLoadExtraSettings', default=[])}
+    fingerprint = {'bootId' : getHostBootId()}
+    slots = [f"awsf1-slot{slotno}" for slotno in range(getNumFpgas())]
+    # Skip if the AFI is still loaded on all slots since we flashed it
+    if ((not forceProgramming) and all(isImageResident(slot, image, fingerprint) for slot in slots)
+            and all((getSlotAgfi(slotno) == agfiId) for slotno in range(len(slots)))):
+        printAndLog(f"<awsf1.programAFI>: All FPGAs are already loaded with agfi: {agfiId}.",doPrint=doPrint)
+        return
+    for slot in slots: # Unknown until flashed
+        setResidentImage(slot)
     clearFpgas(doPrint=doPrint)
     flashFpgas(agfiId,doPrint=doPrint)
+    for slot in slots:
+        setResidentImage(slot, image, fingerprint)
 
 @decorate.debugWrap
 def _sendKmsg(message):
@@ -446,28 +480,87 @@ def _sendKmsg(message):
     command = f"echo \"{message}\" | sudo tee /dev/kmsg"
     shellCommand(command, check=False, shell=True)
 
+@contextlib.contextmanager
+def _timedPhase(phasesTimes, phase):
+    """ records the time the block took in <phasesTimes[phase]> """
+    tStart = time.time()
+    try:
+        yield
+    finally:
+        phasesTimes[phase] = time.time() - tStart
+
+@decorate.debugWrap
+def _pgrep(procName):
+    """ returns the pids whose name matches <procName> (same matching as pkill) """
+    retPgrep = subprocess.run(['pgrep', procName], capture_output=True)
+    return [int(pid) for pid in retPgrep.stdout.decode('utf-8').split()]
+
+@decorate.debugWrap
+def _waitForPidsExit(pids, timeout=5):
+    """ waits for the exit notification of the processes (pidfd), and returns the pids that are still alive
+    after <timeout>. The processes are not our children, so waitpid cannot be used. """
+    pidfds = dict()
+    polledPids = [] # No pidfd support
+    for pid in pids:
+        try:
+            pidfds[os.pidfd_open(pid)] = pid
+        except ProcessLookupError: # already exited
+            continue
+        except (AttributeError, OSError):
+            polledPids.append(pid)
+    deadline = time.time() + timeout
+    poller = select.poll()
+    for pidfd in pidfds:
+        poller.register(pidfd, select.POLLIN)
+    while (pidfds and (time.time() < deadline)):
+        for pidfd, _ in poller.poll(max(deadline - time.time(), 0) * 1000):
+            poller.unregister(pidfd)
+            os.close(pidfd)
+            del pidfds[pidfd]
+    for pidfd in pidfds:
+        os.close(pidfd)
+    _pollWithBackoff(lambda: not any(psutil.pid_exists(pid) for pid in polledPids), maxTimeout=max(deadline - time.time(), 0))
+    return list(pidfds.values()) + [pid for pid in polledPids if psutil.pid_exists(pid)]
+
+@decorate.debugWrap
+def _pollWithBackoff(predicate, maxTimeout=10, firstInterval=0.05, maxInterval=1):
+    """ polls <predicate> with an exponentially growing interval until it is true (returns True) or
+    <maxTimeout> seconds passed (returns False) """
+    deadline = time.time() + maxTimeout
+    interval = firstInterval
+    while (True):
+        if (predicate()):
+            return True
+        if (time.time() >= deadline):
+            return False
+        time.sleep(min(interval, max(deadline - time.time(), 0)))
+        interval = min(2*interval, maxInterval)
+
 @decorate.debugWrap
 @decorate.timeWrap
-def _poll_command(command, trigger, maxTimeout=10):
-    for i in range(maxTimeout):
-        out = subprocess.getoutput(command)
-        if trigger not in out:
-            time.sleep(1)
-        else:
-            return
-    logAndExit(f"<awsf1._poll_command>: command <{command}> timed out <{maxTimeout} attempts> on trigger <{trigger}>")
+def _poll_command(command, trigger, maxTimeout=10, exitOnError=True):
+    if (_pollWithBackoff(lambda: trigger in subprocess.getoutput(command), maxTimeout=maxTimeout)):
+        return True
+    if (exitOnError):
+        logAndExit(f"<awsf1._poll_command>: command <{command}> timed out <{maxTimeout} seconds> on trigger <{trigger}>")
+    errorAndLog(f"<awsf1._poll_command>: command <{command}> timed out <{maxTimeout} seconds> on trigger <{trigger}>",
+        doPrint=False)
+    return False
 
 @decorate.debugWrap
 def clearFpga(slotno):
-    """clear FPGA in a given slot id and wait until finished """
+    """clear FPGA in a given slot id and wait until finished. Returns whether it succeeded. """
     _sendKmsg(f"about to clear fpga {slotno}")
-    shellCommand(['fpga-clear-local-image','-S',f"{slotno}",'-A'])
+    if (shellCommand(['fpga-clear-local-image','-S',f"{slotno}",'-A'],check=False).returncode != 0):
+        errorAndLog(f"<awsf1.clearFpga>: Failed to clear slot <{slotno}>. Check <shell.out> for more details.",doPrint=False)
+        return False
     _sendKmsg(f"done clearing fpga {slotno}")
 
     # wait until the FPGA has been cleared
     _sendKmsg(f"checking for fpga slot {slotno}")
-    _poll_command(f"fpga-describe-local-image -S {slotno} -R -H", "cleared")
+    isCleared = _poll_command(f"fpga-describe-local-image -S {slotno} -R -H", "cleared", exitOnError=False)
     _sendKmsg(f"done checking fpga slot {slotno}")
+    return isCleared
 
 @decorate.debugWrap
 def getNumFpgas():
@@ -487,23 +580,71 @@ def getNumFpgas():
     numLines = len(lines)
     return numLines
 
+@decorate.debugWrap
+def getSlotAgfi(slotno):
+    """ returns the AGFI loaded in the slot, or None if it is not in the <loaded> state """
+    # Type  FpgaImageSlot  FpgaImageId  StatusName  StatusCode  ErrorName  ErrorCode  ShVersion
+    for line in subprocess.getoutput(f"fpga-describe-local-image -S {slotno} -R -H").splitlines():
+        fields = line.split()
+        if ((len(fields) > 3) and (fields[0] == 'AFI') and (fields[1] == str(slotno)) and (fields[3] == 'loaded')):
+            return fields[2]
+    return None
+
+@decorate.debugWrap
+@decorate.timeWrap
+def _runOnAllSlots(slotFunc, opName, doPrint=True):
+    """ runs <slotFunc(slotno)> on all the slots concurrently, records the time each slot took in
+    the setting <awsf1SlotsTimings>, and exits if any slot failed """
+    numFpgas = getNumFpgas()
+    printAndLog(f"<awsf1.{opName}>: Found {numFpgas} FPGA(s) to {opName[:-len('Fpgas')]}",doPrint=doPrint)
+    slotsResults = dict()
+
+    def runOnSlot(slotno):
+        tStart = time.time()
+        # Any failure inside the thread has to be reported back, and the exit done by the caller
+        try:
+            isSuccess = slotFunc(slotno)
+        except BaseException as exc:
+            errorAndLog(f"<awsf1.{opName}>: Slot <{slotno}> failed.",exc=exc,doPrint=False)
+            isSuccess = False
+        slotsResults[slotno] = (isSuccess, time.time() - tStart)
+
+    slotsThreads = []
+    for slotno in range(numFpgas):
+        xThread = threading.Thread(target=runOnSlot, args=(slotno,))
+        xThread.daemon = True
+        getSetting('trash').throwThread(xThread,f"{opName}-slot{slotno}")
+        xThread.start()
+        slotsThreads.append(xThread)
+    for xThread in slotsThreads:
+        xThread.join()
+
+    slotsTimings = getSetting('awsf1SlotsTimings',default={})
+    for slotno, (isSuccess, slotTime) in sorted(slotsResults.items()):
+        slotsTimings.setdefault(slotno,{})[opName] = slotTime
+        printAndLog(f"<awsf1.{opName}>: Slot <{slotno}> {'done' if isSuccess else 'failed'} in {slotTime:.2f}s.",doPrint=False)
+    setSetting('awsf1SlotsTimings',slotsTimings)
+    failedSlots = [slotno for slotno, (isSuccess, _) in sorted(slotsResults.items()) if (not isSuccess)]
+    if (failedSlots):
+        logAndExit(f"<awsf1.{opName}>: Failed on slot(s) {failedSlots}. Check <shell.out> for more details.",exitCode=EXIT.AWS)
+
 @decorate.debugWrap
 def clearFpgas(doPrint=True):
     """ clear ALL FPGAs """
-    numFpgas = getNumFpgas()
-    printAndLog(f"<awsf1.clearFpgas>: Found {numFpgas} FPGA(s) to clear",doPrint=doPrint)
-    for sn in range(numFpgas):
-        clearFpga(sn)
+    _runOnAllSlots(clearFpga, 'clearFpgas', doPrint=doPrint)
 
 @decorate.debugWrap
 def flashFpga(agfi, slotno):
-    """flash FPGA in a given slot with a given AGFI ID and wait until finished """
+    """flash FPGA in a given slot with a given AGFI ID and wait until finished. Returns whether it succeeded. """
     # fpgaLoadExtraSettings may be specified in agfi_id.json
     fpgaLoadExtraSettings = getSetting('fpgaLoadExtraSettings', default=[])
-    shellCommand(['fpga-load-local-image','-F','-S',f"{slotno}",'-I', agfi,'-A'] + fpgaLoadExtraSettings)
+    if (shellCommand(['fpga-load-local-image','-F','-S',f"{slotno}",'-I', agfi,'-A'] + fpgaLoadExtraSettings,
+            check=False).returncode != 0):
+        errorAndLog(f"<awsf1.flashFpga>: Failed to flash slot <{slotno}>. Check <shell.out> for more details.",doPrint=False)
+        return False
 
     # wait until the FPGA has been flashed
-    _poll_command(f"fpga-describe-local-image -S {slotno} -R -H", "loaded")
+    return _poll_command(f"fpga-describe-local-image -S {slotno} -R -H", "loaded", exitOnError=False)
 
 @decorate.debugWrap
 def flashFpgas(agfi,doPrint=True):
@@ -513,10 +654,7 @@ def flashFpgas(agfi,doPrint=True):
     something. This method might need to be extended to flash all available slots with our AGFI
     """
     printAndLog(f"<awsf1.flashFpgas>: Flashing FPGAs with agfi: {agfi}.",doPrint=doPrint)
-    numFpgas = getNumFpgas()
-    printAndLog(f"<awsf1.flashFpgas>: Found {numFpgas} FPGA(s) to flash",doPrint=doPrint)
-    for sn in range(numFpgas):
-        flashFpga(agfi, sn)
+    _runOnAllSlots(lambda slotno: flashFpga(agfi, slotno), 'flashFpgas', doPrint=doPrint)
 
 def getAgfiSettings(jsonFile):
     contents = safeLoadJsonFile(jsonFile)
@@ -671,9 +809,12 @@ def prepareConnectal():
 def startRemoteLogging (target):
     printAndLog ("Setting up remote logging ...")
 
-    if (not target.restartMode):
+    logPort = startSyslogCollector(target)
+    if ((logPort is None) and (not target.restartMode)):
         # clear the directory for non-fresh instances
         sudoShellCommand(['rm','-rf',f'/var/log/{target.ipTarget}'],check=False)
+    if (logPort is None): # The host's syslog daemon
+        logPort = getSetting("rsyslogPort")
 
     # configure target rsyslog
     if (isEqSetting('osImage','debian')):
@@ -692,7 +833,7 @@ def startRemoteLogging (target):
             syslogConfFile = ftOpenFile(os.path.join(getSetting('workDir'),syslogConfName),'w')
             syslogConfFile.write('module(load="imfile")\n')
             syslogConfFile.write('\nruleset(name="sendToLogserver") {\n')
-            syslogConfFile.write(f'\taction(type="omfwd" Target="{target.ipHost}" Port="{getSetting("rsyslogPort")}" Protocol="udp")\n')
+            syslogConfFile.write(f'\taction(type="omfwd" Target="{target.ipHost}" Port="{logPort}" Protocol="udp")\n')
             syslogConfFile.write('}\n')
             for logPath, logTag in logTuples:
                 syslogConfFile.write('\ninput(type="imfile"\n')
@@ -714,15 +855,15 @@ def startRemoteLogging (target):
     elif (isEqSetting('osImage','FreeBSD')):
         if (not target.restartMode):
             # configure syslogd to use the UDP port
-            target.runCommand(f'echo "*.*     @{target.ipHost}:{getSetting("rsyslogPort")}" > /etc/syslog.d/logBesspin.conf')
+            target.runCommand(f'echo "*.*     @{target.ipHost}:{logPort}" > /etc/syslog.d/logBesspin.conf')
         target.runCommand("service syslogd restart")
         
         if (webserver in target.appModules):
             nginxSrc = '/usr/local' if (not isEqSetting('binarySource','SRI-Cambridge')) else '/fett'
             nginxService = 'nginx' if (not isEqSetting('binarySource','SRI-Cambridge')) else 'fett_nginx'
 
-            remoteLogsCommands = (f'access_log syslog:server={target.ipHost}:{getSetting("rsyslogPort")},tag=nginx_access,'
-            f'severity=info;\\nerror_log syslog:server={target.ipHost}:{getSetting("rsyslogPort")},tag=nginx_error,'
+            remoteLogsCommands = (f'access_log syslog:server={target.ipHost}:{logPort},tag=nginx_access,'
+            f'severity=info;\\nerror_log syslog:server={target.ipHost}:{logPort},tag=nginx_error,'
             f'severity=debug;\\n')
 
             if (not target.restartMode):
@@ -731,19 +872,36 @@ def startRemoteLogging (target):
          
     printAndLog ("Setting up remote logging is _supposedly_ complete.")
 
+@decorate.debugWrap
+def startSyslogCollector(target):
+    """ returns the port of the built-in collector receiving the target's logs, or None to use the host's syslog daemon """
+    if (not isEnabled('useSyslogCollector')):
+        return None
+    if (not doesSettingExist('syslogCollectorObj')):
+        collectorInfo = getSetting('syslogCollectorInfo')
+        try:
+            setSetting('syslogCollectorObj', syslogCollector(getSetting('extraArtifactsPath'), collectorInfo['port'],
+                segmentMaxBytes=collectorInfo['segmentMaxBytes'], segmentMaxAge=collectorInfo['segmentMaxAge'],
+                maxBytesPerSource=collectorInfo['maxBytesPerSource'], recvBufferBytes=collectorInfo['recvBufferBytes']))
+        except Exception as exc:
+            warnAndLog("startRemoteLogging: Failed to start the syslog collector. Using the host's syslog daemon instead.",exc=exc)
+            setSetting('useSyslogCollector', False)
+            return None
+    collector = getSetting('syslogCollectorObj')
+    collector.addSource(target.ipTarget)
+    return collector.port
+
 @decorate.debugWrap
 def startUartPiping(target):
     try:
-        target.uartSocatProc = subprocess.Popen(
-            ['socat', 'STDIO,ignoreeof', f"TCP-LISTEN:{getSetting('uartFwdPort')},reuseaddr,fork,max-children=1"],
-            stdout=target.process.child_fd,stdin=target.process.child_fd,stderr=target.process.child_fd)
+        target.uartMux = startUartMultiplexer(target, getSetting('uartFwdPort'), nameInfo=target.targetIdInfo)
     except Exception as exc:
         target.terminateAndExit(f"startUartPiping: Failed to start the listening process.",exc=exc,exitCode=EXIT.Run)
 
 @decorate.debugWrap
 def endUartPiping(target):
     try:
-        target.uartSocatProc.kill() # No need for fancier ways as we use Popen with shell=False
+        target.uartMux.stop()
     except Exception as exc:
-        warnAndLog("endUartPiping: Failed to kill the listening process.",doPrint=False,exc=exc)
+        warnAndLog("endUartPiping: Failed to stop the listening process.",doPrint=False,exc=exc)
 
@@ -436,7 +436,8 @@ def crossCompileUnix(directory,extraString='',overrideBareMetal=False):
     if (not isEqSetting('mode','evaluateSecurityTests')): # <useCustomCompiling> is an evaluateSecurityTests option
         logAndExit(f"<crossCompileUnix> is not implemented for the <{getSetting('mode')}> mode.",exitCode=EXIT.Dev_Bug)
     binarySource = getSetting('binarySource')
-    if (len(glob.glob(os.path.join(directory,"*.c"))) == 0):
+    if ((len(glob.glob(os.path.join(directory,"*.c"))) == 0)
+            and (not os.path.isfile(os.path.join(directory,"variants.mk")))): #generated link rules (e.g. informationLeakage)
         return #there is nothing to compile
     if (binarySource == 'SRI-Cambridge'):
         if (not isEqSetting('cross-compiler','Clang')):
@@ -849,16 +849,17 @@ class commonTarget():
     @decorate.debugWrap
     def sendTar(self,timeout=30): #send tarball to target
         printAndLog (f"{self.targetIdInfo}sendTar: Sending files...",doPrint=(not self.targetId))
-        #---send the archive
-        if ((self.binarySource in ['GFE', 'SRI-Cambridge']) and (self.osImage=='FreeBSD')):
-            if (self.userCreated):
-                self.switchUser() #this is assuming it was on root
-            self.sendFile (getSetting('buildDir',targetId=self.targetId),self.tarballName,timeout=timeout,forceScp=True)
-            if (self.userCreated):
-                self.switchUser()
-            self.runCommand(f"mv /home/{self.userName}/{self.tarballName} /root/")
-        else:
-            self.sendFile (getSetting('buildDir',targetId=self.targetId),self.tarballName,timeout=timeout)
+        #---send the archive (the transfers of all the targets share the launch budget)
+        with getSetting('launchBudget').stage('transfer',owner=self.targetId):
+            if ((self.binarySource in ['GFE', 'SRI-Cambridge']) and (self.osImage=='FreeBSD')):
+                if (self.userCreated):
+                    self.switchUser() #this is assuming it was on root
+                self.sendFile (getSetting('buildDir',targetId=self.targetId),self.tarballName,timeout=timeout,forceScp=True)
+                if (self.userCreated):
+                    self.switchUser()
+                self.runCommand(f"mv /home/{self.userName}/{self.tarballName} /root/")
+            else:
+                self.sendFile (getSetting('buildDir',targetId=self.targetId),self.tarballName,timeout=timeout)
         #---untar
         if (self.osImage=='debian'):
             untarProcess = None if (self.processor!='bluespec_p3') else self.ttyProcess
@@ -1535,3 +1536,59 @@ def getAddrOfAdaptor (ethAdaptor,addrType,exitIfNoAddr=True):
             return addr.address
 
     return noAddrFound(f"get the <{addrType} address> of <{ethAdaptor}>")
+
+"""
+The residency records of the FPGA images: which image was last loaded on each slot/board, and the
+fingerprint of the hardware state it was loaded in. They persist across runs, in the besspin cache.
+A record is only trusted if its fingerprint still matches (e.g. no host reboot or power cycle since).
+"""
+_residencyLock = threading.Lock()
+
+def _getResidencyFile():
+    return os.path.join(getCacheDir('fpgaResidency'),'residency.json')
+
+def _loadResidencyRecords():
+    if (not os.path.isfile(_getResidencyFile())):
+        return {}
+    return safeLoadJsonFile(_getResidencyFile())
+
+@decorate.debugWrap
+def getHostBootId():
+    try:
+        return ftReadLines('/proc/sys/kernel/random/boot_id',splitLines=False).strip()
+    except Exception as exc:
+        warnAndLog("getHostBootId: Failed to read the host boot id.",exc=exc,doPrint=False)
+        return None
+
+@decorate.debugWrap
+def isImageResident (resourceId, image, fingerprint, verifyState=None):
+    """
+    Whether <image> is recorded as loaded on <resourceId> with the same fingerprint.
+    <verifyState(recordedState)> is only called if the record matches, to confirm it on the hardware.
+    """
+    if (not isEnabled('skipResidentFpgaImages')):
+        return False
+    with _residencyLock:
+        record = _loadResidencyRecords().get(resourceId)
+    if (record is None):
+        return False
+    isResident = ((record['image'] == image) and (record['fingerprint'] == fingerprint)
+                    and (None not in fingerprint.values()))
+    if (isResident and (verifyState is not None)):
+        isResident = verifyState(record.get('state'))
+    printAndLog(f"isImageResident: <{image}> is {'' if isResident else 'not '}resident on <{resourceId}>.",doPrint=False)
+    return isResident
+
+@decorate.debugWrap
+def setResidentImage (resourceId, image=None, fingerprint=None, state=None):
+    """
+    Records <image> as loaded on <resourceId> (image=None: the resource state is unknown).
+    <state> is what the hardware reported after the loading, for the <verifyState> of isImageResident.
+    """
+    with _residencyLock:
+        records = _loadResidencyRecords()
+        if (image is None):
+            records.pop(resourceId,None)
+        else:
+            records[resourceId] = {'image' : image, 'fingerprint' : fingerprint, 'state' : state, 'time' : time.time()}
+        atomicDumpJsonFile(records,_getResidencyFile())
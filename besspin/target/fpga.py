@@ -7,6 +7,7 @@ from besspin.base.utils.misc import *
 from besspin.target.common import *
 from besspin.target import vcu118
 from besspin.target import common
+from besspin.target.gdbMi import *
 
 import pexpect, subprocess, enum, re
 
@@ -50,6 +51,10 @@ class fpgaTarget(object):
             self.flashMode = False
 
         self.readGdbOutputUnix = 0 #beginning of file
+        self.gdbMiToken = 0 #the last token used for a GDB/MI command
+        self.gdbRegNames = None #the register names of the gdb session, by number
+        self.invalidateSnapshotCache()
+        self.jtagResource = None #the resource of the jtagScheduler used by this target (found in fpgaStart)
 
     @decorate.debugWrap
     def useOpenocd (self):
@@ -71,28 +76,38 @@ class fpgaTarget(object):
             openocdCfg = os.path.join(getSetting('repoDir'),'besspin','target','utils',f'openocd_{cfgSuffix}.cfg')
             self.fOpenocdOut = ftOpenFile(os.path.join(getSetting('workDir'),f'openocd{self.targetSuffix}.out'), 'ab')
 
-            # Please be careful editing this part. It is protected by `openocdLock`, and it cannot be done 
-            # using a context manager to avoid deadlocks in case of retries (use of fpgaReload).
-            getSetting('openocdLock').acquire()
+            # Please be careful editing this part. It holds the JTAG resource of the target, and it cannot be
+            # done using a context manager to avoid deadlocks in case of retries (use of fpgaReload).
+            if (self.jtagResource is None):
+                self.jtagResource = self.getJtagResource()
+            self.acquireJtag()
+            self.reserveOpenocdPorts()
             openocdExtraCmds = (f"set _CHIPNAME riscv{self.targetSuffix}; gdb_port {self.gdbPort}; "
                 f"telnet_port {self.openocdPort}{self.getOpenocdCustomCfg(isReload=isReload)}")
             printAndLog(f"{self.targetIdInfo} openocdExtraCmds = {openocdExtraCmds}",doPrint=False)
             try:
                 self.openocdProcess = pexpect.spawn(
-                    f"openocd --command '{openocdExtraCmds}' -f {openocdCfg}",
+                    f"{getSetting('openocdCmd')} --command '{openocdExtraCmds}' -f {openocdCfg}",
                         logfile=self.fOpenocdOut, timeout=15, echo=False)
                 self.openocdProcess.expect(f"Listening on port {self.openocdPort} for telnet", timeout=15)
             except Exception as exc:
-                getSetting('openocdLock').release()
+                self.releaseJtag()
                 if ((self.target=='vcu118') and (self.fpgaStartRetriesIdx < self.fpgaStartRetriesMax - 1)):
                     self.fpgaStartRetriesIdx += 1
                     errorAndLog (f"{self.targetIdInfo}fpgaStart: Failed to spawn the openocd process. Trying again ({self.fpgaStartRetriesIdx+1}/{self.fpgaStartRetriesMax})...",exc=exc)
                     return self.fpgaReload (elfPath, elfLoadTimeout=elfLoadTimeout, stage=failStage.openocd)
                 self.terminateAndExit(f"{self.targetIdInfo}fpgaStart: Failed to spawn the openocd process.",overrideShutdown=True,exc=exc,exitCode=EXIT.Run)
 
-        self.setupUart()
+            # The UART does not use JTAG, and setting it up can take a while. Only the UART search holds
+            # the resource again, for its smoke program (vcu118.findTheRightUartDevice).
+            self.releaseJtag()
 
-        self.gdbProgStart(elfPath,elfLoadTimeout) #releasing the openocd lock happens here
+        if (self.setupUart()): #The target was reloaded meanwhile, so it is started already
+            return
+
+        if (self.useOpenocd()):
+            self.acquireJtag(operation='gdbStart')
+        self.gdbProgStart(elfPath,elfLoadTimeout) #releasing the JTAG resource happens here
         
         if ((self.processor=='bluespec_p3') and (self.target=='vcu118') and (self.elfLoader=='JTAG')):
             _,wasTimeout,_ = self.expectFromTarget("bbl loader", f"attempt to boot {self.processor}",
@@ -118,6 +133,7 @@ class fpgaTarget(object):
     @decorate.timeWrap
     def gdbProgStart(self,elfPath,elfLoadTimeout,mainProg=True):
         # start the gdb process
+        self.gdbRegNames = None
         self.fGdbOut = ftOpenFile(os.path.join(getSetting('workDir'), f'gdb{self.targetSuffix}.out'), 'wb')
         try:
             self.gdbProcess = pexpect.spawn(
@@ -125,8 +141,8 @@ class fpgaTarget(object):
                     logfile=self.fGdbOut, timeout=15, echo=False)
             self.gdbProcess.expect(self.getGdbEndsWith(), timeout=15)
         except Exception as exc:
-            if (self.useOpenocd()):
-                getSetting('openocdLock').release()
+            if (self.useOpenocd() and getSetting('jtagScheduler').isHeld(self.jtagResource,owner=self.targetId)):
+                self.releaseJtag()
             if ((self.target=='vcu118') and (self.fpgaStartRetriesIdx < self.fpgaStartRetriesMax)):
                 self.fpgaStartRetriesIdx += 1
                 errorAndLog (f"{self.targetIdInfo}gdbProgStart: Failed to spawn the gdb process. Trying again ({self.fpgaStartRetriesIdx+1}/{self.fpgaStartRetriesMax})...",exc=exc)
@@ -149,22 +165,22 @@ class fpgaTarget(object):
         if ((self.target=='awsf1') and (self.pvAWS=='firesim')):
             self.runCommandGdb ('set $pc=0xC0000000')
             if (self.useOpenocd() and mainProg):
-                getSetting('openocdLock').release()
+                self.releaseJtag()
         elif (self.target=='vcu118'):
             # reset the board
             self.softReset()
 
             # release before the load (takes time)
             if (self.useOpenocd() and mainProg):
-                getSetting('openocdLock').release()
+                self.releaseJtag()
 
             if (not self.flashMode): #No need to load when flash
                 self.gdbLoad (elfLoadTimeout=elfLoadTimeout)
                 if (self.processor=='bluespec_p3'):
                     time.sleep(3) # Bluespec_p3 needs time here before being able to properly continue.
         elif (self.useOpenocd() and mainProg):
-            getSetting('openocdLock').release()
-            self.terminateAndExit(f"{self.targetIdInfo}gdbProgStart: Releasing the openocd lock is not "
+            self.releaseJtag()
+            self.terminateAndExit(f"{self.targetIdInfo}gdbProgStart: Releasing the JTAG resource is not "
                 f"implemented for <{self.target}>.", exitCode=EXIT.Implementation)
         if (mainProg and isEqSetting('mode','evaluateSecurityTests') and isEnabled('useCustomScoring')):
             self.setupGdbCustomScoring()
@@ -189,7 +205,7 @@ class fpgaTarget(object):
         if (self.target!='vcu118'):
             self.terminateAndExit(f"{self.targetIdInfo}<fpgaReload> is not implemented for target {self.target}.",overrideShutdown=True)
         self.fpgaTearDown(isReload=True,stage=stage)
-        vcu118.programBitfile(doPrint=False, targetId=self.targetId)
+        vcu118.programBitfile(doPrint=False, targetId=self.targetId, forceProgramming=True) #the board may be stuck
         self.fpgaStart(elfPath, elfLoadTimeout=elfLoadTimeout, isReload=True)
         return
 
@@ -266,11 +282,48 @@ class fpgaTarget(object):
 
     @decorate.debugWrap
     @decorate.timeWrap
-    def seqGdbCommands (self, commands, sleepTime=1):
+    def seqGdbCommands (self, commands, sleepTime=None):
+        """
+        Runs the console commands in one GDB/MI batch. Each one has completed on return.
+        With <sleepTime>, each command is its own batch, and the hart is given <sleepTime> after it.
+        """
+        if (sleepTime is None):
+            self.runMiCommandsGdb([miConsoleCommand(command) for command in commands])
+            return
         for command in commands:
-            self.runCommandGdb(command)
+            self.runMiCommandsGdb([miConsoleCommand(command)])
             time.sleep(sleepTime)
 
+    @decorate.debugWrap
+    def runMiCommandsGdb (self, miCommands, timeout=15, exitOnError=True):
+        """
+        Pipelines <miCommands> to gdb, and waits for all of them to complete.
+        RETURNS:
+        --------
+            A list of (class, results) per command. class is None if its record was not found.
+        """
+        tokens = list(range(self.gdbMiToken+1, self.gdbMiToken+len(miCommands)+1))
+        self.gdbMiToken += len(miCommands)
+        lines = [miCommandLine(token, miCommand) for token, miCommand in zip(tokens, miCommands)]
+        lines.append(miSyncLine(self.gdbMiToken))
+        _,textBack,wasTimeout,_ = self.runCommandGdb('\n'.join(lines),
+            endsWith=rf"{miSyncMarker(self.gdbMiToken)}\s*{self.getGdbEndsWith()}",
+            timeout=timeout, exitOnError=exitOnError)
+
+        records = {token : (miClass, results) for token, kind, miClass, results in parseMiRecords(textBack)
+                    if ((kind == '^') and (token is not None))}
+        ret = []
+        for token, miCommand in zip(tokens, miCommands):
+            miClass, results = records.get(token, (None, None))
+            if ((miClass not in MI_SUCCESS_CLASSES) and (not wasTimeout)):
+                msg = results.get('msg', '') if (results is not None) else 'No result record'
+                if (exitOnError):
+                    self.terminateAndExit(f"{self.targetIdInfo}runMiCommandsGdb: <{miCommand}> failed: {msg}.",
+                        overrideShutdown=True,exitCode=EXIT.Run)
+                warnAndLog(f"{self.targetIdInfo}runMiCommandsGdb: <{miCommand}> failed: {msg}.",doPrint=False)
+            ret.append((miClass, results))
+        return ret
+
     @decorate.debugWrap
     @decorate.timeWrap
     def riscvWrite(self,address,value, size):
@@ -297,6 +350,7 @@ class fpgaTarget(object):
     def runCommandGdb(self, command, endsWith=None, timeout=15, **kwargs):
         endsWith = self.getGdbEndsWith() if endsWith is None else endsWith
         """convenience runCommand for GDB"""
+        self.invalidateSnapshotCache() # Any command may resume the hart or change its state
         return self.runCommand(command,
                                 endsWith=endsWith,
                                 sendToNonUnix=True,
@@ -323,39 +377,134 @@ class fpgaTarget(object):
 
     @decorate.debugWrap
     @decorate.timeWrap
-    def getRegsValues(self,regNames=None):
+    def getRegsValues(self,regNames=None,exitOnError=True):
         if (regNames is None):
             if (self.target=='awsf1'):
                 warnAndLog("getRegsValues: There is a problem with GDB on AWSf1 when returning <info all-registers>. "
                     f"This command might result in error. Please specify the needed regs instead.")
-            regSpec = "all-registers"
-        elif (isinstance(regNames,list)):
-            regSpec = f"registers {' '.join(regNames)}"
-        else:
+        elif (not isinstance(regNames,list)):
             warnAndLog("getRegsValues: <regNames> should either be None for all regs, or a list of register "
                 f"names. Will use <{regNames} as is.")
-            regSpec = f"registers {regNames}"
-        _,retGdb,_,_ = self.runCommandGdb(f"info {regSpec}")
-        regsDict = dict()
-        for line in retGdb.splitlines():
-            regMatch = re.match(r"\s*(?P<regName>[a-z][a-z0-9]+)\s+(?P<hexVal>0x[0-9a-f]+)\s.*$",line)
-            if (regMatch is not None):
-                try:
-                    hexVal = int(regMatch.group('hexVal'),16)
-                except Exception as exc:
-                    warnAndLog(f"getRegsValues: Failed to read the value <{regMatch.group('hexVal')}> "
-                        f"of reg:<{regMatch.group('regName')}>",exc=exc,doPrint=False)
+            regNames = str(regNames).split()
+        return self.getTargetSnapshot(regNames=regNames,exitOnError=exitOnError)['regs']
+
+    @decorate.debugWrap
+    def invalidateSnapshotCache(self):
+        """ The snapshot cache is only valid while the hart stays halted at the same stop """
+        self.snapshotCache = {'regs' : dict(), 'allRegs' : False, 'mem' : dict()}
+
+    @decorate.debugWrap
+    @decorate.timeWrap
+    def getTargetSnapshot(self,regNames=None,memRanges=[],exitOnError=True):
+        """
+        Reads registers and memory ranges of the halted hart in one GDB/MI round trip (plus one
+        to learn the register numbers, the first time registers are requested by name).
+        Repeated queries at the same stop are answered from the cache.
+        ARGUMENTS:
+        ----------
+            regNames: list of register names, [] for none, or None for all the registers.
+            memRanges: list of (address, nBytes).
+        RETURNS:
+        --------
+            A dict: {'regs' : {regName : int (or str if not numeric)}, 'mem' : {(address, nBytes) : bytes}}
+            The registers and ranges that could not be read are missing.
+        """
+        cache = self.snapshotCache
+        memRanges = [(int(address), int(nBytes)) for address, nBytes in memRanges]
+        isAllRegs = (regNames is None)
+        missingRegs = (not cache['allRegs']) if isAllRegs else [regName for regName in regNames if (regName not in cache['regs'])]
+        missingRanges = [memRange for memRange in memRanges if (memRange not in cache['mem'])]
+
+        if (missingRegs and (not isAllRegs) and (self.gdbRegNames is None)):
+            # The numbers of the requested registers are only known after the names (once per gdb session)
+            [(miClass, result)] = self.runMiCommandsGdb(["-data-list-register-names"],exitOnError=exitOnError)
+            self.snapshotCache = cache # Reading does not move the hart
+            if (miClass == 'done'):
+                self.gdbRegNames = result.get('register-names', [])
+
+        if (missingRegs or missingRanges):
+            queries = [] # (MI command, memory range or None)
+            if (missingRegs and (self.gdbRegNames is None)): # All the registers are read anyway
+                queries.append(("-data-list-register-names", None))
+            if (missingRegs):
+                if (isAllRegs or (self.gdbRegNames is None)):
+                    queries.append(("-data-list-register-values --skip-unavailable x", None))
+                else:
+                    regNumbers = [self.gdbRegNames.index(regName) for regName in missingRegs if (regName in self.gdbRegNames)]
+                    if (regNumbers):
+                        queries.append((f"-data-list-register-values --skip-unavailable x {' '.join(map(str,regNumbers))}", None))
+            for address, nBytes in missingRanges:
+                queries.append((f"-data-read-memory-bytes 0x{address:x} {nBytes}", (address, nBytes)))
+
+            results = self.runMiCommandsGdb([miCommand for miCommand, _ in queries],exitOnError=exitOnError) if queries else []
+            self.snapshotCache = cache # Reading does not move the hart
+            for (miCommand, memRange), (miClass, result) in zip(queries, results):
+                if (miClass != 'done'):
                     continue
-                regsDict[regMatch.group('regName')] = hexVal
-        return regsDict
+                if (miCommand.startswith("-data-list-register-names")):
+                    self.gdbRegNames = result.get('register-names', [])
+                elif (miCommand.startswith("-data-list-register-values")):
+                    for regValue in result.get('register-values', []):
+                        try:
+                            regName = self.gdbRegNames[int(regValue['number'])]
+                        except Exception as exc:
+                            warnAndLog(f"getTargetSnapshot: Unexpected register value <{regValue}>.",exc=exc,doPrint=False)
+                            continue
+                        try:
+                            cache['regs'][regName] = int(regValue['value'],16)
+                        except (ValueError, TypeError):
+                            cache['regs'][regName] = regValue['value']
+                    if (miCommand.endswith(" x")): # No register numbers: all of them were read
+                        cache['allRegs'] = True
+                else: # -data-read-memory-bytes
+                    address, nBytes = memRange
+                    contents = bytearray(nBytes)
+                    for block in result.get('memory', []):
+                        offset = int(block['offset'],16)
+                        blockBytes = bytes.fromhex(block['contents'])
+                        contents[offset:offset+len(blockBytes)] = blockBytes
+                    cache['mem'][(address, nBytes)] = bytes(contents)
+
+        if (isAllRegs):
+            regs = dict(cache['regs'])
+        else:
+            regs = {regName : cache['regs'][regName] for regName in regNames if (regName in cache['regs'])}
+            if (len(regs) < len(regNames)):
+                warnAndLog(f"getTargetSnapshot: Failed to read {[r for r in regNames if r not in regs]}.",doPrint=False)
+        mem = {memRange : cache['mem'][memRange] for memRange in memRanges if (memRange in cache['mem'])}
+        return {'regs' : regs, 'mem' : mem}
 
     @decorate.debugWrap     
     def getOpenocdCustomCfg(self, isReload=False):
         return '' #virtual implementation
 
+    @decorate.debugWrap
+    def getJtagResource(self):
+        return 'jtag' #virtual implementation: one resource shared by all
+
+    @decorate.debugWrap
+    def acquireJtag(self,operation='openocdStart'):
+        getSetting('jtagScheduler').acquire(self.jtagResource,owner=self.targetId,operation=operation)
+
+    @decorate.debugWrap
+    def releaseJtag(self):
+        getSetting('jtagScheduler').release(self.jtagResource)
+
+    @decorate.debugWrap
+    def reserveOpenocdPorts(self):
+        """ The ports are checked again before spawning openocd, since they may have been taken since
+        __init__ (e.g. by a lingering openocd on reload). A taken port is replaced by a free one. """
+        if (not checkPort(self.gdbPort)):
+            self.gdbPort = self.findPort(portUse='GDB')
+            printAndLog(f"{self.targetIdInfo}fpgaTarget: gdb port is now <{self.gdbPort}>.",doPrint=False)
+        if (not checkPort(self.openocdPort)):
+            self.openocdPort = self.findPort(portUse='openocd')
+            printAndLog(f"{self.targetIdInfo}fpgaTarget: openocd telnet port is now <{self.openocdPort}>.",doPrint=False)
+
     @decorate.debugWrap
     def setupUart(self):
-        return #virtual implementation
+        """ returns True if the target was reloaded (and started) while setting up the uart """
+        return False #virtual implementation
 
     @decorate.debugWrap
     @decorate.timeWrap
@@ -420,16 +569,12 @@ class fpgaTarget(object):
                 # Fetch relevant registers values
                 if (sigFound):
                     relvRegs = {'mcause':'Unknown', 'mepc':'Unknown'}
+                    regsValues = self.getRegsValues(list(relvRegs),exitOnError=False)
                     for relvReg in relvRegs:
-                        try:
-                            self.gdbProcess.sendline(f"p/x ${relvReg}")
-                            self.gdbProcess.expect(r"\$\d+\s*=\s*0x[\dabcdef]+", timeout=5)
-                            regpxStr = str(self.gdbProcess.after,'utf-8')
-                            regpxVal = regpxStr.split('=')[-1].strip()
-                            relvRegs[relvReg] = regpxVal
-                        except Exception as exc:
-                            warnAndLog (f"targetTearDown: Failed to fetch the value of ${relvReg}.",exc=exc,doPrint=False) 
-                            break
+                        if (isinstance(regsValues.get(relvReg),int)):
+                            relvRegs[relvReg] = f"0x{regsValues[relvReg]:x}"
+                        else:
+                            warnAndLog (f"targetTearDown: Failed to fetch the value of ${relvReg}.",doPrint=False)
                     regsValuesStr = ','.join([f"{relvReg}={relvRegs[relvReg]}" for relvReg in relvRegs])
                     testLogFile.write(f"\n<GDB-{sigFound}> with {regsValuesStr}\n")
 
@@ -458,7 +603,8 @@ class fpgaTarget(object):
 
         filesToClose = [self.fGdbOut, self.fOpenocdOut]
         if (self.target=='vcu118'):
-            processes = [('riscv64-unknown-elf-gdb',self.gdbProcess), ('openocd',self.openocdProcess)]
+            processes = [('riscv64-unknown-elf-gdb',self.gdbProcess),
+                            (os.path.basename(getSetting('openocdCmd')),self.openocdProcess)]
             for pName, proc in processes:
                 if (isEqSetting('mode','cyberPhys')): #have to kill selectively
                     try:
@@ -479,3 +625,6 @@ class fpgaTarget(object):
                 xFile.close()
             except Exception as exc:
                 warnAndLog(f"{self.targetIdInfo}fpgaTearDown: Failed to close <{xFile.name}>.",doPrint=False,exc=exc)
+
+        if ((not isReload) and self.useOpenocd()):
+            getSetting('jtagScheduler').logMetrics(owner=self.targetId,ownerInfo=self.targetIdInfo)
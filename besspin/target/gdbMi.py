@@ -0,0 +1,100 @@
+#! /usr/bin/env python3
+"""
+GDB machine interface (MI) helpers for the fpga targets.
+
+The gdb processes stay console sessions: their logs are parsed for the custom scoring
+checkpoints and the FreeRTOS signals. The MI commands are sent through the console command
+<interpreter-exec mi>, and each one carries a token. A batch of commands is written at once
+(gdb executes them in order) and is closed by an <echo> of a unique sync marker. The batch
+completes when the marker comes back. Every command then has a result record (^done,
+^error, ...) matched by its token, so no command needs a fixed sleep after it.
+
+Nothing here depends on the target: the helpers only build command lines and parse the
+output. They are exercised against a scripted stand-in by utils/benchGdbMi.py.
+"""
+
+import re
+
+# <token>^<class>,<results> | *<class>,<results> | =<class>,<results> ...
+# A record can follow the console prompt on the same line.
+MI_RECORD_REGEX = re.compile(r'(?:^|(?<=\(gdb\)))[ ]*(?P<token>\d*)(?P<kind>[\^*+=])(?P<class>[a-z-]+)(?:,(?P<results>.*?))?\r?$',
+                                re.MULTILINE)
+
+MI_RESULT_NAME_REGEX = re.compile(r'[A-Za-z_][\w-]*=')
+
+MI_SUCCESS_CLASSES = ['done', 'running', 'connected']
+
+def miEscape (text):
+    """ Quotes text as the contents of a C string (for gdb's string arguments) """
+    return text.replace('\\','\\\\').replace('"','\\"').replace('\n','\\n')
+
+def miUnescape (text):
+    """ Inverse of miEscape, plus the other C escapes gdb emits """
+    return re.sub(r'\\(.)', lambda xMatch: {'n':'\n', 't':'\t', 'r':'\r'}.get(xMatch.group(1), xMatch.group(1)), text)
+
+def miConsoleCommand (cliCommand):
+    """ The MI command running a console command """
+    return f'-interpreter-exec console "{miEscape(cliCommand)}"'
+
+def miCommandLine (token, miCommand):
+    """ The console line sending <miCommand> with <token> """
+    return f'interpreter-exec mi "{miEscape(f"{token}{miCommand}")}"'
+
+def miSyncMarker (token):
+    return f"<MI-SYNC-{token}>"
+
+def miSyncLine (token):
+    """ The console line closing a batch: gdb echoes the marker once all the batch is done """
+    return f"echo {miSyncMarker(token)}\\n"
+
+def parseMiValue (text, pos=0):
+    """ returns (value, nextPos). A c-string is a str, a tuple a dict, and a list a list. """
+    if (text[pos] == '"'):
+        end = pos + 1
+        while (text[end] != '"'):
+            end += 2 if (text[end] == '\\') else 1
+        return (miUnescape(text[pos+1:end]), end+1)
+    if (text[pos] == '{'):
+        results, pos = parseMiResults(text, pos+1, closing='}')
+        return (results, pos)
+    if (text[pos] == '['):
+        values = []
+        pos += 1
+        while (text[pos] != ']'):
+            if (text[pos] == ','):
+                pos += 1
+                continue
+            xMatch = MI_RESULT_NAME_REGEX.match(text, pos)
+            if (xMatch is not None): # A list of results: only the values are kept
+                pos = xMatch.end()
+            value, pos = parseMiValue(text, pos)
+            values.append(value)
+        return (values, pos+1)
+    raise ValueError(f"Unexpected MI value at <{text[pos:pos+20]}>")
+
+def parseMiResults (text, pos=0, closing=None):
+    """ Parses <name>=<value>,... up to <closing> (or the end). returns (dict, nextPos) """
+    results = dict()
+    while (pos < len(text)) and (text[pos] != closing):
+        if (text[pos] == ','):
+            pos += 1
+            continue
+        eqPos = text.index('=', pos)
+        name = text[pos:eqPos]
+        results[name], pos = parseMiValue(text, eqPos+1)
+    return (results, pos+1 if (closing is not None) else pos)
+
+def parseMiRecords (text):
+    """
+    returns the list of (token, kind, class, results) of the MI records in <text>. The token
+    is None for the records without one (e.g. the *stopped async records).
+    """
+    records = []
+    for xMatch in MI_RECORD_REGEX.finditer(text.replace('\r\n','\n')):
+        try:
+            results = parseMiResults(xMatch.group('results'))[0] if xMatch.group('results') else dict()
+        except (ValueError, IndexError):
+            results = {'raw' : xMatch.group('results')}
+        token = int(xMatch.group('token')) if xMatch.group('token') else None
+        records.append((token, xMatch.group('kind'), xMatch.group('class'), results))
+    return records
@@ -20,7 +20,7 @@ from besspin.cwesEvaluation.utils.computeNaiveCWEsTally import computeNaiveCWEsT
 from besspin.cyberPhys.build import buildCyberPhys
 from besspin.cyberPhys.run import runCyberPhys
 import besspin.cyberPhys.launch
-import sys, os
+import sys, os, threading
 from importlib.machinery import SourceFileLoader
 
 """ This is the BESSPIN entry function """
@@ -132,29 +132,70 @@ def startBesspin (targetId=None):
     if (isEqSetting('mode','fettProduction')):
         awsf1.startUartPiping(xTarget) # Shoud not execute any command after piping start
 
+    if (targetId is None): # The cyberPhys targets are dumped together once all are launched
+        dumpLaunchTimeline()
+
     return xTarget
 
+@decorate.debugWrap
+def dumpLaunchTimeline():
+    """ logs the stages of the targets' bring-up, and dumps them to <workDir>/launchTimeline.json """
+    launchBudget = getSetting('launchBudget')
+    launchBudget.logTimeline()
+    atomicDumpJsonFile(launchBudget.getTimeline(), os.path.join(getSetting('workDir'),'launchTimeline.json'), indent=2)
+
 
 """ This is the prepare function before launch (binaries, network,) """ 
 @decorate.debugWrap
 def prepareEnv (targetId=None):
     targetInfo = f"<target{targetId}>: " if (targetId) else ''
     printAndLog (f"{targetInfo}Preparing the environment...")
-    osImage = getSetting('osImage',targetId=targetId)
     target = getSetting('target',targetId=targetId)
 
+    if (isEqSetting('mode', 'evaluateSecurityTests') # The building decides whether there is a reason to boot
+            or (target=='awsf1') # The AWS preparation uses the OS image
+            or ((target=='vcu118') and isEqSetting('vcu118Mode','flashProgramAndBoot',targetId=targetId))):
+        prepareBinaries(targetId=targetId)
+        prepareTarget(targetId=targetId)
+    else:
+        # The FPGA/network preparation does not depend on the binaries, so it runs meanwhile
+        targetExcs = []
+        def runPrepareTarget():
+            # A failure inside the thread has to be reported back, and the exit done here
+            try:
+                prepareTarget(targetId=targetId)
+            except BaseException as exc:
+                targetExcs.append(exc)
+        targetThread = threading.Thread(target=runPrepareTarget)
+        targetThread.daemon = True
+        getSetting('trash').throwThread(targetThread,f"<prepareTarget> for target{targetId}")
+        targetThread.start()
+        prepareBinaries(targetId=targetId)
+        targetThread.join()
+        if (targetExcs):
+            logAndExit(f"{targetInfo}prepareEnv: Failed to prepare the target.",exc=targetExcs[0],exitCode=EXIT.Run)
+    printAndLog (f"{targetInfo}Environment is ready.")
+
+@decorate.debugWrap
+def prepareBinaries (targetId=None):
+    """ builds the apps/tests and prepares the OS image """
+    targetInfo = f"<target{targetId}>: " if (targetId) else ''
+    osImage = getSetting('osImage',targetId=targetId)
+    launchBudget = getSetting('launchBudget')
+
     # config sanity checks for building artifacts
     if (osImage in ['FreeRTOS', 'debian', 'FreeBSD']):
         setSetting('bootTest',False,targetId=targetId)
 
-        if isEqSetting("mode", "evaluateSecurityTests"):
-            isThereAnythingToRun = buildCwesEvaluation()
-            if (not isThereAnythingToRun):
-                logAndExit("Running in <evaluateSecurityTests> mode, but no tests are enabled.",exitCode=EXIT.Nothing_to_do)
-        elif isEqSetting("mode", "cyberPhys"):
-            buildCyberPhys(targetId=targetId)
-        elif (getSetting("mode") in ["fettTest", "fettProduction"]):
-            buildApps ()
+        with launchBudget.stage('build',owner=targetId):
+            if isEqSetting("mode", "evaluateSecurityTests"):
+                isThereAnythingToRun = buildCwesEvaluation()
+                if (not isThereAnythingToRun):
+                    logAndExit("Running in <evaluateSecurityTests> mode, but no tests are enabled.",exitCode=EXIT.Nothing_to_do)
+            elif isEqSetting("mode", "cyberPhys"):
+                buildCyberPhys(targetId=targetId)
+            elif (getSetting("mode") in ["fettTest", "fettProduction"]):
+                buildApps ()
     elif (osImage=='busybox'):
         printAndLog(f"{targetInfo}<busybox> is only used for smoke testing the target/network. No applications are supported.")
         setSetting('bootTest',True,targetId=targetId)
@@ -164,36 +205,47 @@ def prepareEnv (targetId=None):
         logAndExit (f"<launch.prepareEnv> is not implemented for <{osImage}>.",exitCode=EXIT.Dev_Bug)
 
     if not (isEqSetting('mode', 'evaluateSecurityTests') and (osImage=='FreeRTOS')):
-        prepareOsImage (targetId=targetId)
+        with launchBudget.stage('osImage',owner=targetId):
+            prepareOsImage (targetId=targetId)
+
+@decorate.debugWrap
+def prepareTarget (targetId=None):
+    """ programs the FPGA and prepares the network """
+    osImage = getSetting('osImage',targetId=targetId)
+    target = getSetting('target',targetId=targetId)
 
     if ( isEqSetting('mode', 'evaluateSecurityTests') and
             ((osImage=='FreeRTOS') or (not isEnabled('isThereAReasonToBoot'))) ):
-        pass #No need to do any more preparation
-    elif (target=='vcu118'):
-        vcu118.resetEthAdaptor()
-        vcu118.programBitfile(targetId=targetId)
-    elif (target=='awsf1'):
-        pvAWS = getSetting('pvAWS',targetId=targetId)
-        if (pvAWS=='firesim'):
-            awsf1.prepareFiresim()
-            awsf1.removeKernelModules()
-            awsf1.installKernelModules()
-            awsf1.configTapAdaptor()
-            awsf1.programAFI()
-        elif (pvAWS=='connectal'):
-            awsf1.prepareConnectal()
-            awsf1.configTapAdaptor()
-            ## remove modules because sometimes kernel panics if the modules are loaded while programming the FPGA
-            awsf1.removeKernelModules()
-            awsf1.programAFI()
-            ## remove the modules again because the AMI has xocl in /lib/modules and it is getting auto loaded
-            awsf1.removeKernelModules()
-            awsf1.installKernelModules()
-        else:
-            logAndExit (f"<launch.prepareEnv> is not implemented for <AWS:{pvAWS}>.",exitCode=EXIT.Implementation)
-    elif (target=='qemu'):
-        qemu.configTapAdaptor(targetId=targetId)
-    printAndLog (f"{targetInfo}Environment is ready.")
+        return #No need to do any more preparation
+
+    launchBudget = getSetting('launchBudget')
+    with launchBudget.stage('target',owner=targetId):
+        if (target=='vcu118'):
+            vcu118.resetEthAdaptor()
+            vcu118.programBitfile(targetId=targetId)
+        elif (target=='awsf1'):
+            pvAWS = getSetting('pvAWS',targetId=targetId)
+            if (pvAWS=='firesim'):
+                with launchBudget.stage('image',owner=targetId): # decompresses the image
+                    awsf1.prepareFiresim()
+                awsf1.removeKernelModules()
+                awsf1.installKernelModules()
+                awsf1.configTapAdaptor()
+                awsf1.programAFI()
+            elif (pvAWS=='connectal'):
+                with launchBudget.stage('image',owner=targetId):
+                    awsf1.prepareConnectal()
+                awsf1.configTapAdaptor()
+                ## remove modules because sometimes kernel panics if the modules are loaded while programming the FPGA
+                awsf1.removeKernelModules()
+                awsf1.programAFI()
+                ## remove the modules again because the AMI has xocl in /lib/modules and it is getting auto loaded
+                awsf1.removeKernelModules()
+                awsf1.installKernelModules()
+            else:
+                logAndExit (f"<launch.prepareEnv> is not implemented for <AWS:{pvAWS}>.",exitCode=EXIT.Implementation)
+        elif (target=='qemu'):
+            qemu.configTapAdaptor(targetId=targetId)
 
 """ This is the loading/booting function """
 @decorate.debugWrap
@@ -209,7 +261,8 @@ def launchBesspin (targetId=None):
         buildFreeRTOSTest(*getSetting("currentTest"))
     else:
         printAndLog (f"Launching BESSPIN <{getSetting('mode')} mode>...",doPrint=(not isEqSetting('mode','cyberPhys')))
-    xTarget.start()
+    with getSetting('launchBudget').stage('boot',owner=targetId):
+        xTarget.start()
     if (isEnabled('isUnix',targetId=targetId) and (xTarget.osHasBooted)):
         if ((getSetting('osImage',targetId=targetId) in ['debian','FreeBSD']) #don't do it for busybox
                 and (   (getSetting('mode') in ['fettTest', 'fettProduction'])
@@ -304,10 +357,10 @@ def resetTarget (curTarget):
         if (isEqSetting('pvAWS','firesim')):
             awsf1.removeKernelModules()
             awsf1.installKernelModules()
-            awsf1.programAFI()
+            awsf1.programAFI(forceProgramming=True)
         elif (isEqSetting('pvAWS', 'connectal')):
             awsf1.removeKernelModules()
-            awsf1.programAFI()
+            awsf1.programAFI(forceProgramming=True)
             awsf1.removeKernelModules()
             awsf1.installKernelModules()
         else:
@@ -317,7 +370,7 @@ def resetTarget (curTarget):
             qemu.configTapAdaptor(targetId=targetId)
         elif (isEqSetting('target','vcu118',targetId=targetId)):
             if (isEnabled('programBitfileOnReset')):
-                vcu118.programBitfile(targetId=targetId)
+                vcu118.programBitfile(targetId=targetId,forceProgramming=True)
             vcu118.resetEthAdaptor()
         else:
             logAndExit (f"<resetTarget> is not implemented for <{getSetting('target',targetId=targetId)}>."
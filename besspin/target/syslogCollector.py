@@ -0,0 +1,305 @@
+#! /usr/bin/env python3
+"""
+A UDP syslog receiver for the remote logging of the targets.
+
+The targets' rsyslog, syslogd, and nginx send their logs to the host over UDP. Only the datagrams of
+the registered sources (the targets' IPs) are kept. Each source has its own directory
+<rootDir>/rsyslogs_<ip>. In that directory:
+    - Each tag (syslog program name) is written to rotating segments <tag>.<seq>.log.zst. One record
+      is one line: "<receiveTime> <sourceIp> <raw message>". A segment is made of complete zstd
+      frames (one per flush), so it can be read while it is being written, or after a crash.
+    - index.json lists the segments with their tag, time range, and size, so a search only opens the
+      segments it needs.
+
+The socket is drained in batches without blocking, and its receive buffer is large. A flood from the
+targets is absorbed by the buffer and dropped by the kernel when full; it never blocks the targets or
+the tool. Once a source reaches its storage quota, its records are counted and dropped.
+"""
+
+import os, re, json, time, errno
+import socket, select, threading
+import zstandard
+
+from besspin.base.utils.misc import *
+
+INDEX_FILE = 'index.json'
+INDEX_VERSION = 1
+OTHER_TAG = 'other'
+MAX_TAGS_PER_SOURCE = 64
+
+# <PRI>[Mmm dd hh:mm:ss ][host ]tag[[pid]]: msg -- the host is omitted by FreeBSD's syslogd
+RFC3164_REGEX = re.compile(rb'^<\d{1,3}>(?:[A-Z][a-z]{2} [ \d]\d \d\d:\d\d:\d\d )?(?:[^\s:\[]+ )?(?P<tag>[^\s:\[]+)(?:\[\d*\])?:')
+# <PRI>1 timestamp host app-name procid msgid ...
+RFC5424_REGEX = re.compile(rb'^<\d{1,3}>1 \S+ \S+ (?P<tag>\S+) ')
+TAG_SANITIZE_REGEX = re.compile(r'[^\w.-]')
+
+def parseSyslogTag (datagram):
+    """ returns the sanitized tag of a syslog datagram, or <OTHER_TAG> """
+    xMatch = RFC5424_REGEX.match(datagram) or RFC3164_REGEX.match(datagram)
+    if ((xMatch is None) or (xMatch.group('tag') == b'-')):
+        return OTHER_TAG
+    return TAG_SANITIZE_REGEX.sub('_', xMatch.group('tag').decode('utf-8', errors='replace'))[:48] or OTHER_TAG
+
+def sourceLogsDir (rootDir, sourceIp):
+    return os.path.join(rootDir, f"rsyslogs_{sourceIp}")
+
+class syslogSegment:
+    """ An open segment of one tag. Not thread-safe: only the receiving thread writes it. """
+    def __init__ (self, logsDir, tag, seq, level):
+        self.tag = tag
+        self.file = f"{tag}.{seq:04d}.log.zst"
+        self.fSegment = open(os.path.join(logsDir, self.file), 'wb')
+        self.writer = zstandard.ZstdCompressor(level=level).stream_writer(self.fSegment, closefd=False)
+        self.openTime = time.time()
+        self.firstTime = None
+        self.lastTime = None
+        self.nRecords = 0
+        self.nBytes = 0
+        self.isDirty = False
+
+    def write (self, recvTime, record):
+        self.writer.write(record)
+        if (self.firstTime is None):
+            self.firstTime = recvTime
+        self.lastTime = recvTime
+        self.nRecords += 1
+        self.nBytes += len(record)
+        self.isDirty = True
+
+    def flush (self):
+        """ ends the current frame, so everything written so far is decodable from disk """
+        if (self.isDirty):
+            self.writer.flush(zstandard.FLUSH_FRAME)
+            self.fSegment.flush()
+            self.isDirty = False
+
+    def close (self):
+        self.flush()
+        self.writer.close()
+        self.fSegment.close()
+
+    def indexEntry (self, isOpen=False):
+        return {'tag' : self.tag, 'file' : self.file, 'firstTime' : self.firstTime, 'lastTime' : self.lastTime,
+                'nRecords' : self.nRecords, 'nBytes' : self.nBytes, 'open' : isOpen}
+
+class syslogSource:
+    """ The segments, index, and counters of one source IP """
+    def __init__ (self, logsDir):
+        self.logsDir = logsDir
+        self.segments = dict() # tag -> open syslogSegment
+        self.closedSegments = [] # index entries
+        self.nextSeq = dict() # tag -> next segment sequence number
+        self.nRecords = 0
+        self.nBytes = 0
+        self.nDropped = 0
+
+    def indexData (self):
+        segments = self.closedSegments + [segment.indexEntry(isOpen=True) for segment in self.segments.values()
+                                            if (segment.nRecords > 0)]
+        return {'version' : INDEX_VERSION, 'segments' : sorted(segments, key=lambda entry: entry['firstTime']),
+                'nRecords' : self.nRecords, 'nBytes' : self.nBytes, 'nDropped' : self.nDropped}
+
+class syslogCollector:
+    def __init__ (self, rootDir, port, segmentMaxBytes=8*1024*1024, segmentMaxAge=300, maxBytesPerSource=2*1024**3,
+                    recvBufferBytes=8*1024*1024, flushInterval=1, compressionLevel=3, batchSize=256):
+        self.rootDir = rootDir
+        self.segmentMaxBytes = segmentMaxBytes
+        self.segmentMaxAge = segmentMaxAge
+        self.maxBytesPerSource = maxBytesPerSource
+        self.flushInterval = flushInterval
+        self.compressionLevel = compressionLevel
+        self.batchSize = batchSize
+
+        self.sourcesLock = threading.Lock()
+        self.sources = dict() # ip -> syslogSource
+        self.nIgnored = 0 # datagrams from unregistered sources
+        self.isStopped = False
+        self.stopEvent = threading.Event()
+        self.stopReadFd, self.stopWriteFd = os.pipe()
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, recvBufferBytes)
+        except Exception as exc:
+            warnAndLog(f"syslogCollector: Failed to set the receive buffer to {recvBufferBytes} bytes.",doPrint=False,exc=exc)
+        try:
+            self.sock.bind(('', port))
+        except OSError as exc:
+            if (exc.errno != errno.EADDRINUSE):
+                raise
+            warnAndLog(f"syslogCollector: Port <{port}> is in use. Using a free one instead.",doPrint=False)
+            self.sock.bind(('', 0))
+        self.sock.setblocking(False)
+        self.port = self.sock.getsockname()[1]
+
+        self.thread = threading.Thread(target=self.receive, daemon=True)
+        getSetting('trash').throwThread(self.thread, "syslogCollector")
+        self.thread.start()
+        printAndLog(f"syslogCollector: Receiving the remote logs on UDP port <{self.port}>.",doPrint=False)
+
+    def addSource (self, sourceIp):
+        """ starts keeping the datagrams of <sourceIp>. Re-adding a source continues its segments. """
+        with self.sourcesLock:
+            if (sourceIp not in self.sources):
+                logsDir = sourceLogsDir(self.rootDir, sourceIp)
+                os.makedirs(logsDir, exist_ok=True)
+                self.sources[sourceIp] = syslogSource(logsDir)
+
+    def hasSource (self, sourceIp):
+        with self.sourcesLock:
+            return (sourceIp in self.sources)
+
+    def receive (self):
+        lastFlush = time.time()
+        try:
+            while (not self.stopEvent.is_set()):
+                readable, _, _ = select.select([self.sock, self.stopReadFd], [], [], self.flushInterval)
+                if (self.sock in readable):
+                    self.storeBatch(self.recvBatch())
+                if ((time.time() - lastFlush) >= self.flushInterval):
+                    self.flushAll()
+                    lastFlush = time.time()
+            # Whatever is still in the socket buffer
+            batch = self.recvBatch()
+            while (batch):
+                self.storeBatch(batch)
+                batch = self.recvBatch()
+        except Exception as exc:
+            errorAndLog("syslogCollector: The receiving thread failed.",doPrint=False,exc=exc)
+        finally:
+            self.closeAll()
+
+    def recvBatch (self):
+        batch = []
+        recvTime = time.time()
+        while (len(batch) < self.batchSize):
+            try:
+                datagram, (sourceIp, _) = self.sock.recvfrom(65535)
+            except (BlockingIOError, InterruptedError):
+                break
+            batch.append((recvTime, sourceIp, datagram))
+        return batch
+
+    def storeBatch (self, batch):
+        with self.sourcesLock:
+            for recvTime, sourceIp, datagram in batch:
+                source = self.sources.get(sourceIp)
+                if (source is None):
+                    self.nIgnored += 1
+                    continue
+                if (source.nBytes >= self.maxBytesPerSource):
+                    source.nDropped += 1
+                    continue
+                message = datagram.rstrip(b'\r\n\0').replace(b'\n', b'\\n')
+                record = f"{recvTime:.6f} {sourceIp} ".encode('utf-8') + message + b'\n'
+                self.getSegment(source, parseSyslogTag(message), recvTime).write(recvTime, record)
+                source.nRecords += 1
+                source.nBytes += len(record)
+
+    def getSegment (self, source, tag, recvTime):
+        if ((tag not in source.segments) and (tag not in source.nextSeq) and (len(source.nextSeq) >= MAX_TAGS_PER_SOURCE)):
+            tag = OTHER_TAG
+        segment = source.segments.get(tag)
+        if ((segment is not None) and ((segment.nBytes >= self.segmentMaxBytes)
+                                        or ((recvTime - segment.openTime) >= self.segmentMaxAge))):
+            self.rotate(source, segment)
+            segment = None
+        if (segment is None):
+            seq = source.nextSeq.get(tag, 0)
+            source.nextSeq[tag] = seq + 1
+            segment = syslogSegment(source.logsDir, tag, seq, self.compressionLevel)
+            source.segments[tag] = segment
+        return segment
+
+    def rotate (self, source, segment):
+        segment.close()
+        del source.segments[segment.tag]
+        source.closedSegments.append(segment.indexEntry())
+        self.writeIndex(source)
+
+    def writeIndex (self, source):
+        """ written to a sibling then renamed, so a reader never sees a partial index """
+        indexFile = os.path.join(source.logsDir, INDEX_FILE)
+        try:
+            with open(f"{indexFile}.tmp", 'w') as fIndex:
+                json.dump(source.indexData(), fIndex, indent=2)
+            os.replace(f"{indexFile}.tmp", indexFile)
+        except Exception as exc:
+            warnAndLog(f"syslogCollector: Failed to write <{indexFile}>.",doPrint=False,exc=exc)
+
+    def flushAll (self):
+        with self.sourcesLock:
+            for source in self.sources.values():
+                if (any(segment.isDirty for segment in source.segments.values())):
+                    for segment in source.segments.values():
+                        segment.flush()
+                    self.writeIndex(source)
+
+    def closeAll (self):
+        with self.sourcesLock:
+            for source in self.sources.values():
+                for segment in list(source.segments.values()):
+                    self.rotate(source, segment)
+                self.writeIndex(source)
+
+    def stop (self, timeout=10):
+        """ drains the socket, closes all the segments, and writes the indexes. Can be called more than once. """
+        if (self.isStopped):
+            return
+        self.isStopped = True
+        self.stopEvent.set()
+        os.write(self.stopWriteFd, b'x')
+        self.thread.join(timeout=timeout)
+        if (self.thread.is_alive()):
+            warnAndLog("syslogCollector: The receiving thread did not stop in time.",doPrint=False)
+        self.sock.close()
+        os.close(self.stopReadFd)
+        os.close(self.stopWriteFd)
+        with self.sourcesLock:
+            for sourceIp, source in self.sources.items():
+                printAndLog(f"syslogCollector: <{sourceIp}>: {source.nRecords} record(s) in "
+                    f"{len(source.closedSegments)} segment(s), {source.nDropped} dropped over the quota.",doPrint=False)
+            if (self.nIgnored > 0):
+                printAndLog(f"syslogCollector: Ignored {self.nIgnored} datagram(s) from unknown sources.",doPrint=False)
+
+def readSegment (segmentPath):
+    """ yields the records (lines) of a segment. An incomplete last frame (a crash while writing) ends it. """
+    with open(segmentPath, 'rb') as fSegment:
+        reader = zstandard.ZstdDecompressor().stream_reader(fSegment, read_across_frames=True)
+        pending = b''
+        try:
+            while True:
+                chunk = reader.read(1024*1024)
+                if (not chunk):
+                    break
+                lines = (pending + chunk).split(b'\n')
+                pending = lines.pop()
+                for line in lines:
+                    yield line.decode('utf-8', errors='replace')
+        except zstandard.ZstdError:
+            pass
+
+def searchSyslogs (logsDir, tags=None, since=None, until=None, pattern=None):
+    """
+    yields (receiveTime, sourceIp, tag, message) from the collected logs of one source, in the order
+    of the segments. Only the segments of <tags> that overlap [since, until] are opened. <pattern> is
+    a regex matched against the message.
+    """
+    indexFile = os.path.join(logsDir, INDEX_FILE)
+    with open(indexFile, 'r') as fIndex:
+        index = json.load(fIndex)
+    xPattern = re.compile(pattern) if (pattern is not None) else None
+    for segment in index['segments']:
+        if ((tags is not None) and (segment['tag'] not in tags)):
+            continue
+        if (((since is not None) and (segment['lastTime'] < since))
+                or ((until is not None) and (segment['firstTime'] > until))):
+            continue
+        for line in readSegment(os.path.join(logsDir, segment['file'])):
+            recvTime, sourceIp, message = line.split(' ', 2)
+            recvTime = float(recvTime)
+            if (((since is not None) and (recvTime < since)) or ((until is not None) and (recvTime > until))):
+                continue
+            if ((xPattern is not None) and (not xPattern.search(message))):
+                continue
+            yield (recvTime, sourceIp, segment['tag'], message)
@@ -0,0 +1,231 @@
+#! /usr/bin/env python3
+"""
+An in-process multiplexer exposing a target console (the fd of its pexpect process) on a TCP port.
+
+The console fd is read once, by one thread, and its output is copied to the tty log and to every
+connected client. Each client has a bounded output buffer, so a slow client never stalls the console
+reads: depending on <slowClientPolicy>, its oldest pending output is dropped ('drop'), or it is
+disconnected ('disconnect').
+
+The input is arbitrated with a lease: the client that types holds the console until it stays quiet
+for <inputLeaseTimeout> seconds (or disconnects). The input of the other clients is discarded
+meanwhile, so two users never interleave their keystrokes.
+
+Nothing here depends on the target, so it can be exercised with any pty (e.g. a pexpect spawn of a shell).
+"""
+
+import os, socket, select, threading, time
+
+from besspin.base.utils.misc import *
+
+SLOW_CLIENT_POLICIES = ['drop', 'disconnect']
+READ_SIZE = 4096
+# The pending input of the console is bounded too (the console may not consume it)
+MAX_INPUT_BUFFER = 64*1024
+
+class UartClient:
+    def __init__ (self, sock, address):
+        self.sock = sock
+        self.address = f"{address[0]}:{address[1]}"
+        self.outBuffer = bytearray()
+        self.nDropped = 0
+
+class UartMultiplexer(threading.Thread):
+    def __init__ (self, consoleFd, port, nameInfo='', logFile=None, maxClients=8, clientBufferBytes=256*1024,
+                    slowClientPolicy='drop', inputLeaseTimeout=2, bindHost=''):
+        if (slowClientPolicy not in SLOW_CLIENT_POLICIES):
+            logAndExit(f"UartMultiplexer: Unknown slow client policy <{slowClientPolicy}>. "
+                f"Should be one of {SLOW_CLIENT_POLICIES}.",exitCode=EXIT.Dev_Bug)
+        self.consoleFd = consoleFd
+        self.nameInfo = nameInfo
+        self.logFile = logFile
+        self.maxClients = maxClients
+        self.clientBufferBytes = clientBufferBytes
+        self.slowClientPolicy = slowClientPolicy
+        self.inputLeaseTimeout = inputLeaseTimeout
+
+        self.clients = dict() # socket -> UartClient
+        self.inputBuffer = bytearray() # to the console
+        self.leaseHolder = None
+        self.leaseTime = 0
+        self.nInputDiscarded = 0
+        self.isConsoleClosed = False
+
+        self.listenSock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listenSock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listenSock.bind((bindHost, port))
+        self.listenSock.listen(maxClients)
+        self.listenSock.setblocking(False)
+        self.port = self.listenSock.getsockname()[1]
+
+        self.stopReadFd, self.stopWriteFd = os.pipe()
+        self.stopPiping = threading.Event()
+        # The console fd goes back to pexpect after stop, in its original mode
+        self.wasConsoleBlocking = os.get_blocking(consoleFd)
+        os.set_blocking(consoleFd, False)
+
+        threading.Thread.__init__(self)
+        self.daemon = True
+        getSetting('trash').throwThread(self,f"<UartMultiplexer>{nameInfo}")
+
+    def run (self):
+        try:
+            while (not self.stopPiping.is_set()):
+                rList = [self.stopReadFd, self.listenSock] + list(self.clients)
+                wList = [xSock for xSock, client in self.clients.items() if (client.outBuffer)]
+                if (not self.isConsoleClosed):
+                    rList.append(self.consoleFd)
+                    if (self.inputBuffer):
+                        wList.append(self.consoleFd)
+                readable, writable, _ = select.select(rList, wList, [], 1)
+                if (self.consoleFd in readable):
+                    self.readConsole()
+                if (self.listenSock in readable):
+                    self.acceptClient()
+                for xSock in readable:
+                    if (xSock in self.clients):
+                        self.readClient(self.clients[xSock])
+                if (self.consoleFd in writable):
+                    self.writeConsole()
+                for xSock in writable:
+                    if (xSock in self.clients):
+                        self.writeClient(self.clients[xSock])
+        except Exception as exc:
+            errorAndLog(f"{self.nameInfo}UartMultiplexer: The piping failed.",doPrint=False,exc=exc)
+        finally:
+            for client in list(self.clients.values()):
+                self.dropClient(client, "piping stopped")
+            self.listenSock.close()
+
+    def readConsole (self):
+        try:
+            data = os.read(self.consoleFd, READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError: # EIO: the console process exited
+            data = b''
+        if (not data):
+            warnAndLog(f"{self.nameInfo}UartMultiplexer: The console was closed.",doPrint=False)
+            self.isConsoleClosed = True
+            return
+        self.logOutput(data)
+        for client in list(self.clients.values()):
+            client.outBuffer += data
+            excess = len(client.outBuffer) - self.clientBufferBytes
+            if (excess > 0):
+                if (self.slowClientPolicy == 'disconnect'):
+                    self.dropClient(client, "too slow")
+                else:
+                    del client.outBuffer[:excess]
+                    client.nDropped += excess
+
+    def logOutput (self, data):
+        """ the console reads bypass pexpect, so the tty log is fed here """
+        if ((self.logFile is None) or self.logFile.closed):
+            return
+        try:
+            self.logFile.write(data if ('b' in self.logFile.mode) else data.decode('utf-8', errors='replace'))
+            self.logFile.flush()
+        except Exception as exc:
+            warnAndLog(f"{self.nameInfo}UartMultiplexer: Failed to log the console output.",doPrint=False,exc=exc)
+            self.logFile = None
+
+    def acceptClient (self):
+        try:
+            xSock, address = self.listenSock.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        if (len(self.clients) >= self.maxClients):
+            warnAndLog(f"{self.nameInfo}UartMultiplexer: Refused <{address[0]}:{address[1]}>. "
+                f"There are already {self.maxClients} clients.",doPrint=False)
+            xSock.close()
+            return
+        xSock.setblocking(False)
+        client = UartClient(xSock, address)
+        self.clients[xSock] = client
+        printAndLog(f"{self.nameInfo}UartMultiplexer: <{client.address}> connected.",doPrint=False)
+
+    def readClient (self, client):
+        try:
+            data = client.sock.recv(READ_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if (not data):
+            self.dropClient(client, "disconnected")
+            return
+        now = time.time()
+        if ((self.leaseHolder not in [None, client]) and ((now - self.leaseTime) < self.inputLeaseTimeout)):
+            self.nInputDiscarded += len(data)
+            return
+        if (self.leaseHolder is not client):
+            printAndLog(f"{self.nameInfo}UartMultiplexer: <{client.address}> holds the console input.",doPrint=False)
+        self.leaseHolder = client
+        self.leaseTime = now
+        if (self.isConsoleClosed):
+            return
+        if ((len(self.inputBuffer) + len(data)) > MAX_INPUT_BUFFER):
+            self.nInputDiscarded += len(data)
+        else:
+            self.inputBuffer += data
+
+    def writeConsole (self):
+        try:
+            nWritten = os.write(self.consoleFd, self.inputBuffer)
+        except BlockingIOError:
+            return
+        except OSError:
+            self.isConsoleClosed = True
+            self.inputBuffer.clear()
+            return
+        del self.inputBuffer[:nWritten]
+
+    def writeClient (self, client):
+        try:
+            nSent = client.sock.send(client.outBuffer)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self.dropClient(client, "disconnected")
+            return
+        del client.outBuffer[:nSent]
+
+    def dropClient (self, client, reason):
+        self.clients.pop(client.sock, None)
+        if (self.leaseHolder is client):
+            self.leaseHolder = None
+        try:
+            client.sock.close()
+        except Exception:
+            pass
+        printAndLog(f"{self.nameInfo}UartMultiplexer: <{client.address}> {reason}. "
+            f"{client.nDropped} byte(s) of its output were dropped.",doPrint=False)
+
+    def getClientsAddresses (self):
+        return [client.address for client in list(self.clients.values())]
+
+    def stop (self):
+        self.stopPiping.set()
+        os.write(self.stopWriteFd, b'x')
+        self.join(timeout=5)
+        if (self.is_alive()):
+            warnAndLog(f"{self.nameInfo}UartMultiplexer: The piping thread did not stop in time.",doPrint=False)
+        os.close(self.stopReadFd)
+        os.close(self.stopWriteFd)
+        try:
+            os.set_blocking(self.consoleFd, self.wasConsoleBlocking)
+        except OSError:
+            pass # The console is already closed
+        if (self.nInputDiscarded > 0):
+            printAndLog(f"{self.nameInfo}UartMultiplexer: {self.nInputDiscarded} byte(s) of input were discarded.",doPrint=False)
+
+@decorate.debugWrap
+def startUartMultiplexer(xTarget, port, nameInfo=''):
+    """ returns the started multiplexer of the target's console on <port> """
+    muxInfo = getSetting('uartMuxInfo')
+    uartMux = UartMultiplexer(xTarget.process.child_fd, port, nameInfo=nameInfo, logFile=xTarget.fTtyOut,
+                maxClients=muxInfo['maxClients'], clientBufferBytes=muxInfo['clientBufferBytes'],
+                slowClientPolicy=muxInfo['slowClientPolicy'], inputLeaseTimeout=muxInfo['inputLeaseTimeout'])
+    uartMux.start()
+    return uartMux
@@ -0,0 +1,24 @@
+# Report the configuration state of the VCU118 FPGA (without programming it)
+# Should be called as follows:
+# vivado_lab -source ./get_hw_state.tcl -log ./get_hw_state.log -mode batch -tclargs <target name>
+
+if { [llength $argv] != 1 } {
+    puts "ERROR! Did not pass proper number of arguments to this script."
+    puts "arguments: target name     (example: localhost:3121/xilinx_tcf/Digilent/210308A5F7BB)"
+    exit -1
+}
+set hwtarget [lindex $argv 0]
+
+open_hw
+connect_hw_server
+current_hw_target $hwtarget
+open_hw_target -verbose
+current_hw_device [get_hw_devices xcvu9p_0]
+refresh_hw_device -verbose -update_hw_probes false [current_hw_device]
+puts "hwDone=<[get_property REGISTER.CONFIG_STATUS.BIT14_DONE_PIN [current_hw_device]]>"
+puts "hwUserCode=<[get_property REGISTER.USERCODE [current_hw_device]]>"
+
+close_hw_target
+disconnect_hw_server
+close_hw
+exit 0
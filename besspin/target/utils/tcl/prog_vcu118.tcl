@@ -136,6 +136,10 @@ if { [string equal "$option" "bitstream_nonpersistent"] } {
         PROGRAM.FILE $bitstream
     ] [current_hw_device]
     program_hw_devices -verbose
+    # The state the next runs verify before skipping the programming
+    refresh_hw_device -verbose -update_hw_probes false [current_hw_device]
+    puts "hwDone=<[get_property REGISTER.CONFIG_STATUS.BIT14_DONE_PIN [current_hw_device]]>"
+    puts "hwUserCode=<[get_property REGISTER.USERCODE [current_hw_device]]>"
 }
 
 # Close and disconnect
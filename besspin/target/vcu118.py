@@ -11,10 +11,13 @@ from besspin.target.build import getTargetIp, getTargetMac, freeRTOSBuildChecks,
 import subprocess, psutil, tftpy
 import serial, serial.tools.list_ports, usb
 import sys, signal, os, socket, time
-import pexpect, threading
+import pexpect, threading, hashlib
 from pexpect import fdpexpect
 from math import sqrt
 
+# Bump when the smoke ELF of the UART search changes in a way its cache key does not capture
+SMOKE_ELF_CACHE_VERSION = 1
+
 class vcu118Target (fpgaTarget, commonTarget):
     def __init__ (self, targetId=None):
 
@@ -29,6 +32,7 @@ class vcu118Target (fpgaTarget, commonTarget):
         self.macTarget = getTargetMac(targetId=targetId)
 
         self.uartSession = None
+        self.uartProbeHwId = None #the fpga hw ID searched for by the UART probe (findTheRightUartDevice)
 
         #Reloading till the network is up
         self.freertosNtkRetriesMax = 3
@@ -253,33 +257,60 @@ class vcu118Target (fpgaTarget, commonTarget):
         time.sleep(5)
         return
 
+    @decorate.debugWrap
+    @decorate.timeWrap
+    def findJtagUsbDevice(self,exitIfNotFound=True):
+        """ returns (bus, dev) of the USB device connected to the JTAG of this hw target """
+        hwId = getSetting('vcu118HwTarget',targetId=self.targetId).split('/')[-1]
+        jtagUsbDevice = findUsbDeviceBySerialNumber(hwId)
+        if ((jtagUsbDevice is not None) or (not exitIfNotFound)):
+            return jtagUsbDevice
+        logAndExit(f"{self.targetIdInfo}findJtagUsbDevice: Failed to find the USB port that is connected to "
+            f"the JTAG of HW ID <{hwId}>.",exitCode=EXIT.Configuration)
+
+    @decorate.debugWrap
+    def getJtagUsbLocation(self):
+        """ returns bus-port[.port...] of the JTAG of this hw target, or None if it cannot be found """
+        jtagUsbDevice = self.findJtagUsbDevice(exitIfNotFound=False)
+        if (jtagUsbDevice is None):
+            return None
+        bus, dev = jtagUsbDevice
+        return f"{bus.location}-{'.'.join([str(num) for num in dev.dev.port_numbers])}"
+
+    @decorate.debugWrap
+    @decorate.timeWrap
+    def getJtagResource(self):
+        # The JTAG operations of boards on different adapters (or hubs) do not contend
+        scope = getSetting('jtagSchedulingScope')
+        if ((scope == 'global') or (not isEnabled('IsThereMoreThanOneVcu118Target'))):
+            return 'jtag'
+        bus, dev = self.findJtagUsbDevice()
+        portNumbers = [str(num) for num in dev.dev.port_numbers]
+        if (scope == 'hub'):
+            portNumbers = portNumbers[:-1]
+        # resource: usb:bus[-port[.port...]]
+        jtagResource = f"usb:{'-'.join([str(bus.location)] + (['.'.join(portNumbers)] if portNumbers else []))}"
+        printAndLog(f"{self.targetIdInfo}getJtagResource: The JTAG operations are scheduled on <{jtagResource}>.",
+            doPrint=False)
+        return jtagResource
+
     @decorate.debugWrap
     @decorate.timeWrap
     def getOpenocdCustomCfg(self,isReload=False):
         # For many targets, we need to choose on which USB port to start openocd
         if (isEnabled('IsThereMoreThanOneVcu118Target')):
-            hwId = getSetting('vcu118HwTarget',targetId=self.targetId).split('/')[-1]
-            for bus in usb.busses():
-                for dev in bus.devices:
-                    try:
-                        #hasattr() returns true, but getattr gives an error, so we have to work around it
-                        serial_number = dev.dev.serial_number 
-                    except:
-                        continue
-                    if (serial_number == hwId): #Found the USB port connected to the JTAG of this hw target
-                        printAndLog(f"{self.targetIdInfo}getOpenocdCmd: USB device <{dev.dev.address}> is connected to "
-                            f"the JTAG of HW ID <{hwId}>.",doPrint=(not isReload))
-                        try:
-                            usb.util.claim_interface(dev.dev,0)
-                            usb.util.release_interface(dev.dev,0)
-                        except Exception as exc:
-                            warnAndLog(f"{self.targetIdInfo}getOpenocdCustomCfg: Failed to claim the interface "
-                                f"of the USB port connected to the JTAG. Will continue anyway.",
-                                exc=exc, doPrint=(not isReload))
-                        # return: bus-port[.port...]
-                        return f"; adapter usb location {bus.location}-{'.'.join([str(num) for num in dev.dev.port_numbers])}"
-            logAndExit(f"{self.targetIdInfo}getOpenocdCmd: Failed to find the USB port that is connected to "
-                f"the JTAG of HW ID <{hwId}>.",exitCode=EXIT.Configuration)
+            bus, dev = self.findJtagUsbDevice()
+            printAndLog(f"{self.targetIdInfo}getOpenocdCmd: USB device <{dev.dev.address}> is connected to "
+                f"the JTAG of HW ID <{dev.dev.serial_number}>.",doPrint=(not isReload))
+            try:
+                usb.util.claim_interface(dev.dev,0)
+                usb.util.release_interface(dev.dev,0)
+            except Exception as exc:
+                warnAndLog(f"{self.targetIdInfo}getOpenocdCustomCfg: Failed to claim the interface "
+                    f"of the USB port connected to the JTAG. Will continue anyway.",
+                    exc=exc, doPrint=(not isReload))
+            # return: bus-port[.port...]
+            return f"; adapter usb location {bus.location}-{'.'.join([str(num) for num in dev.dev.port_numbers])}"
         else:
             # In case of a single board, the openocd configuration in `besspin/target/utils/openocd_vcu118.cfg`
             # uses `ftdi_vid_pid` to select the device with the correct vendor ID and product ID, so no need
@@ -288,31 +319,35 @@ class vcu118Target (fpgaTarget, commonTarget):
 
     @decorate.debugWrap
     @decorate.timeWrap
-    def setupUart(self): #The execution of this method is protected by openocdLock in fpga.py
+    def fpgaReload (self, elfPath, elfLoadTimeout=15, stage=failStage.unknown):
+        # A reload from the UART search (the smoke program failed) ends its probe first, since the
+        # reloaded start searches again. The search is then abandoned (see findTheRightUartDevice).
+        if (self.uartProbeHwId is not None):
+            getSetting('vcu118UartDevices').endProbe(self.uartProbeHwId,timeout=0)
+            self.uartProbeHwId = None
+        return fpgaTarget.fpgaReload(self, elfPath, elfLoadTimeout=elfLoadTimeout, stage=stage)
+
+    @decorate.debugWrap
+    @decorate.timeWrap
+    def setupUart(self): #The JTAG resource of the target is not held during this method, but for the UART search (fpga.py)
         if (not doesSettingExist('vcu118UartDevice',targetId=self.targetId)):
-            if (not doesSettingExist('vcu118UartDevices')):
-                objUartDevices = self.findUartDevices()
-                setSetting('vcu118UartDevices',objUartDevices)
-                if (isEqSetting('mode','cyberPhys')):
-                    if ((getSetting('nVcu118Targets') > len(objUartDevices.getAllUartDevices()))):
-                        logAndExit(f"{self.targetIdInfo}setupUart: Number of UART devices "
-                            f"(={len(objUartDevices.getAllUartDevices())}) < Number of vcu118 targets "
-                            f"(={getSetting('nVcu118Targets')}).",exitCode=EXIT.Configuration)
+            with getSetting('vcu118UartLock'):
+                if (not doesSettingExist('vcu118UartDevices')):
+                    objUartDevices = self.findUartDevices()
+                    setSetting('vcu118UartDevices',objUartDevices)
+                    if (isEqSetting('mode','cyberPhys')):
+                        if ((getSetting('nVcu118Targets') > len(objUartDevices.getAllUartDevices()))):
+                            logAndExit(f"{self.targetIdInfo}setupUart: Number of UART devices "
+                                f"(={len(objUartDevices.getAllUartDevices())}) < Number of vcu118 targets "
+                                f"(={getSetting('nVcu118Targets')}).",exitCode=EXIT.Configuration)
 
             objUartDevices = getSetting('vcu118UartDevices')
-            uartSNs = objUartDevices.getAllUartSNs()
-
-            if (len(uartSNs)==0):
-                logAndExit(f"{self.targetIdInfo}setupUart: The uart devices list is empty!", exitCode=EXIT.Configuration)
-            elif(len(uartSNs)==1):
-                uartSN = uartSNs.pop(0)
-            else:
-                uartSN = self.findTheRightUartDevice(objUartDevices)
+            uartSN = self.findTheRightUartDevice(objUartDevices)
+            if (uartSN is None): #The target was reloaded during the search, which set up the uart
+                return True
             logging.debug(f"{self.targetIdInfo}setupUart: uartSN is <{uartSN}>.")
-            uartDevice = objUartDevices.getUartDevice(uartSN)
-            objUartDevices.removeUartDevice(uartSN)
             fpgaHwId = getSetting('vcu118HwTarget',targetId=self.targetId).split('/')[-1]
-            objUartDevices.associateFpgaHwId(uartSN,fpgaHwId)
+            uartDevice = objUartDevices.claimUartDevice(uartSN,fpgaHwId,self.getJtagUsbLocation())
             printAndLog(f"{self.targetIdInfo}setupUart: Will use <{uartDevice}>.")
             uartSessionDict = self.startUartSession(uartDevice)
         else:
@@ -326,6 +361,7 @@ class vcu118Target (fpgaTarget, commonTarget):
         setSetting('vcu118UartDevice',self.uartDevice,targetId=self.targetId)
         #The main process is the ttyProcess by default
         self.process = self.ttyProcess
+        return False
 
     @decorate.debugWrap
     @decorate.timeWrap
@@ -398,70 +434,49 @@ class vcu118Target (fpgaTarget, commonTarget):
     @decorate.debugWrap
     @decorate.timeWrap
     def findTheRightUartDevice(self,objUartDevices):
-        """ Brute Force search for the uart devices """
+        """ Brute Force search for the uart devices, unless a saved association is still valid.
+        Returns None if the target was reloaded during the search (then started with its uart set up). """
         hwId = getSetting('vcu118HwTarget',targetId=self.targetId).split('/')[-1]
         
-        # Check if it's saved
-        uartSN = objUartDevices.getUartSerialNumber(hwId,"fpgaHwId")
+        # Check if it's saved, and if the USB topology did not change since
+        uartSN = objUartDevices.getSavedUartSerialNumber(hwId,self.getJtagUsbLocation(),checkTopology=(not self.flashMode))
         if (uartSN is not None):
             logging.debug(f"{self.targetIdInfo}findTheRightUartDevice: Already associated with <{uartSN}>.")
             return uartSN
+        # A single device left can only be this one
+        uartSNs = objUartDevices.getAllUartSNs()
+        if (len(uartSNs)==0):
+            logAndExit(f"{self.targetIdInfo}setupUart: The uart devices list is empty!", exitCode=EXIT.Configuration)
+        elif ((len(uartSNs)==1) and (not objUartDevices.isProbing())):
+            return uartSNs[0]
         logging.debug(f"{self.targetIdInfo}findTheRightUartDevice: searching among <{','.join(objUartDevices.getAllUartDevices())}>.")
 
         #Prepare the minimal ELF
         smokeElf = self.buildSmokeElfForUartSearch(hwId)
 
-        #Start listening on all UART devices
-        uartDevicesDict = {}
-        for uartDevice in objUartDevices.getAllUartDevices(): #No need to thread this as it should be immediate
-            uartDevicesDict[uartDevice] = self.startUartSession(uartDevice,ttyDir=os.path.dirname(smokeElf))
+        #Start listening on all UART devices (shared with the other targets searching at the same time)
+        objUartDevices.startProbe(self,hwId)
+        self.uartProbeHwId = hwId
         
-        #Run the smoke program
+        #Run the smoke program. Like the main program, it needs the JTAG resource of the target.
+        self.acquireJtag(operation='uartSearch')
         self.gdbProgStart(smokeElf,10,mainProg=False)
+        if (self.uartProbeHwId is None): #gdbProgStart reloaded the target (fpgaReload ended the probe)
+            return None
         
-        def checkUartDevice(uartDevice,uartDevicesDict):
-            _,uartDevicesDict[uartDevice]['wasTimeout'],_ = self.expectFromTarget(
-                hwId, f"Searching for the UART connected to {hwId}",
-                exitOnError=False, timeout=3, issueInterrupt=False,
-                suppressWarnings=True,process=uartDevicesDict[uartDevice]['ttyProcess'])
-            logging.debug(f"{self.targetIdInfo}Closing uart_session <{uartDevice}>.")
-            try:
-                uartDevicesDict[uartDevice]['uartSession'].close()
-            except Exception as exc:
-                warnAndLog(f"{self.targetIdInfo}findTheRightUartDevice: unable to close the serial "
-                    f" session on {uartDevice}.",exc=exc,doPrint=False)
-            fTtyOut = uartDevicesDict[uartDevice]['fTtyOut']
-            try:
-                fTtyOut.close()
-            except Exception as exc:
-                warnAndLog(f"{self.targetIdInfo}findTheRightUartDevice: Failed to close "
-                    f" <{fTtyOut.name}>.",doPrint=False,exc=exc)
-
-        #Check which one received the text
-        for uartDevice in objUartDevices.getAllUartDevices():
-            xThread = threading.Thread(target=checkUartDevice, args=(uartDevice,uartDevicesDict))
-            uartDevicesDict[uartDevice]['checkThread'] = xThread
-            xThread.daemon = True
-            getSetting('trash').throwThread(xThread,f"checkUartDevice-target{self.targetId}-{self.targetId}-{uartDevice}")
-            xThread.start()
-
-        goldenDevice = None
-        for uartDevice in objUartDevices.getAllUartDevices():
-            uartDevicesDict[uartDevice]['checkThread'].join()
-            if (not uartDevicesDict[uartDevice]['wasTimeout']):
-                if (goldenDevice is not None):
-                    warnAndLog(f"{self.targetIdInfo}findTheRightUartDevice: <{uartDevice}> received the text too!")
-                else:
-                    goldenDevice = uartDevice
+        #Wait for the text to show on one of the devices
+        goldenDevice = objUartDevices.endProbe(hwId,timeout=3)
+        self.uartProbeHwId = None
 
         #Close gdb with the smoke program
         self.interruptGdb()
         self.gdbDetach()
         self.runCommandGdb("quit",endsWith=pexpect.EOF,exitOnError=False)
+        self.releaseJtag()
         try:
             self.fGdbOut.close()
         except Exception as exc:
-            warnAndLog(f"{self.targetIdInfo}findTheRightUartDevice: Failed to close <{xFile.name}>.",doPrint=False,exc=exc)
+            warnAndLog(f"{self.targetIdInfo}findTheRightUartDevice: Failed to close <{self.fGdbOut.name}>.",doPrint=False,exc=exc)
 
         if (goldenDevice is not None):
             logging.debug(f"{self.targetIdInfo}findTheRightUartDevice: golden device is {goldenDevice}.")
@@ -475,6 +490,26 @@ class vcu118Target (fpgaTarget, commonTarget):
     @decorate.timeWrap
     def buildSmokeElfForUartSearch(self,hwId):
         freeRTOSBuildChecks(targetId=self.targetId,freertosFork="classic")
+        srcDir = os.path.join(getSetting('repoDir'),'besspin','target','utils','srcMinimalFreeRTOS')
+
+        # The smoke ELF only depends on these, so it is reused across runs
+        try:
+            forkCommit = subprocess.run(['git','-C',getSetting('FreeRTOSforkDir'),'describe','--always','--dirty'],
+                            capture_output=True,timeout=10).stdout.decode('utf-8').strip()
+        except Exception as exc:
+            forkCommit = None
+            warnAndLog(f"{self.targetIdInfo}buildSmokeElfForUartSearch: Failed to describe the FreeRTOS fork.",
+                exc=exc,doPrint=False)
+        srcHashes = {srcFile : hashlib.sha256(ftReadLines(os.path.join(srcDir,srcFile),splitLines=False).encode('utf-8')).hexdigest()
+                        for srcFile in sorted(os.listdir(srcDir))}
+        cacheKey = hashJsonData([SMOKE_ELF_CACHE_VERSION, hwId, srcHashes, forkCommit,
+                        [getSetting(setting,targetId=self.targetId) for setting in ['binarySource','xlen','procLevel','procFlavor']],
+                        [getSetting(setting) for setting in ['cross-compiler','linker']]])
+        cachedElf = os.path.join(getCacheDir('uartSmokeElf'),f"{cacheKey}.elf")
+        if (os.path.isfile(cachedElf)):
+            logging.debug(f"{self.targetIdInfo}buildSmokeElfForUartSearch: Using the cached <{cachedElf}>.")
+            return cachedElf
+
         if (not doesSettingExist('buildDir',targetId=self.targetId)): #In case of busybox for instance
             buildDir = os.path.join(getSetting('workDir'), f'build{self.targetSuffix}')
             mkdir(buildDir)
@@ -483,7 +518,7 @@ class vcu118Target (fpgaTarget, commonTarget):
         mkdir(buildDir)
 
         #Copy the C files
-        copyDir(os.path.join(getSetting('repoDir'),'besspin','target','utils','srcMinimalFreeRTOS'),buildDir,copyContents=True)
+        copyDir(srcDir,buildDir,copyContents=True)
 
         #The needed configs
         fConfig = ftOpenFile(os.path.join(buildDir,'besspinFreeRTOSConfig.h'),'a')
@@ -497,26 +532,71 @@ class vcu118Target (fpgaTarget, commonTarget):
         #build the elf
         buildFreeRTOS(doPrint=False, targetId=self.targetId, buildDir=buildDir)
 
-        return os.path.join(buildDir,'FreeRTOS.elf')
+        #Cache it (through a temporary sibling, so a concurrent run never loads a partial file)
+        tmpElf = f"{cachedElf}.{os.getpid()}.tmp"
+        cp(os.path.join(buildDir,'FreeRTOS.elf'),tmpElf)
+        try:
+            os.replace(tmpElf,cachedElf)
+        except Exception as exc:
+            warnAndLog(f"{self.targetIdInfo}buildSmokeElfForUartSearch: Failed to cache the smoke ELF.",exc=exc,doPrint=False)
+            return os.path.join(buildDir,'FreeRTOS.elf')
+        return cachedElf
 
 
 #--- END OF CLASS vcu118Target------------------------------
 class UartDevices:
+    """
+    The UART devices of the vcu118 boards, and their persistent association with the boards.
+    The saved map is {uartSerialNumber : {fpgaHwId, uartLocation, jtagLocation}}; the locations
+    are the USB port paths. An association is trusted without probing as long as both the UART
+    and the JTAG are still at the same USB locations.
+    Several targets can probe at once: the unassociated devices are opened once and shared, and
+    each device is dispatched to the target whose hwId it receives.
+    """
     def __init__(self):
         # Load the saved map if any
-        self._uartHwIdMap = safeLoadJsonFile (getSetting("uartDevicesSavedMap"), emptyIfNoFile=True)
+        self._uartHwIdMap = dict()
+        for serialNumber, association in safeLoadJsonFile(getSetting("uartDevicesSavedMap"), emptyIfNoFile=True).items():
+            if (not isinstance(association,dict)): # A map saved without the USB topology
+                association = {'fpgaHwId' : association, 'uartLocation' : None, 'jtagLocation' : None}
+            self._uartHwIdMap[serialNumber] = association
         self._uartDevicesMap = {}
+        self._uartLocationsMap = {}
+        # The probing state is shared by the targets
+        self._lock = threading.Lock()
+        self._probeSessions = {} # uartDevice -> uartSessionDict + its listening thread
+        self._probeHits = {} # hwId -> [uartDevice]
+        self._probeEvents = {} # hwId -> threading.Event
 
     def addUartPort(self,objPort):
         serialNumber = objPort.serial_number
         if (serialNumber not in self._uartHwIdMap):
-            self._uartHwIdMap[serialNumber] = None
+            self._uartHwIdMap[serialNumber] = {'fpgaHwId' : None, 'uartLocation' : None, 'jtagLocation' : None}
         self._uartDevicesMap[serialNumber] = objPort.device
+        self._uartLocationsMap[serialNumber] = objPort.location
     
-    def associateFpgaHwId(self,uartSerialNumber,fpgaHwId):
-        self._uartHwIdMap[uartSerialNumber] = fpgaHwId
+    def associateFpgaHwId(self,uartSerialNumber,fpgaHwId,jtagLocation=None):
+        for association in self._uartHwIdMap.values(): # A board has only one UART
+            if (association['fpgaHwId'] == fpgaHwId):
+                association['fpgaHwId'] = None
+        self._uartHwIdMap[uartSerialNumber] = {'fpgaHwId' : fpgaHwId,
+            'uartLocation' : self._uartLocationsMap.get(uartSerialNumber), 'jtagLocation' : jtagLocation}
         self.exportUartMap() #Save it every time the HwIdMap is updated
 
+    def claimUartDevice(self,uartSerialNumber,fpgaHwId,jtagLocation=None):
+        """ Associates the device with the board, and removes it from the available devices """
+        with self._lock:
+            uartDevice = self.getUartDevice(uartSerialNumber)
+            if (uartDevice is None):
+                logAndExit(f"claimUartDevice: The uart device <{uartSerialNumber}> is not available.",exitCode=EXIT.Run)
+            self.removeUartDevice(uartSerialNumber)
+            self.associateFpgaHwId(uartSerialNumber,fpgaHwId,jtagLocation=jtagLocation)
+            probeSession = self._probeSessions.pop(uartDevice,None)
+        if (probeSession is not None): # Stop listening on it before the target opens it
+            probeSession['stopListening'].set()
+            probeSession['listenThread'].join()
+        return uartDevice
+
     def getUartDevice(self,serialNumber):
         if (serialNumber in self._uartDevicesMap):
             return self._uartDevicesMap[serialNumber]
@@ -525,7 +605,7 @@ class UartDevices:
 
     def getUartSerialNumber(self,val,valType):
         if (valType == "fpgaHwId"):
-            xDict = self._uartHwIdMap
+            xDict = {serialNumber : association['fpgaHwId'] for serialNumber, association in self._uartHwIdMap.items()}
         elif (valType == "uartDevice"):
             xDict = self._uartDevicesMap
         else:
@@ -535,6 +615,20 @@ class UartDevices:
                 return serialNumber
         return None
 
+    def getSavedUartSerialNumber(self,fpgaHwId,jtagLocation,checkTopology=True):
+        """ returns the saved uart serial number of the board if it is available, and (if checkTopology)
+        if the UART and the JTAG are still at the saved USB locations. Otherwise, None. """
+        serialNumber = self.getUartSerialNumber(fpgaHwId,"fpgaHwId")
+        if ((serialNumber is None) or (serialNumber not in self._uartDevicesMap)):
+            return None
+        association = self._uartHwIdMap[serialNumber]
+        if (checkTopology and ((association['uartLocation'] != self._uartLocationsMap[serialNumber])
+                or (association['jtagLocation'] != jtagLocation) or (jtagLocation is None))):
+            logging.debug(f"getSavedUartSerialNumber: The USB topology of <{fpgaHwId}> changed since it was "
+                f"associated with <{serialNumber}>.")
+            return None
+        return serialNumber
+
     def getAllUartSNs(self):
         return list(self._uartDevicesMap.keys())
 
@@ -547,10 +641,150 @@ class UartDevices:
     def exportUartMap(self):
         safeDumpJsonFile(self._uartHwIdMap, getSetting("uartDevicesSavedMap"))
 
+    def isProbing(self):
+        with self._lock:
+            return (len(self._probeEvents) > 0)
+
+    def startProbe(self,xTarget,fpgaHwId):
+        """ Starts waiting for <fpgaHwId>, and listening on the available devices that are not listened to yet """
+        ttyDir = os.path.join(getSetting('workDir'),'uartProbe')
+        mkdir(ttyDir,exitIfExists=False)
+        with self._lock:
+            self._probeHits[fpgaHwId] = []
+            self._probeEvents[fpgaHwId] = threading.Event()
+            for uartDevice in self.getAllUartDevices():
+                if (uartDevice in self._probeSessions):
+                    continue
+                probeSession = xTarget.startUartSession(uartDevice,ttyDir=ttyDir)
+                probeSession['stopListening'] = threading.Event()
+                probeSession['listenThread'] = threading.Thread(target=self._listenOnDevice, args=(probeSession,))
+                probeSession['listenThread'].daemon = True
+                getSetting('trash').throwThread(probeSession['listenThread'],f"uartProbe-{uartDevice}")
+                self._probeSessions[uartDevice] = probeSession
+                probeSession['listenThread'].start()
+
+    def _listenOnDevice(self,probeSession):
+        while (not probeSession['stopListening'].is_set()):
+            with self._lock:
+                fpgaHwIds = list(self._probeEvents)
+            try:
+                idx = probeSession['ttyProcess'].expect([re.escape(hwId) for hwId in fpgaHwIds] + [pexpect.TIMEOUT],
+                        timeout=0.5)
+            except Exception as exc:
+                warnAndLog(f"uartProbe: Failed to read from <{probeSession['uartDevice']}>.",exc=exc,doPrint=False)
+                break
+            if (idx < len(fpgaHwIds)):
+                with self._lock:
+                    if (fpgaHwIds[idx] in self._probeEvents):
+                        self._probeHits[fpgaHwIds[idx]].append(probeSession['uartDevice'])
+                        self._probeEvents[fpgaHwIds[idx]].set()
+        logging.debug(f"uartProbe: Closing uart_session <{probeSession['uartDevice']}>.")
+        for xName, xClose in [('uartSession', probeSession['uartSession'].close), ('fTtyOut', probeSession['fTtyOut'].close)]:
+            try:
+                xClose()
+            except Exception as exc:
+                warnAndLog(f"uartProbe: Failed to close the {xName} of <{probeSession['uartDevice']}>.",exc=exc,doPrint=False)
+
+    def endProbe(self,fpgaHwId,timeout=3):
+        """ returns the device that received <fpgaHwId> within <timeout> (or None). The devices are
+        released once no target is waiting anymore. """
+        with self._lock:
+            probeEvent = self._probeEvents[fpgaHwId]
+        probeEvent.wait(timeout)
+        with self._lock:
+            del self._probeEvents[fpgaHwId]
+            hits = self._probeHits.pop(fpgaHwId)
+            if (len(self._probeEvents) == 0):
+                probeSessions = list(self._probeSessions.values())
+                self._probeSessions.clear()
+            else:
+                probeSessions = []
+        for probeSession in probeSessions:
+            probeSession['stopListening'].set()
+            probeSession['listenThread'].join()
+        for uartDevice in hits[1:]:
+            warnAndLog(f"findTheRightUartDevice: <{uartDevice}> received the text too!")
+        return hits[0] if (len(hits) > 0) else None
+
 
 #--- END OF CLASSES ------------------------------
 
 _MAX_PROG_ATTEMPTS = 3
+# The USERCODE of a bitstream built without a USERID (e.g. the GFE ones): it does not identify the image
+_DEFAULT_USERCODES = [0xFFFFFFFF, 0x0]
+
+@decorate.debugWrap
+def findUsbDeviceBySerialNumber(serialNumber):
+    """ returns (bus, dev) of the USB device with <serialNumber>, or None """
+    for bus in usb.busses():
+        for dev in bus.devices:
+            try:
+                #hasattr() returns true, but getattr gives an error, so we have to work around it
+                serial_number = dev.dev.serial_number 
+            except:
+                continue
+            if (serial_number == serialNumber):
+                return (bus, dev)
+    return None
+
+@decorate.debugWrap
+def getBitfileResidencyFingerprint(targetId=None):
+    """ A nonpersistent bitfile is lost on a power cycle, which re-enumerates the JTAG USB device (new address) """
+    hwId = getSetting('vcu118HwTarget',targetId=targetId).split('/')[-1]
+    jtagUsbDevice = findUsbDeviceBySerialNumber(hwId)
+    if (jtagUsbDevice is None):
+        jtagUsb = None
+    else:
+        bus, dev = jtagUsbDevice
+        jtagUsb = f"{bus.location}-{'.'.join([str(num) for num in dev.dev.port_numbers])}@{dev.dev.address}"
+    return {'bootId' : getHostBootId(), 'jtagUsb' : jtagUsb}
+
+def parseHwState(logText):
+    """ returns the state printed by the tcl scripts as {'done' : bool, 'userCode' : str}, or None """
+    doneMatch = re.search(r"^hwDone=<(?P<done>[01])>", logText, re.MULTILINE)
+    userCodeMatch = re.search(r"^hwUserCode=<(?P<userCode>\w+)>", logText, re.MULTILINE)
+    if ((doneMatch is None) or (userCodeMatch is None)):
+        return None
+    return {'done' : (doneMatch.group('done') == '1'), 'userCode' : userCodeMatch.group('userCode')}
+
+@decorate.debugWrap
+@decorate.timeWrap
+def getBitfileJtagState(targetId=None):
+    """ reads the configuration state of the FPGA over JTAG (DONE pin and USERCODE). Returns None on failure. """
+    targetInfo = f"<target{targetId}>: " if (targetId) else ''
+    cwd = getSetting('gfeWorkDir',targetId=targetId)
+    cp(os.path.join(getSetting('tclSourceDir'), 'get_hw_state.tcl'), cwd)
+    logFile = os.path.join(cwd,'get_hw_state.log')
+    # Vivado's hw_server enumerates all the cables, so this is exclusive too
+    with getSetting('jtagScheduler').hold(owner=targetId,operation='getBitfileJtagState'):
+        retProc = shellCommand([getSetting('vivadoCmd'),'-nojournal','-source','./get_hw_state.tcl',
+                    '-log', logFile,'-mode','batch','-tclargs',getSetting('vcu118HwTarget',targetId=targetId)],
+                    timeout=90,cwd=cwd,check=False)
+    hwState = parseHwState(ftReadLines(logFile,splitLines=False)) if (retProc.returncode == 0) else None
+    if (hwState is None):
+        warnAndLog(f"{targetInfo}getBitfileJtagState: Failed to read the FPGA state. Check <{logFile}>.",doPrint=False)
+    return hwState
+
+@decorate.debugWrap
+def verifyBitfileJtagState(recordedState, targetId=None):
+    """
+    The board has to be configured (DONE), with the USERCODE it had after the programming. The residency
+    record is per user, and another user or tool may have programmed the board since. So only a USERCODE
+    specific to the image (set with the USERID of the bitstream) is trusted to tell the images apart.
+    """
+    targetInfo = f"<target{targetId}>: " if (targetId) else ''
+    try:
+        recordedUserCode = int(recordedState['userCode'],16)
+    except Exception:
+        recordedUserCode = None
+    if ((recordedUserCode is None) or (recordedUserCode in _DEFAULT_USERCODES)):
+        printAndLog(f"{targetInfo}verifyBitfileJtagState: The bitfile has no specific USERCODE. It has to be programmed.",
+            doPrint=False)
+        return False
+    hwState = getBitfileJtagState(targetId=targetId)
+    if ((hwState is None) or (not hwState['done'])):
+        return False
+    return (hwState['userCode'] == recordedState['userCode'])
 
 @decorate.debugWrap
 @decorate.timeWrap
@@ -586,7 +820,8 @@ def programVcu118(mode, attempts=_MAX_PROG_ATTEMPTS-1, targetId=None, doPrint=Tr
     else:
         logAndExit(f"{targetInfo}programVcu118: Called with a non-recognized mode <{mode}>.",exitCode=EXIT.Dev_Bug)
 
-    with getSetting('openocdLock'):
+    # Vivado's hw_server enumerates all the cables, so programming is exclusive
+    with getSetting('jtagScheduler').hold(owner=targetId,operation=f"programVcu118:{mode}"):
         retProc = shellCommand([getSetting('vivadoCmd'),'-nojournal','-source','./prog_vcu118.tcl',
                     '-log', os.path.join(cwd,'prog_vcu118.log'),'-mode','batch',
                     '-tclargs',tclMode,getSetting('vcu118HwTarget',targetId=targetId),
@@ -609,7 +844,7 @@ def programVcu118(mode, attempts=_MAX_PROG_ATTEMPTS-1, targetId=None, doPrint=Tr
 @decorate.debugWrap
 @decorate.timeWrap
 def prepareFpgaEnv(targetId=None):
-    with getSetting('openocdLock'):
+    with getSetting('jtagScheduler').hold(owner=targetId,operation='prepareFpgaEnv'):
         if (doesSettingExist('vcu118PrepareFpgaEnv') and isEnabled('vcu118PrepareFpgaEnv')):
             firstTime = False
         else:
@@ -618,7 +853,7 @@ def prepareFpgaEnv(targetId=None):
         
         if (firstTime or (not isEqSetting('mode','cyberPhys'))):
             # Clear processes
-            processesList = ['openocd', getSetting('vivadoCmd'), 'hw_server', 'loader', 'pyprogram_fpga']
+            processesList = [os.path.basename(getSetting('openocdCmd')), getSetting('vivadoCmd'), 'hw_server', 'loader', 'pyprogram_fpga']
             if (isEqSetting('mode','cyberPhys')):
                 processesList.append('socat') # targets' UART get piped
             for proc in processesList:
@@ -671,7 +906,7 @@ def prepareFpgaEnv(targetId=None):
 
 @decorate.debugWrap
 @decorate.timeWrap
-def programBitfile (doPrint=True,targetId=None):
+def programBitfile (doPrint=True,targetId=None,forceProgramming=False):
     targetInfo = f"<target{targetId}>: " if (targetId) else ''
     printAndLog(f"{targetInfo}Preparing the VCU118 FPGA...",doPrint=doPrint)
     prepareFpgaEnv(targetId=targetId)
@@ -685,12 +920,26 @@ def programBitfile (doPrint=True,targetId=None):
         setSetting('md5bifile',computeMd5ForFile(bitAndProbefiles[0]),targetId=targetId)
 
     mode = getSetting('vcu118Mode',targetId=targetId)
+    residencyId = f"vcu118-{getSetting('vcu118HwTarget',targetId=targetId).split('/')[-1]}"
     if (mode=='nonPersistent'):
-        printAndLog(f"{targetInfo}Programming the bitfile...",doPrint=doPrint)
-        programVcu118("bitstream",targetId=targetId,doPrint=doPrint)
-        printAndLog(f"{targetInfo}Programmed bitfile {getSetting('bitAndProbefiles',targetId=targetId)[0]} "
-            f"(md5: {getSetting('md5bifile',targetId=targetId)})",doPrint=doPrint)
+        if ((not forceProgramming) and isImageResident(residencyId, getSetting('md5bifile',targetId=targetId),
+                getBitfileResidencyFingerprint(targetId=targetId),
+                verifyState=lambda recordedState: verifyBitfileJtagState(recordedState, targetId=targetId))):
+            printAndLog(f"{targetInfo}Bitfile {getSetting('bitAndProbefiles',targetId=targetId)[0]} "
+                f"(md5: {getSetting('md5bifile',targetId=targetId)}) is already loaded.",doPrint=doPrint)
+        else:
+            setResidentImage(residencyId) # Unknown until programmed
+            printAndLog(f"{targetInfo}Programming the bitfile...",doPrint=doPrint)
+            programVcu118("bitstream",targetId=targetId,doPrint=doPrint)
+            hwState = parseHwState(ftReadLines(os.path.join(getSetting('gfeWorkDir',targetId=targetId),'prog_vcu118.log'),
+                        splitLines=False))
+            if ((hwState is not None) and hwState['done']):
+                setResidentImage(residencyId, getSetting('md5bifile',targetId=targetId),
+                    getBitfileResidencyFingerprint(targetId=targetId), state=hwState)
+            printAndLog(f"{targetInfo}Programmed bitfile {getSetting('bitAndProbefiles',targetId=targetId)[0]} "
+                f"(md5: {getSetting('md5bifile',targetId=targetId)})",doPrint=doPrint)
     elif (mode=='flashProgramAndBoot'):
+        setResidentImage(residencyId) # The flash contents are loaded at the next power cycle
         checkThatUartIsKnownForFlash(targetId=targetId)
         prepareOsBinaryForFlash(targetId=targetId)
         printAndLog(f"{targetInfo}Programming the flash...",doPrint=doPrint)
@@ -0,0 +1,57 @@
+#! /usr/bin/env python3
+
+"""
+--- benchAwsf1Slots.py times the clearing and flashing of the awsf1 FPGA slots against stand-in tools.
+--- usage: benchAwsf1Slots.py [-h] [-n NSLOTS] [-d DELAY] [-a AGFI]
+
+The stand-ins of the AWS FPGA management tools (fpga-describe-local-image-slots, fpga-clear-local-image,
+fpga-load-local-image, fpga-describe-local-image) are in ./awsf1FpgaStubs. This utility puts them first
+on PATH, then runs the tool's awsf1 slots programming (clearFpgas then flashFpgas, on all the slots
+concurrently). Each stand-in slot stays busy for DELAY seconds after it is cleared or loaded.
+The kernel log messages (which need sudo) are skipped.
+"""
+
+import sys, os, argparse, time, tempfile
+
+def main(xArgs):
+    utilsDir = os.path.abspath(os.path.dirname(__file__))
+    repoDir = os.path.abspath(os.path.join(utilsDir,os.pardir))
+    # Let's do this ugly workaround to have this utility use the tool, but not to be part of the tool
+    sys.path.insert(0, repoDir)
+    from besspin.base.utils.misc import setSetting, getSetting, trashCanObj
+    from besspin.target import awsf1
+
+    workDir = tempfile.mkdtemp(prefix='benchAwsf1Slots_')
+    os.environ['PATH'] = os.path.join(utilsDir,'awsf1FpgaStubs') + os.pathsep + os.environ['PATH']
+    os.environ['FPGA_STUB_DIR'] = os.path.join(workDir,'slots')
+    os.environ['FPGA_STUB_SLOTS'] = str(xArgs.nSlots)
+    os.environ['FPGA_STUB_DELAY'] = str(xArgs.delay)
+    setSetting('trash',trashCanObj())
+    setSetting('debugMode',False)
+    setSetting('workDir',workDir)
+    setSetting('agfiId',xArgs.agfi)
+    awsf1._sendKmsg = lambda message: None
+
+    startTime = time.time()
+    awsf1.clearFpgas(doPrint=False)
+    clearTime = time.time() - startTime
+    awsf1.flashFpgas(xArgs.agfi,doPrint=False)
+    totalTime = time.time() - startTime
+
+    agfis = [awsf1.getSlotAgfi(slotno) for slotno in range(xArgs.nSlots)]
+    if (agfis != [xArgs.agfi]*xArgs.nSlots):
+        print(f"(Error)~  The slots are not all loaded with <{xArgs.agfi}>: {agfis}.")
+        exit(1)
+    print(f"(Info)~  {xArgs.nSlots} slot(s) cleared in {clearTime:.2f}s, and cleared+flashed in {totalTime:.2f}s.")
+    print(f"(Info)~  Per slot timings: {getSetting('awsf1SlotsTimings')}.")
+    print(f"(Info)~  The work directory is <{workDir}>.")
+
+if __name__ == '__main__':
+    # Reading the bash arguments
+    xArgParser = argparse.ArgumentParser (description='Times the awsf1 slots clearing and flashing against stand-in FPGA tools.')
+    xArgParser.add_argument ('-n', '--nSlots', help='The number of stand-in slots. Default: 8.', type=int, default=8)
+    xArgParser.add_argument ('-d', '--delay', help='The seconds a slot stays busy after an operation. Default: 0.3.', type=float, default=0.3)
+    xArgParser.add_argument ('-a', '--agfi', help='The AGFI to flash. Default: agfi-stub.', default='agfi-stub')
+
+    xArgs = xArgParser.parse_args()
+    main(xArgs)
@@ -0,0 +1,118 @@
+#! /usr/bin/env python3
+
+"""
+--- benchGdbMi.py exercises and benchmarks the fpga targets gdb sequencing without an FPGA.
+--- usage: benchGdbMi.py [-h] [-l LATENCY] [-n NREPEATS]
+
+The GDB/MI methods of the fpgaTarget class (seqGdbCommands, runMiCommandsGdb, getTargetSnapshot)
+drive fakeGdbMi.py instead of gdb. Every scenario checks what the stand-in hart ends up with, and
+reports its latency and its number of round trips to gdb.
+"""
+
+import sys, os, argparse, time
+
+def main(xArgs):
+    utilsDir = os.path.abspath(os.path.dirname(__file__))
+    repoDir = os.path.abspath(os.path.join(utilsDir,os.pardir))
+    # Let's do this ugly workaround to have this utility use the tool, but not to be part of the tool
+    sys.path.insert(0, repoDir)
+    import pexpect
+    from besspin.base.utils.misc import setSetting, trashCanObj
+    from besspin.target.fpga import fpgaTarget
+
+    setSetting('trash',trashCanObj())
+    setSetting('debugMode',False)
+
+    class standInTarget(fpgaTarget):
+        """ Only the gdb process of an fpga target, talking to the stand-in """
+        def __init__(self, gdbProcess):
+            self.__dict__.update(targetId=None, targetIdInfo='', target='vcu118', processor='stand-in')
+            self.gdbProcess = gdbProcess
+            self.gdbMiToken = 0
+            self.gdbRegNames = None
+            self.nRoundTrips = 0
+            self.invalidateSnapshotCache()
+
+        def runCommandGdb(self, command, endsWith=None, timeout=15, exitOnError=True, **kwargs):
+            endsWith = self.getGdbEndsWith() if endsWith is None else endsWith
+            self.invalidateSnapshotCache()
+            self.nRoundTrips += 1
+            self.gdbProcess.sendline(command)
+            try:
+                self.gdbProcess.expect(endsWith, timeout=timeout)
+            except pexpect.TIMEOUT:
+                if (exitOnError):
+                    self.terminateAndExit(f"runCommandGdb: Timed out on <{command}>.")
+                return [False, self.gdbProcess.before, True, -1]
+            return [True, self.gdbProcess.before + self.gdbProcess.after, False, 0]
+
+        def terminateAndExit(self, message, **kwargs):
+            raise RuntimeError(message)
+
+    gdbProcess = pexpect.spawn(sys.executable, [os.path.join(utilsDir,'fakeGdbMi.py'), '--latency', str(xArgs.latency)],
+                                encoding='utf-8', echo=False, timeout=15)
+    gdbProcess.expect(r"\(gdb\)")
+    target = standInTarget(gdbProcess)
+
+    nFailures = 0
+    def report(scenario, isSuccess, startTime, nRoundTrips):
+        nonlocal nFailures
+        nFailures += 0 if isSuccess else 1
+        print(f"{'PASS' if isSuccess else 'FAIL'} {scenario:<40} {1000*(time.time()-startTime)/xArgs.nRepeats:8.1f} ms "
+              f"{nRoundTrips/xArgs.nRepeats:5.1f} round trip(s)")
+
+    # The softReset commands of bluespec in flash mode, batched then spaced
+    resetCommands = ["set $a0 = 0", "set $a1 = 0x70000020", "set $t0 = 0x44000000", "p $pc = 0x44000000"]
+    for scenario, kwargs in [("reset commands (one batch)", {}), ("reset commands (sleepTime=0)", {'sleepTime':0})]:
+        target.seqGdbCommands(["set $a1 = 0", "set $t0 = 0", "p $pc = 0"])
+        target.nRoundTrips = 0
+        startTime = time.time()
+        for _ in range(xArgs.nRepeats):
+            target.seqGdbCommands(resetCommands, **kwargs)
+        nRoundTrips = target.nRoundTrips
+        regs = target.getRegsValues(['a1', 't0', 'pc'])
+        report(scenario, regs == {'a1':0x70000020, 't0':0x44000000, 'pc':0x44000000}, startTime, nRoundTrips)
+
+    # A failing command fails the batch with gdb's message
+    startTime = time.time()
+    target.nRoundTrips = 0
+    nErrors = 0
+    for _ in range(xArgs.nRepeats):
+        try:
+            target.seqGdbCommands(["set $a0 = 1", "set bad = 1"])
+        except RuntimeError as exc:
+            nErrors += 1 if ('No symbol' in str(exc)) else 0
+    report("failing command", nErrors == xArgs.nRepeats, startTime, target.nRoundTrips)
+
+    # Snapshots: the first one of a stop queries gdb, the next ones are served from the cache.
+    # Only the requested registers are read, even before the register numbers are known.
+    target.seqGdbCommands(["set $mcause = 0xb", "set $sp = 0x3ff0"])
+    for scenario, nRoundTrips in [("snapshot (first of the session)", 2), ("snapshot (first of a stop)", 1),
+                                    ("snapshot (cached)", 0)]:
+        startTime = time.time()
+        target.nRoundTrips = 0
+        isSuccess = True
+        for _ in range(xArgs.nRepeats):
+            if (nRoundTrips == 2):
+                target.gdbRegNames = None
+            if (nRoundTrips > 0):
+                target.invalidateSnapshotCache()
+            snapshot = target.getTargetSnapshot(regNames=['mcause', 'sp'], memRanges=[(0x80000000, 8)])
+            isSuccess &= (snapshot == {'regs' : {'mcause':0xb, 'sp':0x3ff0},
+                                       'mem' : {(0x80000000, 8) : bytes(range(8))}})
+            isSuccess &= (set(target.snapshotCache['regs']) == {'mcause', 'sp'})
+        report(scenario, isSuccess and (target.nRoundTrips == nRoundTrips*xArgs.nRepeats), startTime, target.nRoundTrips)
+
+    gdbProcess.sendline("quit")
+    gdbProcess.expect(pexpect.EOF)
+    print(f"{nFailures} scenario(s) failed.")
+    exit(1 if (nFailures > 0) else 0)
+
+if __name__ == '__main__':
+    # Reading the bash arguments
+    xArgParser = argparse.ArgumentParser (description='Exercises and benchmarks the fpga targets gdb sequencing against a GDB/MI stand-in.')
+    xArgParser.add_argument ('-l', '--latency', help='The seconds each gdb command takes. Default: 0.01.', type=float, default=0.01)
+    xArgParser.add_argument ('-n', '--nRepeats', help='The repetitions of each scenario. Default: 10.', type=int, default=10)
+
+    xArgs = xArgParser.parse_args()
+    main(xArgs)
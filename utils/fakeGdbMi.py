@@ -0,0 +1,103 @@
+#! /usr/bin/env python3
+
+"""
+--- fakeGdbMi.py is a scripted stand-in for the riscv gdb of the fpga targets.
+--- usage: fakeGdbMi.py [-h] [-l LATENCY]
+
+It speaks what the tool sends to gdb: console commands, each answered by a <(gdb)> prompt, and
+the GDB/MI commands wrapped in <interpreter-exec mi "...">. The MI commands used by the tool
+(console commands, register names and values, memory bytes, expressions) are answered with
+their result records. A console command containing <bad> fails with ^error.
+
+Each MI command takes LATENCY seconds, as the JTAG round trip to a hart would. This is used by
+benchGdbMi.py to exercise and benchmark the tool's gdb sequencing without an FPGA.
+"""
+
+import sys, re, time, argparse
+
+REG_NAMES = ['zero', 'ra', 'sp', 'gp', 'tp', 't0', 't1', 't2', 'fp', 's1', 'a0', 'a1', 'pc', 'mstatus', 'mcause', 'mepc']
+
+def unescape(text):
+    return re.sub(r'\\(.)', lambda xMatch: {'n':'\n', 't':'\t'}.get(xMatch.group(1), xMatch.group(1)), text)
+
+def escape(text):
+    return text.replace('\\','\\\\').replace('"','\\"')
+
+class fakeHart:
+    def __init__(self):
+        self.regs = {regName : (0x1000 * iReg) for iReg, regName in enumerate(REG_NAMES)}
+        self.regs['pc'] = 0x80000000
+        self.mem = dict()
+        self.nMiCommands = 0
+
+    def console(self, command):
+        """ returns (isSuccess, message) """
+        if ('bad' in command):
+            return (False, f'No symbol "bad" in current context.')
+        xMatch = re.match(r'(?:set|p)\s+\$(\w+)\s*=\s*(\S+)$', command)
+        if (xMatch is not None):
+            if (xMatch.group(1) not in self.regs):
+                return (False, f'Invalid register `{xMatch.group(1)}\'')
+            self.regs[xMatch.group(1)] = int(xMatch.group(2), 0)
+            return (True, None)
+        xMatch = re.match(r'set\s+\*\(\(\w+\s*\*\)\s*(0x[0-9a-fA-F]+)\)\s*=\s*(\S+)$', command)
+        if (xMatch is not None):
+            self.mem[int(xMatch.group(1), 16)] = int(xMatch.group(2), 0)
+        return (True, None)
+
+    def mi(self, command):
+        """ returns the result record (without the token) """
+        self.nMiCommands += 1
+        words = command.split()
+        if (command.startswith('-interpreter-exec console ')):
+            isSuccess, message = self.console(unescape(re.match(r'-interpreter-exec console "(.*)"$', command).group(1)))
+            return '^done' if isSuccess else f'^error,msg="{escape(message)}"'
+        elif (words[0] == '-data-evaluate-expression'):
+            regName = words[1].lstrip('$')
+            if (regName not in self.regs):
+                return f'^error,msg="No symbol \\"{regName}\\" in current context."'
+            return f'^done,value="0x{self.regs[regName]:x}"'
+        elif (words[0] == '-data-list-register-names'):
+            iRegs = [int(word) for word in words[1:]] or range(len(REG_NAMES))
+            return '^done,register-names=[' + ','.join(f'"{REG_NAMES[iReg]}"' for iReg in iRegs) + ']'
+        elif (words[0] == '-data-list-register-values'):
+            iRegs = [int(word) for word in words[1:] if word.isdigit()] or range(len(REG_NAMES))
+            return '^done,register-values=[' + ','.join(
+                f'{{number="{iReg}",value="0x{self.regs[REG_NAMES[iReg]]:x}"}}' for iReg in iRegs) + ']'
+        elif (words[0] == '-data-read-memory-bytes'):
+            address, nBytes = int(words[1], 0), int(words[2])
+            contents = ''.join(f'{(address + iByte) & 0xff:02x}' for iByte in range(nBytes))
+            return (f'^done,memory=[{{begin="0x{address:x}",offset="0x0",end="0x{address+nBytes:x}",'
+                    f'contents="{contents}"}}]')
+        return f'^error,msg="Undefined MI command: {escape(words[0])}"'
+
+def main(xArgs):
+    hart = fakeHart()
+    sys.stdout.write("(gdb) ")
+    sys.stdout.flush()
+    for line in sys.stdin:
+        line = line.rstrip('\r\n')
+        xMatch = re.match(r'interpreter-exec mi "(.*)"$', line)
+        if (xMatch is not None):
+            xMatch = re.match(r'(\d*)(.*)$', unescape(xMatch.group(1)))
+            time.sleep(xArgs.latency)
+            sys.stdout.write(f"{xMatch.group(1)}{hart.mi(xMatch.group(2))}\n")
+        elif (line.startswith('echo ')):
+            sys.stdout.write(unescape(line[5:]))
+        elif (line in ['quit', 'q']):
+            break
+        elif (line):
+            time.sleep(xArgs.latency)
+            isSuccess, message = hart.console(line)
+            if (not isSuccess):
+                sys.stdout.write(f"{message}\n")
+        sys.stdout.write("(gdb) ")
+        sys.stdout.flush()
+
+if __name__ == '__main__':
+    # Reading the bash arguments
+    xArgParser = argparse.ArgumentParser (description='A scripted GDB/MI stand-in for the fpga targets gdb.')
+    xArgParser.add_argument ('-l', '--latency', help='The seconds each command takes. Default: 0.01.', type=float, default=0.01)
+
+    xArgs = xArgParser.parse_args()
+    main(xArgs)
@@ -0,0 +1,48 @@
+#! /usr/bin/env python3
+
+"""
+--- fakeOpenocd.py is a stand-in for the openocd process of the fpga targets.
+--- usage: fakeOpenocd.py [-h] [-s STARTUP] --command COMMAND -f CFG
+
+It takes the arguments the tool gives to openocd, and listens on the gdb and telnet ports of
+<COMMAND>, so that the tool sees them taken. After STARTUP seconds (the JTAG scan of a real
+openocd), it prints the telnet <Listening on port> line that the tool waits for. Each gdb
+connection is announced as openocd does, and then closed. It runs until it is killed.
+
+This is used by testJtagScheduler.py, through the <openocdCmd> setting.
+"""
+
+import sys, re, time, socket, argparse
+
+def main(xArgs):
+    ports = dict()
+    for portUse in ['gdb', 'telnet']:
+        xMatch = re.search(rf'{portUse}_port\s+(\d+)', xArgs.command)
+        if (xMatch is None):
+            print(f"Error: no {portUse}_port in <{xArgs.command}>.", flush=True)
+            exit(1)
+        ports[portUse] = int(xMatch.group(1))
+
+    sockets = dict()
+    for portUse, port in ports.items():
+        sockets[portUse] = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sockets[portUse].bind(('', port))
+        sockets[portUse].listen()
+
+    time.sleep(xArgs.startup)
+    print(f"Info : Listening on port {ports['telnet']} for telnet connections", flush=True)
+    print(f"Info : Listening on port {ports['gdb']} for gdb connections", flush=True)
+    while True:
+        gdbConnection, _ = sockets['gdb'].accept()
+        print(f"Info : accepting 'gdb' connection on tcp/{ports['gdb']}", flush=True)
+        gdbConnection.close()
+
+if __name__ == '__main__':
+    # Reading the bash arguments
+    xArgParser = argparse.ArgumentParser (description='A stand-in for the openocd process of the fpga targets.')
+    xArgParser.add_argument ('-s', '--startup', help='The seconds before listening. Default: 0.3.', type=float, default=0.3)
+    xArgParser.add_argument ('--command', help='The openocd commands of the tool (gdb_port and telnet_port are used).', required=True)
+    xArgParser.add_argument ('-f', '--file', help='The openocd configuration file (ignored).')
+
+    xArgs = xArgParser.parse_args()
+    main(xArgs)
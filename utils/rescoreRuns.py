@@ -0,0 +1,198 @@
+#! /usr/bin/env python3
+
+"""
+--- rescoreRuns.py re-scores many archived <evaluateSecurityTests> runs without re-running them.
+--- usage: rescoreRuns.py [-h] -r RUNSDIRECTORY [-c CONFIGFILE] [-k BESSPINCOEFFS]
+                      [-o OUTPUTFILE] [-j JOBS] [-d]
+
+Every directory under RUNSDIRECTORY that contains a <cwesEvaluationLogs> directory is a run. Each run
+is scored in its own process, using the configuration archived with it (production.ini or config.ini)
+if any, else CONFIGFILE. The logs are scored through the scores cache of the tool, so after a change
+in the BESSPIN coefficients only the scale is recomputed. The scorers read the run's archived <build>
+directory (e.g. the generated bufferErrors tests), and nothing is written to the archived run: the
+CSV files of the scorers go to OUTPUTFILE_csvs/<run>.
+
+The results of all the runs are written to a single CSV file with one row per:
+    - run and CWE (level=cwe): the score, its value, the exact score, and the scorer notes (which
+      include the parts scores for the multi-part tests).
+    - run and vulnerability class (level=vulClass): the class BESSPIN scale and naive tally scores.
+    - run (level=run): the BESSPIN scale and the overall naive tally scores.
+"""
+
+import sys, os, csv, json, shutil, time
+import argparse, atexit, logging, multiprocessing
+
+CONFIG_FILES = ['production.ini', 'config.ini']
+CSV_COLUMNS = ['run', 'level', 'vulClass', 'cwe', 'score', 'scoreValue', 'exactScore', 'notes',
+               'besspinScale', 'tallyBinary', 'tallyExact']
+
+def findRuns(runsDir):
+    """ Returns the sorted list of the runs directories under <runsDir> """
+    runs = []
+    for root, dirs, files in os.walk(runsDir):
+        if ('cwesEvaluationLogs' in dirs):
+            runs.append(root)
+            dirs.clear() # A run does not contain other runs
+    return sorted(runs)
+
+def findRunConfig(runDir, defaultConfig):
+    for configFile in CONFIG_FILES:
+        if (os.path.isfile(os.path.join(runDir, configFile))):
+            return os.path.join(runDir, configFile)
+    return defaultConfig
+
+def rescoreRun(runDir, runId, repoDir, scratchDir, runCsvDir, xArgs):
+    """ Runs in its own process: scores <runDir> and dumps its records to <scratchDir>/<runId>.json """
+    from besspin.base.utils.misc import trashCanObj, exitPeacefully, setSetting, getSetting, isEnabled
+    from besspin.base.utils.misc import getSettingDict, atomicDumpJsonFile
+    from besspin.base.config import loadConfiguration
+    from besspin.cwesEvaluation.scoreTests import scoreLogs, SCORES
+    from besspin.cwesEvaluation.utils.computeBesspinScale import computeBesspinScale
+    from besspin.cwesEvaluation.utils.computeNaiveCWEsTally import computeNaiveCWEsTally
+
+    # A private work directory, so that nothing is written to the archived run
+    workDir = os.path.join(scratchDir, runId)
+    os.mkdir(workDir)
+    logFile = os.path.join(workDir, 'rescoreRun.log')
+    logLevel = logging.DEBUG if (xArgs.debug) else logging.INFO
+    logging.basicConfig(filename=logFile,filemode='w',format='%(asctime)s: (%(levelname)s)~  %(message)s',datefmt='%I:%M:%S %p',level=logLevel)
+
+    setSetting('repoDir',repoDir)
+    setSetting('workDir',workDir)
+    setSetting('logFile', logFile)
+    setSetting('trash',trashCanObj())
+    setSetting('debugMode', xArgs.debug)
+    atexit.register(exitPeacefully,getSetting('trash'))
+    # The scorers read the archived build tree, but write their CSV files to the output
+    setSetting('buildDir',os.path.join(runDir,'build'))
+    if (not os.path.isdir(getSetting('buildDir'))):
+        logging.warning(f"rescoreRun: <{runDir}> has no archived <build> directory.")
+    os.makedirs(runCsvDir, exist_ok=True)
+    setSetting('scoresCsvDir',runCsvDir)
+    setSetting('cwesEvaluationLogs',os.path.join(runDir,'cwesEvaluationLogs'))
+    setSetting('setupEnvFile', os.path.join(repoDir,'besspin','base','utils','setupEnv.json'))
+    configFile = findRunConfig(runDir, xArgs.configFile)
+    setSetting('configFile', configFile)
+
+    loadConfiguration(configFile)
+    if (getSetting('mode') != 'evaluateSecurityTests'):
+        logging.error(f"rescoreRun: <{configFile}> is not an <evaluateSecurityTests> configuration.")
+        return
+    setSetting("osDiv", "unix" if isEnabled("isUnix") else "FreeRTOS")
+    if (xArgs.besspinCoeffs):
+        setSetting('besspinCoeffs', os.path.abspath(xArgs.besspinCoeffs))
+
+    records = []
+    scoredVulClasses = []
+    for vulClass in getSetting("vulClasses"):
+        logsDir = os.path.join(getSetting('cwesEvaluationLogs'), vulClass)
+        if (not os.path.isdir(logsDir)):
+            logging.warning(f"rescoreRun: <{runDir}> has no logs for <{vulClass}>.")
+            continue
+        scoredVulClasses.append(vulClass)
+        scoresDict = getSettingDict("cweScores",vulClass)
+        for row in scoreLogs(vulClass, logsDir):
+            cweName = '-'.join(row[0].split('-')[1:])
+            percVal = SCORES.normalize(row[2])
+            scoresDict[cweName.replace('-','_')] = (row[1],percVal)
+            records.append({'level' : 'cwe', 'vulClass' : vulClass, 'cwe' : f"CWE-{cweName}",
+                            'score' : str(row[1]), 'scoreValue' : row[1].value,
+                            'exactScore' : (percVal if (percVal >= 0) else None), 'notes' : row[3]})
+    # The run totals are only meaningful if every configured class has logs
+    setSetting("vulClasses", scoredVulClasses)
+
+    vulClassesRecords = {vulClass : {'level' : 'vulClass', 'vulClass' : vulClass} for vulClass in scoredVulClasses}
+    runRecord = {'level' : 'run'}
+    scale = computeBesspinScale(doReport=False)
+    if (scale is not None):
+        _, vulClassesScores, B = scale
+        for vulClass in scoredVulClasses:
+            vulClassesRecords[vulClass]['besspinScale'] = vulClassesScores[vulClass].get("S(V)")
+        runRecord['besspinScale'] = B if (B != -1) else None
+    tally = computeNaiveCWEsTally(doReport=False)
+    if (tally is not None):
+        vulClassesScores, ovrDetails = tally
+        for tallyType, column in [("binary", 'tallyBinary'), ("exact", 'tallyExact')]:
+            for vulClass in scoredVulClasses:
+                vulClassesRecords[vulClass][column] = vulClassesScores[vulClass].get("score",{}).get(tallyType)
+            runRecord[column] = ovrDetails["score"].get(tallyType)
+    records += list(vulClassesRecords.values()) + [runRecord]
+
+    atomicDumpJsonFile(records, os.path.join(scratchDir, f"{runId}.json"))
+
+def main(xArgs):
+    utilsDir = os.path.abspath(os.path.dirname(__file__))
+    repoDir = os.path.abspath(os.path.join(utilsDir,os.pardir))
+    # Let's do this ugly workaround to have this utility use the tool, but not to be part of the tool
+    sys.path.insert(0, repoDir)
+
+    runsDir = os.path.abspath(xArgs.runsDirectory)
+    if (xArgs.configFile):
+        xArgs.configFile = os.path.abspath(xArgs.configFile)
+    else:
+        xArgs.configFile = os.path.join(repoDir,'config.ini')
+    outputFile = os.path.abspath(xArgs.outputFile)
+    runs = findRuns(runsDir)
+    if (len(runs) == 0):
+        print(f"(Error)~  No runs were found in <{runsDir}>.")
+        exit(1)
+    print(f"(Info)~  Re-scoring {len(runs)} run(s) from <{runsDir}>...")
+
+    scratchDir = f"{outputFile}.{int(time.time())}.runs"
+    csvsDir = f"{os.path.splitext(outputFile)[0]}_csvs"
+    os.mkdir(scratchDir)
+    runIds = [f"run{iRun:05d}" for iRun in range(len(runs))]
+
+    # Each run gets a fresh process, since the settings are global to the tool
+    ctx = multiprocessing.get_context('fork')
+    nJobs = xArgs.jobs or os.cpu_count() or 1
+    pending = list(zip(runs, runIds))
+    active = dict()
+    failedRuns = set()
+    while (pending or active):
+        while (pending and (len(active) < nJobs)):
+            runDir, runId = pending.pop(0)
+            runCsvDir = os.path.join(csvsDir, os.path.relpath(runDir, runsDir))
+            proc = ctx.Process(target=rescoreRun, args=(runDir, runId, repoDir, scratchDir, runCsvDir, xArgs))
+            proc.start()
+            active[runId] = (runDir, proc)
+        for runId, (runDir, proc) in list(active.items()):
+            if (not proc.is_alive()):
+                proc.join()
+                del active[runId]
+                if (not os.path.isfile(os.path.join(scratchDir, f"{runId}.json"))):
+                    failedRuns.add(runId)
+                    print(f"(Error)~  Failed to re-score <{runDir}>. "
+                          f"Check <{os.path.join(scratchDir, runId, 'rescoreRun.log')}>.")
+        time.sleep(0.1)
+
+    # Stream the records of all the runs into one file
+    with open(outputFile, 'w', newline='') as fOut:
+        writer = csv.DictWriter(fOut, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        for runDir, runId in zip(runs, runIds):
+            if (runId in failedRuns):
+                continue
+            with open(os.path.join(scratchDir, f"{runId}.json"), 'r') as fRecords:
+                for record in json.load(fRecords):
+                    writer.writerow(dict(record, run=os.path.relpath(runDir, runsDir)))
+
+    if (failedRuns):
+        print(f"(Warning)~  {len(failedRuns)} run(s) could not be re-scored. Keeping <{scratchDir}>.")
+    else:
+        shutil.rmtree(scratchDir, ignore_errors=True)
+    print(f"(Info)~  The scores of {len(runs)-len(failedRuns)} run(s) were written to <{outputFile}>, "
+          f"and the scorers CSV files to <{csvsDir}>.")
+
+if __name__ == '__main__':
+    # Reading the bash arguments
+    xArgParser = argparse.ArgumentParser (description='Re-scores archived evaluateSecurityTests runs into one CSV file.')
+    xArgParser.add_argument ('-r', '--runsDirectory', help='Directory containing the archived work directories.', required=True)
+    xArgParser.add_argument ('-c', '--configFile', help='Config file for the runs without an archived one. Default: ./config.ini')
+    xArgParser.add_argument ('-k', '--besspinCoeffs', help='Overwrites the BESSPIN coefficients JSON file.')
+    xArgParser.add_argument ('-o', '--outputFile', help='The output CSV file. Default: ./rescoredRuns.csv', default='rescoredRuns.csv')
+    xArgParser.add_argument ('-j', '--jobs', help='Number of runs to score in parallel. Default: one per CPU.', type=int, default=0)
+    xArgParser.add_argument ('-d', '--debug', help='Enable debugging mode.', action='store_true')
+
+    xArgs = xArgParser.parse_args()
+    main(xArgs)
@@ -0,0 +1,55 @@
+#! /usr/bin/env python3
+
+"""
+--- searchSyslogs.py searches the remote logs stored by the tool's syslog collector.
+--- usage: searchSyslogs.py [-h] -l LOGSDIRECTORY [-t TAGS] [-ts STARTTIME]
+                        [-tf ENDTIME] [-g PATTERN] [-s]
+
+LOGSDIRECTORY is a <rsyslogs_<ip>> directory of the extra artifacts. Its index is used to only
+decompress the segments of the requested tags and time range.
+"""
+
+import sys, os, argparse, datetime, time
+
+def parseTime(timeArg):
+    """ a timestamp or yyyy-mm-dd[Thh:mm:ss] """
+    try:
+        return float(timeArg)
+    except ValueError:
+        return datetime.datetime.fromisoformat(timeArg).timestamp()
+
+def main(xArgs):
+    utilsDir = os.path.abspath(os.path.dirname(__file__))
+    repoDir = os.path.abspath(os.path.join(utilsDir,os.pardir))
+    # Let's do this ugly workaround to have this utility use the tool, but not to be part of the tool
+    sys.path.insert(0, repoDir)
+    from besspin.target.syslogCollector import searchSyslogs
+
+    logsDir = os.path.abspath(xArgs.logsDirectory)
+    if (not os.path.isfile(os.path.join(logsDir, 'index.json'))):
+        print(f"(Error)~  <{logsDir}> has no syslog collector index.")
+        exit(1)
+    tags = xArgs.tags.split(',') if (xArgs.tags) else None
+    since = parseTime(xArgs.startTime) if (xArgs.startTime) else None
+    until = parseTime(xArgs.endTime) if (xArgs.endTime) else None
+
+    nRecords = 0
+    for recvTime, sourceIp, tag, message in searchSyslogs(logsDir, tags=tags, since=since, until=until, pattern=xArgs.pattern):
+        nRecords += 1
+        if (not xArgs.summary):
+            timeStr = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(recvTime))
+            print(f"{timeStr}.{int((recvTime % 1) * 1e6):06d} {sourceIp} [{tag}] {message}")
+    print(f"(Info)~  {nRecords} record(s) matched.", file=sys.stderr)
+
+if __name__ == '__main__':
+    # Reading the bash arguments
+    xArgParser = argparse.ArgumentParser (description='Searches the remote logs collected by the tool.')
+    xArgParser.add_argument ('-l', '--logsDirectory', help='The <rsyslogs_<ip>> directory of the extra artifacts.', required=True)
+    xArgParser.add_argument ('-t', '--tags', help='Comma-separated list of the tags to search. Default: all.')
+    xArgParser.add_argument ('-ts', '--startTime', help='Only the records received after start time (timestamp or yyyy-mm-dd[Thh:mm:ss]).')
+    xArgParser.add_argument ('-tf', '--endTime', help='Only the records received before end time (timestamp or yyyy-mm-dd[Thh:mm:ss]).')
+    xArgParser.add_argument ('-g', '--pattern', help='A regular expression the message has to match.')
+    xArgParser.add_argument ('-s', '--summary', help='Only print the number of matching records.', action='store_true')
+
+    xArgs = xArgParser.parse_args()
+    main(xArgs)
@@ -0,0 +1,321 @@
+#! /usr/bin/env python3
+
+"""
+--- testJtagScheduler.py exercises the scheduling of the JTAG operations of the vcu118 targets, without a board.
+--- usage: testJtagScheduler.py [-h] [-s STARTUP] [-g GDBTIME] [-u UARTTIME] [-p PROGTIME]
+
+The targets run the tool's fpgaStart against fakeOpenocd.py (through the <openocdCmd> setting). Only
+what needs a board is stood in: the USB location of the JTAG adapters (two hubs with two adapters
+each), the UART setup (UARTTIME seconds), and the gdb start (connecting, then GDBTIME seconds with
+the JTAG resource held). The programming goes through programVcu118 with a Vivado stand-in that
+takes PROGTIME seconds. One target runs the tool's UART search instead, with a gdb stand-in that
+fails its first smoke program.
+
+The scenarios check the JTAG resource of each <jtagSchedulingScope>, that no resource is ever held
+twice, that the targets on different resources start concurrently, that the exclusive programming
+does not wait for a target setting up its UART, that it holds back the requests that come after it,
+that the UART search holds the resource for its smoke program and ends its probe on a reload, and
+that a request by an owner that already holds is a bug rather than a deadlock.
+"""
+
+import sys, os, argparse, socket, time, tempfile, threading, multiprocessing
+
+def main(xArgs):
+    utilsDir = os.path.abspath(os.path.dirname(__file__))
+    repoDir = os.path.abspath(os.path.join(utilsDir,os.pardir))
+    # Let's do this ugly workaround to have this utility use the tool, but not to be part of the tool
+    sys.path.insert(0, repoDir)
+    from besspin.base.utils.misc import setSetting, getSetting, trashCanObj, EXIT
+    from besspin.base.threadControl import ResourceScheduler
+    from besspin.target import vcu118
+
+    workDir = tempfile.mkdtemp(prefix='testJtagScheduler_')
+    fakeVivado = os.path.join(workDir, 'fakeVivado.sh')
+    with open(fakeVivado, 'w') as fVivado:
+        fVivado.write(f"#! /bin/sh\nsleep {xArgs.progTime}\n")
+    os.chmod(fakeVivado, 0o755)
+    setSetting('trash',trashCanObj())
+    setSetting('debugMode',False)
+    setSetting('workDir',workDir)
+    setSetting('repoDir',repoDir)
+    setSetting('openocdCmd',f"{sys.executable} {os.path.join(utilsDir,'fakeOpenocd.py')} --startup {xArgs.startup}")
+    setSetting('vivadoCmd',fakeVivado)
+    setSetting('tclSourceDir',os.path.join(repoDir,'besspin','target','utils','tcl'))
+    setSetting('IsThereMoreThanOneVcu118Target',True)
+
+    class recordingScheduler(ResourceScheduler):
+        """ The jtagScheduler, recording when each resource was held """
+        def __init__(self, name):
+            super().__init__(name)
+            self.acquired = dict() # resource -> (owner, operation, tAcquired)
+            self.intervals = [] # (resource, owner, operation, tAcquired, tReleased)
+
+        def acquire(self, resource=None, owner=None, operation='unspecified'):
+            super().acquire(resource, owner=owner, operation=operation)
+            self.acquired[resource] = (owner, operation, time.time())
+
+        def release(self, resource=None):
+            owner, operation, tAcquired = self.acquired.pop(resource)
+            self.intervals.append((resource, owner, operation, tAcquired, time.time()))
+            super().release(resource)
+
+        def getInterval(self, owner, operation):
+            return next((interval for interval in self.intervals if (interval[1:3] == (owner, operation))), None)
+
+        def getOverlaps(self):
+            """ returns the pairs of intervals that held the same resource (or anything during an exclusive one) together """
+            return [(iA, iB) for iA in self.intervals for iB in self.intervals if ((iA is not iB)
+                        and ((iA[0] == iB[0]) or (iA[0] is None)) and (iA[3] < iB[4]) and (iB[3] < iA[4]))]
+
+        def getMaxConcurrency(self):
+            events = sorted([(interval[3], 1) for interval in self.intervals] + [(interval[4], -1) for interval in self.intervals])
+            nHeld, maxHeld = 0, 0
+            for _, delta in events:
+                nHeld += delta
+                maxHeld = max(maxHeld, nHeld)
+            return maxHeld
+
+    class usbLocation:
+        """ what findJtagUsbDevice returns: (bus, dev) with bus.location and dev.dev.port_numbers """
+        def __init__(self, **kwargs):
+            self.__dict__.update(kwargs)
+
+    def getFreePort():
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as xSock:
+            xSock.bind(('', 0))
+            return xSock.getsockname()[1]
+
+    class standInUartDevices:
+        """ The UART devices of the vcu118 targets: no saved association, and the probe finds the first device """
+        def __init__(self):
+            self.probes = set()
+            self.nProbes = 0
+
+        def getSavedUartSerialNumber(self, fpgaHwId, jtagLocation, checkTopology=True):
+            return None
+
+        def getAllUartSNs(self):
+            return ['standIn1', 'standIn2']
+
+        def getAllUartDevices(self):
+            return ['/dev/ttyStandIn1', '/dev/ttyStandIn2']
+
+        def getUartSerialNumber(self, uartDevice, key):
+            return 'standIn1'
+
+        def isProbing(self):
+            return (len(self.probes) > 0)
+
+        def startProbe(self, xTarget, fpgaHwId):
+            self.probes.add(fpgaHwId)
+            self.nProbes += 1
+
+        def endProbe(self, fpgaHwId, timeout=3):
+            self.probes.remove(fpgaHwId)
+            return '/dev/ttyStandIn1'
+
+    class standInTarget(vcu118.vcu118Target):
+        """ The JTAG and UART bring-up of a vcu118 target, on a stand-in adapter. With <isUartSearch>, the
+        UART setup is the tool's search (its smoke program failing to spawn gdb <nGdbFailures> times). """
+        def __init__(self, targetId, portNumbers, uartTime=0, gdbTime=0, isUartSearch=False, nGdbFailures=0):
+            self.__dict__.update(targetId=targetId, targetIdInfo=f"<target{targetId}>: ", targetSuffix=f"_{targetId}",
+                target='standIn', processor='standIn', elfLoader='JTAG', flashMode=False, fpgaStartRetriesIdx=0,
+                fpgaStartRetriesMax=3, openocdProcess=None, jtagResource=None, uartProbeHwId=None)
+            self.gdbPort, self.openocdPort = getFreePort(), getFreePort()
+            self.portNumbers, self.uartTime, self.gdbTime = portNumbers, uartTime, gdbTime
+            self.isUartSearch, self.nGdbFailures, self.uartSNs = isUartSearch, nGdbFailures, []
+            self.isInUartSetup = threading.Event()
+            if (isUartSearch): # The reload of gdbProgStart's retries is only for the vcu118
+                self.target = 'vcu118'
+                setSetting(targetId,dict())
+                setSetting('vcu118HwTarget',f"localhost:3121/xilinx_tcf/Digilent/standIn{targetId}",targetId=targetId)
+
+        def useOpenocd(self):
+            return True
+
+        def findJtagUsbDevice(self, exitIfNotFound=True):
+            return (usbLocation(location=1), usbLocation(dev=usbLocation(port_numbers=self.portNumbers)))
+
+        def getOpenocdCustomCfg(self, isReload=False):
+            return ''
+
+        def setupUart(self):
+            self.isInUartSetup.set()
+            if (self.isUartSearch):
+                uartSN = self.findTheRightUartDevice(getSetting('vcu118UartDevices'))
+                self.uartSNs.append(uartSN)
+                return (uartSN is None)
+            time.sleep(self.uartTime)
+            return False
+
+        def buildSmokeElfForUartSearch(self, hwId):
+            return 'stand-in-smoke.elf'
+
+        def gdbProgStart(self, elfPath, elfLoadTimeout, mainProg=True):
+            if (self.nGdbFailures > 0): # The tool's gdbProgStart, with a gdb that exits
+                self.nGdbFailures -= 1
+                return vcu118.fpgaTarget.gdbProgStart(self, elfPath, elfLoadTimeout, mainProg=mainProg)
+            socket.create_connection(('127.0.0.1', self.gdbPort)).close()
+            self.openocdProcess.expect(f"accepting 'gdb' connection on tcp/{self.gdbPort}", timeout=5)
+            time.sleep(self.gdbTime)
+            if (mainProg):
+                self.releaseJtag()
+
+        def interruptGdb(self):
+            return
+
+        def gdbDetach(self):
+            return
+
+        def runCommandGdb(self, command, **kwargs):
+            return [True, '', False, 0]
+
+        def fpgaTearDown(self, isReload=False, stage=None):
+            self.openocdProcess.terminate(force=True)
+
+        def terminateAndExit(self, message, **kwargs):
+            raise RuntimeError(message)
+
+        def stop(self):
+            if (self.openocdProcess is not None):
+                self.openocdProcess.terminate(force=True)
+            self.fOpenocdOut.close()
+
+    # Two hubs (2 and 3) with two adapters each
+    portNumbers = {1 : [2, 1], 2 : [2, 2], 3 : [3, 1], 4 : [3, 2]}
+    expectedResources = {'global' : ['jtag']*4, 'hub' : ['usb:1-2']*2 + ['usb:1-3']*2,
+                            'adapter' : ['usb:1-2.1', 'usb:1-2.2', 'usb:1-3.1', 'usb:1-3.2']}
+
+    def startScheduler(scope):
+        setSetting('jtagSchedulingScope',scope)
+        setSetting('jtagScheduler',recordingScheduler('jtag'))
+        return getSetting('jtagScheduler')
+
+    def startTargets(targets):
+        threads = [threading.Thread(target=target.fpgaStart, args=('stand-in.elf',), daemon=True) for target in targets]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def waitFor(condition, timeout=30):
+        deadline = time.time() + timeout
+        while ((not condition()) and (time.time() < deadline)):
+            time.sleep(0.01)
+
+    def programBoard(targetId):
+        setSetting(targetId,dict())
+        setSetting('gfeWorkDir',workDir,targetId=targetId)
+        setSetting('bitAndProbefiles',['stand-in.bit', 'stand-in.ltx'],targetId=targetId)
+        setSetting('vcu118HwTarget',f"localhost:3121/xilinx_tcf/Digilent/standIn{targetId}",targetId=targetId)
+        vcu118.programVcu118('bitstream', targetId=targetId, doPrint=False)
+
+    nFailures = 0
+    def check(scenario, isSuccess, details=''):
+        nonlocal nFailures
+        nFailures += 0 if isSuccess else 1
+        print(f"{'PASS' if isSuccess else 'FAIL'} {scenario}{f' ({details})' if details else ''}")
+
+    # The resources of each scope, and the concurrent starts
+    for scope in ['global', 'hub', 'adapter']:
+        scheduler = startScheduler(scope)
+        targets = [standInTarget(targetId, portNumbers[targetId], gdbTime=xArgs.gdbTime) for targetId in portNumbers]
+        startTime = time.time()
+        for thread in startTargets(targets):
+            thread.join()
+        startsTime = time.time() - startTime
+        for target in targets:
+            target.stop()
+        isStarted = all(scheduler.getInterval(target.targetId, 'gdbStart') is not None for target in targets)
+        check(f"{scope}: the JTAG resources", [target.jtagResource for target in targets] == expectedResources[scope],
+                ', '.join(target.jtagResource for target in targets))
+        nResources = len(set(expectedResources[scope]))
+        check(f"{scope}: {nResources} resource(s) held concurrently, never twice",
+                isStarted and (not scheduler.getOverlaps()) and (scheduler.getMaxConcurrency() == nResources),
+                f"4 targets started in {startsTime:.2f}s")
+
+    # A target setting up its UART does not hold back the programming
+    scheduler = startScheduler('hub')
+    target = standInTarget(1, portNumbers[1], uartTime=xArgs.uartTime)
+    thread = startTargets([target])[0]
+    target.isInUartSetup.wait(timeout=30)
+    startTime = time.time()
+    programBoard(9)
+    progWaitTime = scheduler.getInterval(9, 'programVcu118:bitstream')[3] - startTime
+    thread.join()
+    target.stop()
+    check("programming: not held back by a UART setup", (not scheduler.getOverlaps()) and (progWaitTime < xArgs.uartTime/2),
+            f"waited {progWaitTime:.2f}s, the UART setup takes {xArgs.uartTime:.2f}s")
+
+    # The programming waits for the held resources, and holds back the requests that come after it
+    scheduler = startScheduler('adapter')
+    targetA, targetB = standInTarget(1, portNumbers[1], gdbTime=xArgs.progTime), standInTarget(3, portNumbers[3])
+    threads = startTargets([targetA])
+    waitFor(lambda: scheduler.isHeld('usb:1-2.1') and (scheduler.getInterval(1, 'openocdStart') is not None))
+    programThread = threading.Thread(target=programBoard, args=(9,), daemon=True)
+    programThread.start()
+    time.sleep(0.1) # The programming is waiting
+    threads += startTargets([targetB])
+    for thread in threads + [programThread]:
+        thread.join()
+    targetA.stop()
+    targetB.stop()
+    programInterval = scheduler.getInterval(9, 'programVcu118:bitstream')
+    isInOrder = (scheduler.getInterval(1, 'gdbStart')[4] <= programInterval[3] <= programInterval[4]
+                    <= scheduler.getInterval(3, 'openocdStart')[3])
+    check("programming: exclusive, and preferred to the requests after it", (not scheduler.getOverlaps()) and isInOrder)
+
+    # The UART search holds the JTAG resource for its smoke program, and a reload from it ends the probe first
+    scheduler = startScheduler('hub')
+    setSetting('vcu118UartDevices',standInUartDevices())
+    gdbBinDir = os.path.join(workDir, 'bin')
+    os.makedirs(gdbBinDir)
+    with open(os.path.join(gdbBinDir, 'riscv64-unknown-elf-gdb'), 'w') as fGdb:
+        fGdb.write("#! /bin/sh\nexit 1\n")
+    os.chmod(os.path.join(gdbBinDir, 'riscv64-unknown-elf-gdb'), 0o755)
+    os.environ['PATH'] = gdbBinDir + os.pathsep + os.environ['PATH']
+    vcu118.programBitfile = lambda doPrint=True, targetId=None, forceProgramming=False: programBoard(targetId)
+    targetA = standInTarget(1, portNumbers[1], gdbTime=xArgs.gdbTime, isUartSearch=True, nGdbFailures=1)
+    targetB = standInTarget(2, portNumbers[2], gdbTime=xArgs.gdbTime)
+    threads = startTargets([targetA])
+    waitFor(lambda: scheduler.getInterval(1, 'uartSearch') is not None)
+    threads += startTargets([targetB])
+    for thread in threads:
+        thread.join()
+    targetA.stop()
+    targetB.stop()
+    searches = [interval for interval in scheduler.intervals if (interval[1:3] == (1, 'uartSearch'))]
+    mainStarts = [interval for interval in scheduler.intervals if (interval[1:3] == (1, 'gdbStart'))]
+    check("UART search: holds the JTAG resource for its smoke program",
+            (len(searches) == 2) and (not scheduler.getOverlaps()) and (searches[-1][0] == 'usb:1-2'))
+    check("UART search: a reload from it ends the probe, and starts the target once",
+            (not getSetting('vcu118UartDevices').isProbing()) and (getSetting('vcu118UartDevices').nProbes == 2)
+                and (targetA.uartSNs == ['standIn1', None]) and (len(mainStarts) == 1)
+                and (scheduler.getInterval(1, 'programVcu118:bitstream') is not None),
+            f"searches: {targetA.uartSNs}")
+
+    # An owner requesting while it holds would wait for itself
+    scheduler = startScheduler('hub')
+    def requestWhileHolding():
+        scheduler.acquire('usb:1-2', owner=1, operation='openocdStart')
+        scheduler.acquire(owner=1, operation='programVcu118:bitstream')
+    childProcess = multiprocessing.get_context('fork').Process(target=requestWhileHolding)
+    childProcess.start()
+    childProcess.join(timeout=10)
+    if (childProcess.is_alive()):
+        childProcess.kill()
+    check("request while holding: exits instead of deadlocking", childProcess.exitcode == EXIT.Dev_Bug.value,
+            f"exit code {childProcess.exitcode}")
+
+    print(f"{nFailures} scenario(s) failed. The openocd logs are in <{workDir}>.")
+    exit(1 if (nFailures > 0) else 0)
+
+if __name__ == '__main__':
+    # Reading the bash arguments
+    xArgParser = argparse.ArgumentParser (description='Exercises the scheduling of the vcu118 JTAG operations against stand-ins.')
+    xArgParser.add_argument ('-s', '--startup', help='The seconds openocd takes to start. Default: 0.3.', type=float, default=0.3)
+    xArgParser.add_argument ('-g', '--gdbTime', help='The seconds the gdb start holds the JTAG resource. Default: 0.3.', type=float, default=0.3)
+    xArgParser.add_argument ('-u', '--uartTime', help='The seconds the UART setup takes. Default: 2.', type=float, default=2)
+    xArgParser.add_argument ('-p', '--progTime', help='The seconds the programming takes. Default: 1.', type=float, default=1)
+
+    xArgs = xArgParser.parse_args()
+    main(xArgs)
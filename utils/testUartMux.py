@@ -0,0 +1,163 @@
+#! /usr/bin/env python3
+
+"""
+--- testUartMux.py exercises the UART multiplexer of the tool on a pexpect pty, without a target.
+--- usage: testUartMux.py [-h] [-l LEASETIMEOUT] [-f FLOODKBYTES]
+
+The console is a small echo program spawned with pexpect, as the targets' consoles are. The
+scenarios check the fan-out of the console output to all the clients, the hand-over of the input
+lease, the policies for a client that does not read (drop its oldest output, or disconnect it),
+and that the console fd goes back to pexpect in its original mode after the multiplexer stops.
+"""
+
+import sys, os, argparse, socket, time, tempfile
+
+# The console: echoes each line, and <flood N> prints N lines of 1000 bytes then <FLOOD-END>.
+# The flood is paced at about 1 MB/s: way faster than a UART, but a client that reads keeps up.
+CONSOLE_PROGRAM = """
+import sys, time
+for line in sys.stdin:
+    words = line.split()
+    if (words[:1] == ['flood']):
+        for _ in range(int(words[1])):
+            sys.stdout.write('x'*999 + '\\n')
+            sys.stdout.flush()
+            time.sleep(0.001)
+        print('FLOOD-END', flush=True)
+    else:
+        print('ECHO', line.strip(), flush=True)
+"""
+
+def main(xArgs):
+    utilsDir = os.path.abspath(os.path.dirname(__file__))
+    repoDir = os.path.abspath(os.path.join(utilsDir,os.pardir))
+    # Let's do this ugly workaround to have this utility use the tool, but not to be part of the tool
+    sys.path.insert(0, repoDir)
+    import pexpect
+    from besspin.base.utils.misc import setSetting, trashCanObj
+    from besspin.target.uartMux import UartMultiplexer
+
+    workDir = tempfile.mkdtemp(prefix='testUartMux_')
+    setSetting('trash',trashCanObj())
+    setSetting('debugMode',False)
+    setSetting('workDir',workDir)
+
+    nFailures = 0
+    def check(scenario, isSuccess, details=''):
+        nonlocal nFailures
+        nFailures += 0 if isSuccess else 1
+        print(f"{'PASS' if isSuccess else 'FAIL'} {scenario}{f' ({details})' if details else ''}")
+
+    def connect(port):
+        xSock = socket.create_connection(('127.0.0.1', port))
+        xSock.settimeout(2)
+        return xSock
+
+    def readUntil(xSock, marker, timeout=5):
+        """ returns what <xSock> received until <marker> (or the timeout) """
+        data = b''
+        deadline = time.time() + timeout
+        while ((marker not in data) and (time.time() < deadline)):
+            try:
+                chunk = xSock.recv(65536)
+            except socket.timeout:
+                continue
+            if (not chunk):
+                break
+            data += chunk
+        return data
+
+    def startConsoleAndMux(**muxKwargs):
+        console = pexpect.spawn(sys.executable, ['-u', '-c', CONSOLE_PROGRAM], timeout=10)
+        console.setecho(False)
+        fTtyOut = open(os.path.join(workDir, 'tty.out'), 'ab')
+        uartMux = UartMultiplexer(console.child_fd, 0, nameInfo='<testUartMux> ', logFile=fTtyOut, **muxKwargs)
+        uartMux.start()
+        return (console, uartMux, fTtyOut)
+
+    def waitForClients(uartMux, nClients, timeout=2):
+        deadline = time.time() + timeout
+        while ((len(uartMux.getClientsAddresses()) < nClients) and (time.time() < deadline)):
+            time.sleep(0.05)
+
+    # Fan-out and the input lease
+    console, uartMux, fTtyOut = startConsoleAndMux(inputLeaseTimeout=xArgs.leaseTimeout)
+    clientA, clientB = connect(uartMux.port), connect(uartMux.port)
+    waitForClients(uartMux, 2)
+    clientA.sendall(b'from A\n')
+    check("fan-out", all(b'ECHO from A' in readUntil(xSock, b'ECHO from A') for xSock in [clientA, clientB]))
+
+    clientB.sendall(b'from B while A holds the lease\n')
+    clientA.sendall(b'A again\n')
+    outA = readUntil(clientA, b'ECHO A again')
+    check("lease: the input of the other clients is discarded",
+            (b'ECHO A again' in outA) and (b'from B' not in outA) and (uartMux.nInputDiscarded > 0))
+
+    time.sleep(xArgs.leaseTimeout + 0.2)
+    clientB.sendall(b'from B after the lease\n')
+    check("lease: handed over once the holder is quiet",
+            b'ECHO from B after the lease' in readUntil(clientA, b'ECHO from B after the lease'))
+
+    clientA.close()
+    clientB.sendall(b'B holds it\n')
+    clientC = connect(uartMux.port)
+    waitForClients(uartMux, 2)
+    clientB.close()
+    time.sleep(0.2)
+    clientC.sendall(b'from C\n')
+    check("lease: released when the holder disconnects", b'ECHO from C' in readUntil(clientC, b'ECHO from C'))
+    clientC.close()
+
+    # The console fd goes back to pexpect
+    wasBlocking = uartMux.wasConsoleBlocking
+    uartMux.stop()
+    check("fd restore: original blocking mode", os.get_blocking(console.child_fd) == wasBlocking)
+    console.sendline('back to pexpect')
+    try:
+        console.expect('ECHO back to pexpect')
+        isPexpectOk = True
+    except pexpect.ExceptionPexpect:
+        isPexpectOk = False
+    check("fd restore: pexpect reads the console again", isPexpectOk)
+    console.close(force=True)
+    fTtyOut.close()
+
+    # A client that does not read: its oldest output is dropped, or it is disconnected
+    for policy in ['drop', 'disconnect']:
+        console, uartMux, fTtyOut = startConsoleAndMux(slowClientPolicy=policy, clientBufferBytes=64*1024)
+        fastClient, slowClient = connect(uartMux.port), connect(uartMux.port)
+        waitForClients(uartMux, 2)
+        slowAddress = f"127.0.0.1:{slowClient.getsockname()[1]}"
+        for xSock, client in list(uartMux.clients.items()): # The kernel buffers would absorb a small flood
+            if (client.address == slowAddress):
+                xSock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        startTime = time.time()
+        fastClient.sendall(f'flood {xArgs.floodKBytes}\n'.encode('utf-8'))
+        outFast = readUntil(fastClient, b'FLOOD-END', timeout=30)
+        floodTime = time.time() - startTime
+        isFastComplete = (b'FLOOD-END' in outFast) and (outFast.count(b'x'*999) == xArgs.floodKBytes)
+        slowClients = [client for client in uartMux.clients.values() if (client.address == slowAddress)]
+        if (policy == 'drop'):
+            isSuccess = isFastComplete and (len(slowClients) == 1) and (slowClients[0].nDropped > 0)
+            details = f"{slowClients[0].nDropped if slowClients else '-'} byte(s) dropped"
+        else:
+            isSuccess = isFastComplete and (len(slowClients) == 0)
+        check(f"slow client ({policy}): the other client is not stalled", isSuccess,
+                f"{xArgs.floodKBytes} KB in {floodTime:.2f}s" + (f", {details}" if (policy == 'drop') else ''))
+        fastClient.close()
+        slowClient.close()
+        uartMux.stop()
+        console.close(force=True)
+        fTtyOut.close()
+
+    print(f"{nFailures} scenario(s) failed. The tty log is in <{workDir}>.")
+    exit(1 if (nFailures > 0) else 0)
+
+if __name__ == '__main__':
+    # Reading the bash arguments
+    xArgParser = argparse.ArgumentParser (description='Exercises the UART multiplexer on a pexpect pty.')
+    xArgParser.add_argument ('-l', '--leaseTimeout', help='The input lease timeout in seconds. Default: 0.5.', type=float, default=0.5)
+    xArgParser.add_argument ('-f', '--floodKBytes', help='The output of the slow client scenarios, in KB. Default: 1024.', type=int, default=1024)
+
+    xArgs = xArgParser.parse_args()
+    main(xArgs)